@@ -5,9 +5,38 @@ backend/
     routes_chat.py
     schemas.py
     storage_json.py
+    storage_journal.py
+    storage_sqlite.py
+    migrate_sqlite.py
+    search_index.py
+    streams.py
     llm_client.py
+    llm_cache.py
+    context.py
+    scheduler.py
+    metrics.py
+  bench/
+    stub_llm.py          (fake LLM: /chat line stream + VOX SSE)
+    loadtest.py          (python -m bench.loadtest; JSON results)
+  tests/                 (python -m pytest tests, run from backend/)
+    conftest.py          (per-backend store + app fixtures)
+    test_paging.py
+    test_stream_resume.py
+    test_store_parity.py
+    test_multiprocess.py
+    test_deltas.py
+    test_group_commit.py
+    test_journal_compaction.py
+    test_llm_cache.py
+    test_scheduler.py
+    test_coalescer.py
   data/
     chats.json
+    chats.json.journal   (only in journal mode)
+    chats.db             (only in SQLite mode, plus chats.db-wal / chats.db-shm)
+    chats.json.search    (full-text index checkpoint, caught up at startup)
+    chats.json.llmcache/ (cached LLM replies, only with LLM_CACHE_DISK=1)
+    chats.json.lock      (cross-process write lock, only with STORE_MULTIPROCESS=1)
   requirements.txt
   .env
 
@@ -22,16 +51,66 @@ uvicorn
 pydantic
 python-dotenv
 httpx
+# tiktoken  (optional: exact token counts in context.py; otherwise ~4 characters per token)
+# pytest    (tests only: python -m pytest tests)
 
 3) backend/.env (placeholders; DO NOT hardcode secrets in code)
 DATA_FILE=./data/chats.json
+# DATA_FILE=journal://./data/chats.json  (append-only journal mode; snapshot + chats.json.journal)
+# DATA_FILE=sqlite://./data/chats.db     (SQLite WAL mode; import old data: python -m app.migrate_sqlite data/chats.json data/chats.db)
+SQLITE_READERS=4               (reader threads in SQLite mode; writes use one writer thread)
+JOURNAL_COMPACT_BYTES=4194304
+SEARCH_CHECKPOINT_EVERY=1000   (plain JSON: save chats.json.search every N changes so a crash only re-indexes the chats changed since; journal mode saves it on compaction)
+STORE_DURABILITY=commit        (commit = wait for fsync, memory = return once applied in memory)
+STORE_COMMIT_WINDOW_MS=5       (writes arriving within this window share one atomic write)
+STORE_MULTIPROCESS=0           (set to 1 with uvicorn --workers N on plain JSON; sqlite:// is already safe, journal:// is single-process)
 CORS_ORIGINS=http://localhost:5173
+SSE_COALESCE_MS=30             (deltas are merged into one SSE frame for up to this long)
+SSE_COALESCE_BYTES=512         (...or until this many characters are buffered)
+STREAM_CHECKPOINT_MS=1000      (partial assistant text is saved to the store this often while streaming)
+STREAM_BUFFER_EVENTS=2048      (events kept per stream for Last-Event-ID replay)
+STREAM_RETAIN_S=60             (a finished stream stays resumable this long)
+STREAM_DISCONNECT_GRACE_S=20   (cancel the LLM call this long after the last client disconnects; covers the frontend's ~15s of retries; 0 = at once, no resume)
+STREAM_MAX_ACTIVE=32           (upstream LLM streams running at once)
+STREAM_MAX_PER_USER=4          (per X-User-Id header, else per client IP)
+STREAM_MAX_QUEUE=64            (waiting streams; beyond this POST /stream returns 429 + Retry-After)
+STREAM_MAX_QUEUE_PER_USER=8
+METRICS=1                      (GET /metrics in Prometheus text format; per-route latency, store and LLM timings)
+PROFILE_DIR=                   (set to a directory to allow per-request profiles via the X-Profile header)
+PROFILE_TOKEN=                 (required X-Profile value; profiling stays off until this is set too)
+PROFILE_INTERVAL_MS=5          (stack sampling period while a profiled request runs)
 
 # Later (optional): LLM provider endpoint + token settings (placeholders)
 LLM_BASE_URL=https://YOUR_LLM_HOST
 LLM_MODEL=gpt-4o-mini
 LLM_API_KEY=YOUR_KEY_HERE
 
+# LLM response cache (llm_cache.py; off by default)
+LLM_CACHE=0                    (1 = replay identical prompts from cache, share concurrent identical calls)
+LLM_CACHE_MAX_ENTRIES=1000
+LLM_CACHE_MAX_BYTES=33554432   (characters of cached replies kept in memory)
+LLM_CACHE_TTL_S=86400
+LLM_CACHE_DISK=0               (1 = also keep replies in chats.json.llmcache/ across restarts)
+LLM_CACHE_MAX_DISK_ENTRIES=10000
+
+# Prompt context (context.py): newest turns within a token budget + rolling summary of older turns
+CONTEXT_BUDGET_TOKENS=3000
+CONTEXT_SUMMARY_TOKENS=400
+CONTEXT_SUMMARIZE_AFTER_TOKENS=1000 (older turns are folded into the summary in batches this large)
+CONTEXT_SUMMARY=llm            (llm = model-written summary, extract = first line of each turn, no LLM call)
+
+# LLM connection pool (shared by llm_client.py and the VOX client in mcall.py)
+LLM_MAX_CONNECTIONS=100
+LLM_MAX_KEEPALIVE=20
+LLM_KEEPALIVE_EXPIRY_S=30
+LLM_CONNECT_TIMEOUT_S=5
+LLM_READ_TIMEOUT_S=120
+LLM_HTTP2=0                    (1 needs: pip install "httpx[http2]")
+
+# VOX OAuth token cache (mcall.py)
+VOX_TOKEN_TTL_S=3300           (used when the token response has no expires_in)
+VOX_TOKEN_REFRESH_MARGIN_S=120 (refresh in the background this long before expiry)
+
 4) backend/app/schemas.py
 from pydantic import BaseModel  # Import BaseModel to define request/response schemas.
 from typing import List, Literal, Optional  # Import typing helpers for strong type hints.
@@ -48,6 +127,9 @@ class ChatMessage(BaseModel):  # Define a single message shape stored in JSON an
     role: Literal["user", "assistant"]  # Restrict role values to user/assistant.
     content: str  # Message text.
     createdAt: str  # ISO timestamp string for ordering.
+    status: Optional[Literal["streaming", "error"]] = None  # Set while an assistant reply is being generated (or if it failed).
+    tokens: Optional[int] = None  # Cached token count of content (used to fit the prompt budget).
+    version: Optional[int] = None  # Store version of the last write to this message (delta sync).
 
 
 class ListChatsResponse(BaseModel):  # Define response wrapper for listing chats.
@@ -69,127 +151,748 @@ class SendMessageRequest(BaseModel):  # Define request schema for streaming endp
 import json  # Import json to read and write JSON files.
 import os  # Import os for file path operations.
 import uuid  # Import uuid to generate unique IDs.
+import bisect  # Import bisect to keep the updatedAt order sorted incrementally.
+import base64  # Import base64 to build opaque pagination cursors.
+import logging  # Import logging to report failed background writes.
+import time  # Import time to measure lock and commit waits.
 from datetime import datetime, timezone  # Import datetime utilities for timestamps.
-from typing import Any, Dict, List, Optional  # Import types for clarity.
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple  # Import types for clarity.
 import asyncio  # Import asyncio for async file lock coordination.
+from contextlib import asynccontextmanager  # Import asynccontextmanager for the read-modify-write helper.
+from .search_index import SearchIndex, make_snippet, tokenize  # Import the full-text index over titles + messages.
+from .context import count_tokens  # Import token counter (counts are cached with each message).
+from .metrics import STORE_BYTES, STORE_COMMIT_WAIT, STORE_IO, STORE_LOCK_WAIT  # Import store metrics (/metrics).
+
+try:  # POSIX advisory file locks.
+    import fcntl  # flock() on Linux/macOS.
+except ImportError:  # Windows.
+    fcntl = None  # Fall back to msvcrt below.
+    import msvcrt  # Byte-range locks on Windows.
+
+log = logging.getLogger(__name__)  # Module logger.
 
 
 def now_iso() -> str:  # Create helper to generate consistent ISO timestamps.
     return datetime.now(timezone.utc).isoformat()  # Return UTC ISO formatted timestamp.
 
 
+class GroupCommitWriter:  # Background writer: runs file I/O in a worker thread and merges bursts into one write.
+    def __init__(self, prepare: Callable[[], Any], write: Callable[[Any], None], window_ms: float = 5.0) -> None:  # Configure writer.
+        self._prepare = prepare  # Runs on the event loop: takes a cheap, consistent copy of what must be written.
+        self._write = write  # Runs in a worker thread: does the blocking open/dump/fsync/rename.
+        self._window = window_ms / 1000.0  # How long to wait for more changes before writing.
+        self._dirty = False  # Whether there are changes not yet handed to a write.
+        self._waiters: List[asyncio.Future] = []  # Callers waiting for the next commit.
+        self._wakeup: Optional[asyncio.Event] = None  # Signals the writer task that there is work.
+        self._task: Optional[asyncio.Task] = None  # The writer task (started on first use).
+        self._closing = False  # Set by close() so the task exits after a final flush.
+
+    def request(self, wait: bool = True) -> Optional[asyncio.Future]:  # Mark state dirty; return a commit future if wait.
+        if self._task is None or self._task.done():  # Start writer lazily inside the running loop.
+            self._wakeup = asyncio.Event()  # Fresh event bound to this loop.
+            self._closing = False  # Reset close flag.
+            self._task = asyncio.create_task(self._run())  # Start writer task.
+        self._dirty = True  # Something changed in memory.
+        fut = asyncio.get_running_loop().create_future() if wait else None  # Future resolved after fsync.
+        if fut is not None:  # Caller wants to wait.
+            self._waiters.append(fut)  # Register waiter.
+        self._wakeup.set()  # Wake the writer.
+        return fut  # Return future (or None).
+
+    async def _run(self) -> None:  # Writer loop.
+        while True:  # Run until closed.
+            await self._wakeup.wait()  # Sleep until there is work.
+            if not self._closing:  # Normal operation.
+                await asyncio.sleep(self._window)  # Let more changes join this batch.
+            self._wakeup.clear()  # Consume the signal.
+            error = await self._flush_once() if self._dirty else None  # One write for the whole batch.
+            if self._closing and error is not None:  # Final flush failed: nothing will retry it.
+                self._fail(self._waiters, error)  # Callers that joined during the flush must not hang.
+                self._waiters = []  # Settled.
+                return  # Exit task (state is still in memory; the next request restarts the writer).
+            if self._closing and not self._dirty:  # Close requested and nothing left (a request during the flush loops again).
+                return  # Exit task.
+
+    @staticmethod  # No instance state.
+    def _fail(waiters: List[asyncio.Future], error: BaseException) -> None:  # Fail waiting callers.
+        for w in waiters:  # Each caller.
+            if not w.done():  # Skip cancelled waiters.
+                w.set_exception(error)  # Propagate error.
+
+    async def _flush_once(self) -> Optional[BaseException]:  # Write one batch and resolve its waiters; return the error, if any.
+        waiters, self._waiters = self._waiters, []  # Take current waiters.
+        self._dirty = False  # Changes after this point go to the next batch.
+        payload = self._prepare()  # Copy state on the loop (no concurrent mutation).
+        try:  # Do the blocking part off the loop.
+            await asyncio.to_thread(self._write, payload)  # Write + fsync + rename in a worker thread.
+        except Exception as e:  # Disk error.
+            log.exception("Chat store commit failed")  # Log for operators.
+            self._dirty = True  # Retry on the next commit (state is still in memory).
+            self._fail(waiters, e)  # Fail waiting callers.
+            return e  # Close gives up instead of retrying forever.
+        for w in waiters:  # Wake waiting callers.
+            if not w.done():  # Skip cancelled waiters.
+                w.set_result(None)  # Commit done.
+        return None  # Written.
+
+    async def drain(self) -> None:  # Wait until everything changed so far is on disk.
+        fut = self.request(wait=True)  # Ask for a commit.
+        await fut  # Wait for it.
+
+    async def close(self) -> None:  # Flush pending changes and stop the writer task.
+        if self._task is not None and not self._task.done():  # Writer running.
+            self._closing = True  # Ask it to exit.
+            self._wakeup.set()  # Wake it immediately (no batching window).
+            await self._task  # Wait for final flush.
+
+
+class FileLock:  # Exclusive lock shared by every process that opens the same lock file (blocking; use from a worker thread).
+    def __init__(self, path: str) -> None:  # Lock file path (created on first use, never deleted).
+        self.path = path  # Lock file.
+        self._fd: Optional[int] = None  # Open descriptor while held.
+
+    def acquire(self) -> None:  # Block until this process holds the lock.
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)  # Every holder locks the same file.
+        try:  # Close the descriptor if locking fails.
+            if fcntl is not None:  # POSIX.
+                fcntl.flock(fd, fcntl.LOCK_EX)  # Released by the OS if the process dies.
+            else:  # Windows.
+                while True:  # LK_LOCK only retries for ~10 s.
+                    try:  # Lock the first byte.
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)  # Blocking byte-range lock.
+                        break  # Acquired.
+                    except OSError:  # Still held elsewhere.
+                        continue  # Keep waiting.
+        except BaseException:  # Not acquired.
+            os.close(fd)  # Do not leak the descriptor.
+            raise  # Propagate.
+        self._fd = fd  # Held.
+
+    def release(self) -> None:  # Release the lock (no-op if not held).
+        fd, self._fd = self._fd, None  # Take descriptor.
+        if fd is None:  # Not held.
+            return  # Nothing to do.
+        try:  # Unlock explicitly, then close.
+            if fcntl is not None:  # POSIX.
+                fcntl.flock(fd, fcntl.LOCK_UN)  # Unlock.
+            else:  # Windows.
+                os.lseek(fd, 0, os.SEEK_SET)  # msvcrt locks at the current position.
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)  # Unlock.
+        finally:  # Always close.
+            os.close(fd)  # Close descriptor.
+
+
+def file_stamp(st: os.stat_result) -> Tuple[int, int, int]:  # Identity of one version of a file (atomic rename = new inode).
+    return (st.st_ino, st.st_mtime_ns, st.st_size)  # Cheap to compare; changes on every replace.
+
+
+def encode_cursor(key: Tuple[str, str]) -> str:  # Turn an (updatedAt, id) sort key into an opaque URL-safe cursor.
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii")  # Base64 of JSON pair.
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:  # Reverse of encode_cursor; ValueError on garbage.
+    try:  # Decode defensively (cursor comes from the client).
+        updated_at, chat_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))  # Unpack pair.
+    except Exception:  # Any decode/shape error.
+        raise ValueError("Invalid cursor")  # Let the route turn it into a 400.
+    return str(updated_at), str(chat_id)  # Return sort key.
+
+
+def version_tag(epoch: str, version: int) -> str:  # Opaque version token (ETag value and `since` parameter).
+    return f"{epoch}.{version}"  # Epoch keeps versions from before a restart/crash from matching new data.
+
+
+def parse_version(token: str, epoch: str) -> Optional[int]:  # Version number of a token from this epoch (None = foreign/garbage).
+    prefix, _, number = token.strip().strip('"').rpartition(".")  # Accept a raw ETag value too.
+    return int(number) if prefix == epoch and number.isdigit() else None  # Other epochs cannot be compared.
+
+
+class ChatIndex:  # In-memory indexes: id -> chat hash map + chats ordered by updatedAt, updated incrementally.
+    def __init__(self, chats: List[Dict[str, Any]]) -> None:  # Build indexes once from loaded chats.
+        self.by_id: Dict[str, Dict[str, Any]] = {c["id"]: c for c in chats}  # Chat id -> chat dict (insertion ordered).
+        self._order: List[Tuple[str, str]] = sorted((c.get("updatedAt", ""), c["id"]) for c in chats)  # Ascending (updatedAt, id).
+        self._msg_pos: Dict[str, Dict[str, int]] = {}  # Chat id -> {message id -> position}, built on first use.
+
+    def get(self, chat_id: str) -> Optional[Dict[str, Any]]:  # O(1) chat lookup.
+        return self.by_id.get(chat_id)  # Return chat or None.
+
+    def chats(self) -> List[Dict[str, Any]]:  # All chats in insertion order (for snapshots).
+        return list(self.by_id.values())  # Copy of the values.
+
+    def _unlink(self, chat: Dict[str, Any]) -> None:  # Remove a chat's sort key from the ordered list.
+        key = (chat.get("updatedAt", ""), chat["id"])  # Current key.
+        i = bisect.bisect_left(self._order, key)  # Binary search.
+        if i < len(self._order) and self._order[i] == key:  # Found.
+            del self._order[i]  # Remove it.
+
+    def add(self, chat: Dict[str, Any]) -> None:  # Index a new chat.
+        self.by_id[chat["id"]] = chat  # Hash index.
+        bisect.insort(self._order, (chat.get("updatedAt", ""), chat["id"]))  # Ordered index.
+
+    def remove(self, chat_id: str) -> Optional[Dict[str, Any]]:  # Drop a chat from every index.
+        chat = self.by_id.pop(chat_id, None)  # Hash index.
+        if chat is not None:  # Was indexed.
+            self._unlink(chat)  # Ordered index.
+            self._msg_pos.pop(chat_id, None)  # Message positions.
+        return chat  # Removed chat (or None).
+
+    def touch(self, chat: Dict[str, Any], updated_at: str) -> None:  # Change updatedAt and re-position the chat.
+        self._unlink(chat)  # Remove old key.
+        chat["updatedAt"] = updated_at  # Update timestamp.
+        bisect.insort(self._order, (updated_at, chat["id"]))  # Newest timestamps land at the end (cheap append).
+
+    def add_message(self, chat: Dict[str, Any], msg: Dict[str, Any]) -> None:  # Append a message and keep positions current.
+        msgs = chat.setdefault("messages", [])  # Message list.
+        pos = self._msg_pos.get(chat["id"])  # Position map, if built.
+        if pos is not None:  # Keep it in sync.
+            pos[msg["id"]] = len(msgs)  # New message position.
+        msgs.append(msg)  # Append message.
+
+    def replace_message(self, chat: Dict[str, Any], msg: Dict[str, Any]) -> Optional[Dict[str, Any]]:  # Swap in a new version of a message.
+        i = self._positions(chat).get(msg["id"])  # Position.
+        if i is None:  # Unknown message.
+            return None  # Nothing replaced.
+        old = chat["messages"][i]  # Previous version.
+        chat["messages"][i] = msg  # New dict (snapshots still hold the old one, so never mutate it in place).
+        return old  # Caller re-indexes search.
+
+    def page(  # Newest-first page of chats after an optional cursor.
+        self,  # Instance.
+        limit: Optional[int] = None,  # Page size (None = everything).
+        cursor: Optional[str] = None,  # Opaque cursor from a previous page.
+        match: Optional[Callable[[Dict[str, Any]], bool]] = None,  # Optional filter (e.g. title search).
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:  # (chats, next cursor or None).
+        i = bisect.bisect_left(self._order, decode_cursor(cursor)) if cursor else len(self._order)  # Start just below cursor.
+        out: List[Dict[str, Any]] = []  # Page items.
+        while i > 0:  # Walk towards older chats.
+            i -= 1  # Next older key.
+            chat = self.by_id[self._order[i][1]]  # Resolve chat.
+            if match is None or match(chat):  # Apply filter.
+                out.append(chat)  # Keep it.
+                if limit is not None and len(out) >= limit:  # Page full.
+                    return out, (encode_cursor(self._order[i]) if i > 0 else None)  # Cursor = last returned key.
+        return out, None  # Reached the oldest chat.
+
+    def _positions(self, chat: Dict[str, Any]) -> Dict[str, int]:  # Message id -> index for one chat (built once).
+        pos = self._msg_pos.get(chat["id"])  # Cached positions.
+        if pos is None:  # Build once per chat.
+            pos = self._msg_pos[chat["id"]] = {m["id"]: i for i, m in enumerate(chat.get("messages", []))}  # id -> index.
+        return pos  # Return map.
+
+    def get_message(self, chat: Dict[str, Any], msg_id: str) -> Optional[Dict[str, Any]]:  # O(1) message lookup.
+        i = self._positions(chat).get(msg_id)  # Position.
+        return chat["messages"][i] if i is not None else None  # Message or None.
+
+    def messages_page(  # Oldest-to-newest slice of a chat's messages ending before an optional message id.
+        self,  # Instance.
+        chat: Dict[str, Any],  # Chat to read.
+        limit: Optional[int] = None,  # Page size (None = everything).
+        before: Optional[str] = None,  # Message id; only older messages are returned.
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:  # (messages, id to pass as `before` next time, or None).
+        msgs = chat.get("messages", [])  # Message list.
+        end = len(msgs)  # Default: up to the newest message.
+        if before:  # Page ends before a known message.
+            pos = self._positions(chat)  # Cached positions.
+            if before not in pos:  # Unknown message id.
+                raise ValueError("Invalid cursor")  # Let the route turn it into a 400.
+            end = pos[before]  # Exclusive end.
+        start = 0 if limit is None else max(0, end - limit)  # Window start.
+        return msgs[start:end], (msgs[start]["id"] if start > 0 else None)  # Slice + next `before`.
+
+    def messages_after(self, chat: Dict[str, Any], after: str) -> List[Dict[str, Any]]:  # Messages newer than a message id.
+        pos = self._positions(chat).get(after)  # Cached positions.
+        if pos is None:  # Unknown message id.
+            raise ValueError("Invalid cursor")  # Let the route turn it into a 400.
+        return chat["messages"][pos + 1:]  # Slice (a copy).
+
+
 class JsonChatStore:  # Create a JSON-backed storage layer (acts like a tiny DB).
-    def __init__(self, file_path: str) -> None:  # Initialize store with a file path.
+    def __init__(  # Initialize store.
+        self, file_path: str, durability: str = "commit", commit_window_ms: float = 5.0, multiprocess: bool = False,
+        search_checkpoint_every: int = 1000,
+    ) -> None:
         self.file_path = file_path  # Save path to JSON file.
-        self._lock = asyncio.Lock()  # Create an async lock to prevent concurrent writes.
+        self.durability = durability  # "commit": wait for fsync; "memory": return once the change is in memory.
+        self._lock = asyncio.Lock()  # Async lock to prevent concurrent first loads.
+        self.multiprocess = multiprocess  # Other processes (uvicorn --workers) share the file.
+        self._file_lock = FileLock(f"{file_path}.lock") if multiprocess else None  # Cross-process writer lock.
+        self._txn_lock = asyncio.Lock()  # One locked read-modify-write at a time in this process.
+        self._lock_held = False  # This process holds the file lock (memory is authoritative until it is released).
+        self._batch: List[asyncio.Future] = []  # Multiprocess mutations applied in memory, waiting for the next write.
+        self._committer: Optional[asyncio.Task] = None  # Writes batches, then releases the file lock.
+        self._stamp: Optional[Tuple[int, int, int]] = None  # Version of the file the in-memory state reflects.
+        self._index: Optional[ChatIndex] = None  # In-memory chats + indexes (loaded once, then kept current).
+        self.search_path = f"{file_path}.search"  # Persisted full-text index next to the data file.
+        self._search: Optional[SearchIndex] = None  # Full-text index (loaded or built with the data).
+        self.search_checkpoint_every = search_checkpoint_every  # Changes between background search checkpoints (0 = only on shutdown).
+        self._checkpoint: Optional[asyncio.Task] = None  # Running search checkpoint, if any.
+        self._search_changes: List[Tuple[str, Optional[Dict[str, Any]]]] = []  # Chats another worker changed, to re-index on the loop.
+        self._seq = 0  # Mutation counter, stored in the snapshot so a persisted search index can be validated (also the store version).
+        self._epoch = uuid.uuid4().hex[:8]  # New per process: a version lost in a crash may be reused, so old tags must not match.
+        self._writer = GroupCommitWriter(self._snapshot, self._write_file, commit_window_ms)  # Group-commit writer.
 
-    async def _ensure_file(self) -> None:  # Ensure the JSON file exists with correct structure.
-        os.makedirs(os.path.dirname(self.file_path), exist_ok=True)  # Create parent directory if missing.
+    def _load_file(self) -> Dict[str, Any]:  # Read JSON store from disk (runs in a worker thread).
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)  # Create parent directory if missing.
         if not os.path.exists(self.file_path):  # Check if file is missing.
-            async with self._lock:  # Lock before creating to avoid race conditions.
-                if not os.path.exists(self.file_path):  # Re-check inside lock.
-                    with open(self.file_path, "w", encoding="utf-8") as f:  # Open file for writing.
-                        json.dump({"chats": []}, f, ensure_ascii=False, indent=2)  # Write empty store.
-
-    async def _read(self) -> Dict[str, Any]:  # Read JSON store from disk.
-        await self._ensure_file()  # Ensure file exists first.
-        async with self._lock:  # Lock for safe read (consistent with writes).
-            with open(self.file_path, "r", encoding="utf-8") as f:  # Open file for reading.
-                return json.load(f)  # Parse and return JSON data.
-
-    async def _write(self, data: Dict[str, Any]) -> None:  # Write JSON store to disk.
-        await self._ensure_file()  # Ensure file exists first.
-        async with self._lock:  # Lock to prevent concurrent writes.
-            with open(self.file_path, "w", encoding="utf-8") as f:  # Open file for writing.
-                json.dump(data, f, ensure_ascii=False, indent=2)  # Write JSON pretty formatted.
+            self._write_file({"chats": []})  # Write empty store.
+        return self._parse_file()  # Parse and return JSON data.
+
+    def _parse_file(self) -> Dict[str, Any]:  # Read + parse the data file, timing each phase (worker thread).
+        with STORE_IO.time("read"):  # Disk read.
+            with open(self.file_path, "rb") as f:  # Raw bytes (json.loads decodes UTF-8 itself).
+                self._stamp = file_stamp(os.fstat(f.fileno()))  # Version actually read (not a later replacement).
+                raw = f.read()  # Whole file.
+        STORE_BYTES.observe(len(raw), "read")  # Size.
+        with STORE_IO.time("parse"):  # JSON decode.
+            return json.loads(raw)  # Parsed store.
+
+    def _write_file(self, data: Dict[str, Any]) -> None:  # Write JSON store atomically (runs in a worker thread).
+        with STORE_IO.time("serialize"):  # Encode in one C-accelerated pass (json.dump to a file is the slow pure-Python path).
+            raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")  # Compact JSON (indent is much slower).
+        STORE_BYTES.observe(len(raw), "write")  # Size.
+        tmp = f"{self.file_path}.{os.getpid()}.tmp"  # Temp file in the same directory (rename stays atomic; per process).
+        with STORE_IO.time("write"):  # Write + fsync + rename.
+            with open(tmp, "wb") as f:  # Open temp file for writing.
+                f.write(raw)  # One write.
+                f.flush()  # Push to OS.
+                os.fsync(f.fileno())  # Make it durable before the rename.
+                stamp = file_stamp(os.fstat(f.fileno()))  # Version being published.
+            os.replace(tmp, self.file_path)  # Atomically replace the old file.
+        self._stamp = stamp  # Our own write is not a change by another process.
+
+    def _stale(self) -> bool:  # Whether another process replaced the file since we loaded/wrote it (one stat).
+        try:  # The file may be mid-creation.
+            return file_stamp(os.stat(self.file_path)) != self._stamp  # Compare versions.
+        except FileNotFoundError:  # Not written yet.
+            return False  # Nothing newer to load.
+
+    def _snapshot(self) -> Dict[str, Any]:  # Copy state for the writer (runs on the loop; copies references only).
+        return {"seq": self._seq, "epoch": self._epoch, "chats": [dict(c, messages=list(c.get("messages", []))) for c in self._index.chats()]}  # Shallow copy.
+
+    def _load_search(self, chats: List[Dict[str, Any]]) -> SearchIndex:  # Load the last search checkpoint and catch it up, or rebuild (worker thread).
+        index = SearchIndex.load(self.search_path, self._seq)  # Checkpoint taken at or before this seq.
+        if index is None:  # Missing, corrupt or ahead of the data.
+            return SearchIndex.build(chats, self._seq)  # Full rebuild.
+        index.catch_up(chats, self._seq)  # Re-index only chats changed since the checkpoint.
+        return index  # Current index.
+
+    @staticmethod  # Pure comparison.
+    def _changed_chats(old: ChatIndex, chats: List[Dict[str, Any]]) -> List[Tuple[str, Optional[Dict[str, Any]]]]:  # (id, new chat or None if deleted).
+        changed: List[Tuple[str, Optional[Dict[str, Any]]]] = []  # Chats whose searchable text may differ.
+        for c in chats:  # New state.
+            o = old.get(c["id"])  # Previous state.
+            if o is None or o.get("title") != c.get("title") or o.get("version", 0) != c.get("version", 0):  # New, renamed or new/updated messages.
+                changed.append((c["id"], c))  # Re-index.
+        ids = {c["id"] for c in chats}  # Chats still present.
+        changed.extend((chat_id, None) for chat_id in old.by_id if chat_id not in ids)  # Deleted.
+        return changed  # Usually one or two chats.
+
+    def _load_state(self) -> None:  # Load chats, indexes and search index (runs in a worker thread).
+        data = self._load_file()  # Parse file.
+        self._seq = data.get("seq", 0)  # Restore mutation counter.
+        if self.multiprocess and data.get("epoch"):  # Every write is durable before unlock, so workers share one epoch.
+            self._epoch = data["epoch"]  # Tags stay valid across workers.
+        chats = data.get("chats", [])  # Loaded chats.
+        if self._index is None or self._search is None:  # First load.
+            self._search = self._load_search(chats)  # Full-text index.
+        else:  # Another worker wrote: re-index only what it changed (a full rebuild costs ~10x the parse).
+            self._search_changes = self._changed_chats(self._index, chats)  # Applied on the loop by _read().
+        self._index = ChatIndex(chats)  # Build indexes once (assigned last: marks store as loaded).
+
+    def _apply_search_changes(self) -> None:  # Re-index chats changed by another worker (runs on the loop, like every search update).
+        changes, self._search_changes = self._search_changes, []  # Take them.
+        for chat_id, chat in changes:  # Each changed chat.
+            self._search.remove_chat(chat_id)  # Old title + bodies.
+            if chat is not None:  # Not deleted.
+                self._search.add_chat(chat)  # New title + bodies.
+
+    async def _read(self) -> ChatIndex:  # Return the in-memory indexes, loading the file off the loop on first use.
+        if self._index is None or (self.multiprocess and not self._lock_held and self._stale()):  # Not loaded yet, or another worker wrote.
+            started = time.perf_counter()  # Lock wait clock.
+            async with self._lock:  # Lock so only one caller loads.
+                STORE_LOCK_WAIT.observe(time.perf_counter() - started, "load")  # Time spent behind another load.
+                if self._index is None or (self.multiprocess and not self._lock_held and self._stale()):  # Re-check inside lock.
+                    await asyncio.to_thread(self._load_state)  # Parse file + indexes in a worker thread.
+                    self._apply_search_changes()  # Incremental search update (the search index is never touched off the loop).
+        return self._index  # Return live indexes.
+
+    async def _acquire_file_lock(self) -> None:  # Take the cross-process lock without blocking the loop.
+        task = asyncio.ensure_future(asyncio.to_thread(self._file_lock.acquire))  # Blocking flock in a worker thread.
+        try:  # Wait for it.
+            await asyncio.shield(task)  # A cancelled caller must not abandon a lock the thread goes on to take.
+        except asyncio.CancelledError:  # Caller went away.
+            task.add_done_callback(lambda t: t.cancelled() or t.exception() or self._file_lock.release())  # Release once acquired.
+            raise  # Propagate cancellation.
+
+    @asynccontextmanager  # Usage: async with self._mutate(durable) as index: ...
+    async def _mutate(self, durable: Optional[bool] = None) -> AsyncIterator[ChatIndex]:  # Yield current indexes for one change, then persist it.
+        if self._file_lock is None:  # Single process: memory is authoritative; group commit as usual.
+            yield await self._read()  # Live indexes.
+            await self._write(durable)  # Persist changes.
+            self._maybe_checkpoint_search()  # Every search_checkpoint_every changes.
+            return  # Done.
+        started = time.perf_counter()  # Lock wait clock.
+        async with self._txn_lock:  # Serialize this process's changes (applied one at a time, written in batches).
+            if not self._lock_held:  # First change of a batch.
+                await self._acquire_file_lock()  # No other worker can write from here on.
+                try:  # Reload if another worker wrote since our last look.
+                    await self._read()  # Before marking the lock held (held = no staleness checks).
+                except BaseException:  # Unreadable file: give the lock back.
+                    await asyncio.to_thread(self._file_lock.release)  # Next worker may write.
+                    raise  # Propagate.
+                self._lock_held = True  # Memory is authoritative until the committer releases the lock.
+            index = await self._read()  # Current indexes.
+            STORE_LOCK_WAIT.observe(time.perf_counter() - started, "file")  # In-process + cross-process wait.
+            try:  # Caller applies its change.
+                yield index  # Synchronous change to the in-memory state.
+            except BaseException:  # Nothing changed (e.g. KeyError).
+                self._start_committer()  # Releases the lock if no other change is pending.
+                raise  # Propagate.
+            fut = asyncio.get_running_loop().create_future()  # Resolved once the batch holding this change is on disk.
+            self._batch.append(fut)  # Join the next write.
+            self._start_committer()  # Write (and unlock) in the background.
+        started = time.perf_counter()  # Commit wait clock.
+        await fut  # Durable before returning (multiprocess writes always are).
+        STORE_COMMIT_WAIT.observe(time.perf_counter() - started, "json")  # Batching + write.
+        self._maybe_checkpoint_search()  # Every search_checkpoint_every changes.
+
+    def _start_committer(self) -> None:  # Make sure a committer task is running (caller holds _txn_lock).
+        if self._committer is None or self._committer.done():  # None running.
+            self._committer = asyncio.create_task(self._commit_batches())  # Starts once the caller releases _txn_lock.
+
+    async def _commit_batches(self) -> None:  # Multiprocess group commit: write batches while changes keep coming, then unlock.
+        while True:  # One snapshot write per batch.
+            async with self._txn_lock:  # No change is half-applied here.
+                if not self._batch:  # Everything applied is on disk.
+                    self._lock_held = False  # Other workers' writes must be picked up again.
+                    await asyncio.to_thread(self._file_lock.release)  # Next worker may write.
+                    return  # Done.
+                waiters, self._batch = self._batch, []  # This batch.
+                snapshot = self._snapshot()  # Point-in-time copy; later changes go to the next batch.
+            try:  # Changes made during the write keep the lock held and join the next batch.
+                await asyncio.to_thread(self._write_file, snapshot)  # Parse once + serialize once for the whole batch.
+            except BaseException as e:  # Disk full, etc.
+                async with self._txn_lock:  # Stop batching.
+                    waiters, self._batch = waiters + self._batch, []  # Unwritten changes fail too.
+                    self._stamp = None  # Memory holds unwritten changes: reload from disk on next use.
+                    self._lock_held = False  # Give up the lock.
+                    await asyncio.to_thread(self._file_lock.release)  # Next worker may write.
+                for f in waiters:  # Report the failure.
+                    if not f.done():  # Caller still waiting.
+                        f.set_exception(e if isinstance(e, Exception) else RuntimeError("Store write cancelled"))  # Propagate.
+                if not isinstance(e, Exception):  # Cancellation (shutdown).
+                    raise  # Propagate.
+                return  # Stopped.
+            for f in waiters:  # Batch is durable.
+                if not f.done():  # Caller still waiting.
+                    f.set_result(None)  # Wake it.
+
+    async def _save_search(self, flush: bool = True) -> None:  # Checkpoint the search index; the next start re-indexes only chats changed since.
+        async with self._lock:  # Not during a reload (index and seq must match).
+            if self._search is None:  # Not loaded.
+                return  # Nothing to save.
+            if self._lock_held:  # Multiprocess batch not on disk yet.
+                return  # The next checkpoint (or close) covers it.
+            self._search.seq = self._seq  # Mark which data it reflects.
+            data = self._search.snapshot()  # Point-in-time copy on the loop (~10 ms for an 18 MB store).
+        if flush and self._file_lock is None:  # Single process: writes may still be queued.
+            await self._writer.drain()  # Data first: a crash must never leave the index ahead of the data.
+        await asyncio.to_thread(SearchIndex.write, data, self.search_path)  # Encode + write off the loop.
+
+    def _maybe_checkpoint_search(self) -> None:  # Start a background search checkpoint once enough changes piled up.
+        if not self.search_checkpoint_every or self._search is None:  # Disabled / not loaded.
+            return  # Nothing to do.
+        if self._seq - self._search.seq >= self.search_checkpoint_every and (self._checkpoint is None or self._checkpoint.done()):  # Due.
+            self._checkpoint = asyncio.create_task(self._checkpoint_search())  # Never delays the caller.
+
+    async def _checkpoint_search(self) -> None:  # Background checkpoint (failures are logged; the next one retries).
+        try:  # Disk errors must not surface in a request.
+            await self._save_search()  # Copy + flush + write.
+        except Exception:  # Disk full, etc.
+            log.warning("search index checkpoint failed", exc_info=True)  # Startup catches up from the previous one.
+
+    async def _write(self, durable: Optional[bool] = None) -> None:  # Schedule a group commit of the in-memory store.
+        wait = self.durability == "commit" if durable is None else durable  # Per-call override of the store default.
+        fut = self._writer.request(wait=wait)  # Join the next batch.
+        if fut is not None:  # Caller wants durability.
+            started = time.perf_counter()  # Commit wait clock.
+            await fut  # Wait for fsync + rename.
+            STORE_COMMIT_WAIT.observe(time.perf_counter() - started, "json")  # Batching window + write.
+
+    async def close(self) -> None:  # Flush pending writes (call on shutdown).
+        if self._checkpoint is not None:  # Search checkpoint in flight (it may still flush the writer).
+            await self._checkpoint  # Finish it.
+        await self._writer.close()  # Final commit.
+        if self._committer is not None:  # Multiprocess batch in flight.
+            await self._committer  # Written + unlocked.
+        await self._save_search(flush=False)  # Persist search index with the same seq as the snapshot.
+
+    async def page_chats(  # Return one newest-first page of chat summaries plus the next cursor.
+        self, search: str = "", limit: Optional[int] = None, cursor: Optional[str] = None  # Filter + paging.
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:  # (summaries, next cursor).
+        index = await self._read()  # Get in-memory indexes.
+        s = search.lower().strip()  # Normalize search query.
+        match = (lambda c: s in c.get("title", "").lower()) if s else None  # Filter by title match.
+        chats, next_cursor = index.page(limit=limit, cursor=cursor, match=match)  # Walk the ordered index.
+        return [{"id": c["id"], "title": c["title"], "updatedAt": c["updatedAt"]} for c in chats], next_cursor  # Map to summary.
 
     async def list_chats(self, search: str = "") -> List[Dict[str, Any]]:  # Return chat summaries.
-        data = await self._read()  # Read full store.
-        chats = data.get("chats", [])  # Extract chats list.
-        if search:  # If search query present.
-            s = search.lower().strip()  # Normalize search query.
-            chats = [c for c in chats if s in c.get("title", "").lower()]  # Filter by title match.
-        chats.sort(key=lambda c: c.get("updatedAt", ""), reverse=True)  # Sort newest first.
-        return [{"id": c["id"], "title": c["title"], "updatedAt": c["updatedAt"]} for c in chats]  # Map to summary.
-
-    async def create_chat(self, title: str) -> Dict[str, Any]:  # Create a new chat in store.
-        data = await self._read()  # Read store.
-        chat_id = str(uuid.uuid4())  # Generate chat id.
-        chat = {  # Build chat object.
-            "id": chat_id,  # Store chat id.
-            "title": title or "New chat",  # Store title.
-            "updatedAt": now_iso(),  # Store updated timestamp.
-            "messages": [],  # Initialize message list.
-        }
-        data["chats"].append(chat)  # Append chat to store.
-        await self._write(data)  # Persist changes.
+        chats, _ = await self.page_chats(search=search)  # Unpaged.
+        return chats  # Newest first.
+
+    async def search_chats(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:  # Full-text search over titles + messages.
+        index = await self._read()  # Get in-memory indexes.
+        terms = tokenize(query)  # Query terms (for snippets).
+        results = []  # Ranked summaries.
+        for chat_id, score, msg_ids in self._search.search(query, limit=limit):  # Ranked hits from the inverted index.
+            c = index.get(chat_id)  # O(1) lookup.
+            if c is None:  # Deleted meanwhile.
+                continue  # Skip.
+            snippets = []  # Matching message snippets.
+            for mid in msg_ids:  # Best-matching messages.
+                m = index.get_message(c, mid)  # O(1) lookup.
+                if m is not None:  # Present.
+                    snippets.append({"messageId": m["id"], "role": m["role"], "text": make_snippet(m["content"], terms)})  # Snippet.
+            results.append({"id": c["id"], "title": c["title"], "updatedAt": c["updatedAt"], "score": round(score, 4), "snippets": snippets})  # Summary + hits.
+        return results  # Best match first.
+
+    async def create_chat(self, title: str, durable: Optional[bool] = None) -> Dict[str, Any]:  # Create a new chat in store.
+        async with self._mutate(durable) as index:  # Locked read-modify-write (reloads if another worker wrote).
+            chat_id = str(uuid.uuid4())  # Generate chat id.
+            chat = {  # Build chat object.
+                "id": chat_id,  # Store chat id.
+                "title": title or "New chat",  # Store title.
+                "updatedAt": now_iso(),  # Store updated timestamp.
+                "messages": [],  # Initialize message list.
+            }
+            index.add(chat)  # Index the chat.
+            self._search.add_chat(chat)  # Index title for search.
+            self._seq += 1  # Count mutation.
+            chat["version"] = self._seq  # Message history version.
         return {"id": chat["id"], "title": chat["title"], "updatedAt": chat["updatedAt"]}  # Return summary.
 
-    async def rename_chat(self, chat_id: str, title: str) -> None:  # Rename an existing chat.
-        data = await self._read()  # Read store.
-        for c in data.get("chats", []):  # Loop through chats.
-            if c.get("id") == chat_id:  # Find matching chat.
-                c["title"] = title  # Update title.
-                c["updatedAt"] = now_iso()  # Update timestamp.
-                await self._write(data)  # Persist changes.
-                return  # Exit function.
-        raise KeyError("Chat not found")  # Raise if chat does not exist.
-
-    async def delete_chat(self, chat_id: str) -> None:  # Delete a chat.
-        data = await self._read()  # Read store.
-        before = len(data.get("chats", []))  # Store count before deletion.
-        data["chats"] = [c for c in data.get("chats", []) if c.get("id") != chat_id]  # Filter out chat.
-        after = len(data.get("chats", []))  # Store count after deletion.
-        if after == before:  # If nothing removed.
-            raise KeyError("Chat not found")  # Raise not found.
-        await self._write(data)  # Persist changes.
+    async def rename_chat(self, chat_id: str, title: str, durable: Optional[bool] = None) -> None:  # Rename an existing chat.
+        async with self._mutate(durable) as index:  # Locked read-modify-write (reloads if another worker wrote).
+            c = index.get(chat_id)  # O(1) lookup.
+            if c is None:  # Unknown chat.
+                raise KeyError("Chat not found")  # Raise if chat does not exist.
+            c["title"] = title  # Update title.
+            index.touch(c, now_iso())  # Update timestamp + order.
+            self._search.set_title(chat_id, title)  # Re-index title.
+            self._seq += 1  # Count mutation.
+
+    async def delete_chat(self, chat_id: str, durable: Optional[bool] = None) -> None:  # Delete a chat.
+        async with self._mutate(durable) as index:  # Locked read-modify-write (reloads if another worker wrote).
+            if index.remove(chat_id) is None:  # If nothing removed.
+                raise KeyError("Chat not found")  # Raise not found.
+            self._search.remove_chat(chat_id)  # Drop from search.
+            self._seq += 1  # Count mutation.
+
+    async def page_messages(  # Return a window of a chat's messages (oldest first) plus the next `before` id.
+        self, chat_id: str, limit: Optional[int] = None, before: Optional[str] = None  # Chat + paging.
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:  # (messages, next before).
+        index = await self._read()  # Get in-memory indexes.
+        c = index.get(chat_id)  # O(1) lookup.
+        if c is None:  # Unknown chat.
+            raise KeyError("Chat not found")  # Raise if missing.
+        return index.messages_page(c, limit=limit, before=before)  # Slice (a copy).
 
     async def list_messages(self, chat_id: str) -> List[Dict[str, Any]]:  # Return messages for a chat.
-        data = await self._read()  # Read store.
-        for c in data.get("chats", []):  # Loop chats.
-            if c.get("id") == chat_id:  # Match chat.
-                return c.get("messages", [])  # Return messages list.
-        raise KeyError("Chat not found")  # Raise if missing.
-
-    async def append_message(self, chat_id: str, role: str, content: str) -> Dict[str, Any]:  # Add a message.
-        data = await self._read()  # Read store.
-        for c in data.get("chats", []):  # Loop chats.
-            if c.get("id") == chat_id:  # Match chat.
-                msg = {  # Build message object.
-                    "id": str(uuid.uuid4()),  # Generate unique message id.
-                    "role": role,  # Store role.
-                    "content": content,  # Store content.
-                    "createdAt": now_iso(),  # Store timestamp.
-                }
-                c.setdefault("messages", []).append(msg)  # Append message safely.
-                c["updatedAt"] = now_iso()  # Update chat updatedAt.
-                await self._write(data)  # Persist changes.
-                return msg  # Return created message.
-        raise KeyError("Chat not found")  # Raise if missing.
+        msgs, _ = await self.page_messages(chat_id)  # Unpaged.
+        return msgs  # All messages.
 
-6) backend/app/llm_client.py (today: direct LLM; later: RAG + FAISS)
+    async def version(self, chat_id: Optional[str] = None) -> str:  # Tag of the whole store, or of one chat's message history.
+        index = await self._read()  # In memory (one stat in multiprocess mode; no parsing or serializing).
+        if chat_id is None:  # Chat list / search results.
+            return version_tag(self._epoch, self._seq)  # Changes on every mutation.
+        c = index.get(chat_id)  # O(1) lookup.
+        if c is None:  # Unknown chat.
+            raise KeyError("Chat not found")  # Raise if missing.
+        return version_tag(self._epoch, c.get("version", 0))  # Changes when a message is added or updated.
+
+    async def messages_since(  # Messages added/changed after a version tag, or added after a message id (delta sync).
+        self, chat_id: str, since: Optional[str] = None, after: Optional[str] = None  # One of the two.
+    ) -> Optional[List[Dict[str, Any]]]:  # Oldest first; None if `since` is from another epoch (caller sends everything).
+        index = await self._read()  # Get in-memory indexes.
+        c = index.get(chat_id)  # O(1) lookup.
+        if c is None:  # Unknown chat.
+            raise KeyError("Chat not found")  # Raise if missing.
+        if after:  # New messages only.
+            return index.messages_after(c, after)  # Slice after the known message.
+        version = parse_version(since or "", self._epoch)  # Client's last seen version.
+        if version is None:  # Restarted store or garbage.
+            return None  # Full history needed.
+        if c.get("version", 0) <= version:  # Nothing changed.
+            return []  # Skip the scan.
+        return [m for m in c.get("messages", []) if m.get("version", 0) > version]  # New + updated messages.
+
+    async def append_message(  # Add a message.
+        self, chat_id: str, role: str, content: str, durable: Optional[bool] = None, status: Optional[str] = None
+    ) -> Dict[str, Any]:
+        async with self._mutate(durable) as index:  # Locked read-modify-write (reloads if another worker wrote).
+            c = index.get(chat_id)  # O(1) lookup.
+            if c is None:  # Unknown chat.
+                raise KeyError("Chat not found")  # Raise if missing.
+            msg = {  # Build message object.
+                "id": str(uuid.uuid4()),  # Generate unique message id.
+                "role": role,  # Store role.
+                "content": content,  # Store content.
+                "createdAt": now_iso(),  # Store timestamp.
+                "tokens": count_tokens(content),  # Counted once, reused for every prompt.
+            }
+            if status:  # E.g. "streaming" for an assistant placeholder.
+                msg["status"] = status  # Store status.
+            index.add_message(c, msg)  # Append message safely.
+            index.touch(c, now_iso())  # Update chat updatedAt + order.
+            self._search.add_message(chat_id, msg)  # Index message body.
+            self._seq += 1  # Count mutation.
+            c["version"] = msg["version"] = self._seq  # History changed at this version.
+        return msg  # Return created message.
 
+    async def update_message(  # Replace a message's content (checkpoints of a streaming reply).
+        self, chat_id: str, message_id: str, content: str, status: Optional[str] = None, durable: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        async with self._mutate(durable) as index:  # Locked read-modify-write (reloads if another worker wrote).
+            c = index.get(chat_id)  # O(1) lookup.
+            old = index.get_message(c, message_id) if c is not None else None  # O(1) message lookup.
+            if old is None:  # Unknown chat or message.
+                raise KeyError("Message not found")  # Raise if missing.
+            msg = {k: v for k, v in old.items() if k != "status"}  # New dict; status is cleared unless given.
+            msg["content"] = content  # New content.
+            msg["tokens"] = count_tokens(content)  # Re-count for the new content.
+            if status:  # Still streaming / failed.
+                msg["status"] = status  # Store status.
+            index.replace_message(c, msg)  # Swap in (updatedAt is left alone so the sidebar order stays stable).
+            self._search.update_message(chat_id, old, msg)  # Re-index body.
+            self._seq += 1  # Count mutation.
+            c["version"] = msg["version"] = self._seq  # History changed at this version.
+        return msg  # Return updated message.
+
+    async def get_summary(self, chat_id: str) -> Optional[Dict[str, Any]]:  # Rolling summary of older turns (or None).
+        index = await self._read()  # Get in-memory indexes.
+        c = index.get(chat_id)  # O(1) lookup.
+        if c is None:  # Unknown chat.
+            raise KeyError("Chat not found")  # Raise if missing.
+        return c.get("summary")  # {"text", "upto", "tokens"} or None.
+
+    async def set_summary(self, chat_id: str, summary: Dict[str, Any], durable: Optional[bool] = None) -> None:  # Replace the summary.
+        async with self._mutate(durable) as index:  # Locked read-modify-write (reloads if another worker wrote).
+            c = index.get(chat_id)  # O(1) lookup.
+            if c is None:  # Unknown chat.
+                raise KeyError("Chat not found")  # Raise if missing.
+            c["summary"] = summary  # New dict (updatedAt unchanged: not a user-visible change).
+            self._seq += 1  # Count mutation.
+
+6) backend/app/llm_client.py (today: direct LLM; later: RAG + FAISS)
 This file provides streaming tokens to the SSE endpoint.
 
 import os  # Import os to read environment variables.
+import re  # Import re to split the demo text into word tokens.
 import asyncio  # Import asyncio to simulate streaming in demo mode.
-from typing import AsyncGenerator  # Import AsyncGenerator for streaming responses.
+import logging  # Import logging to report pool configuration fallbacks.
+from contextlib import asynccontextmanager  # Import asynccontextmanager for the pooled stream helper.
+from typing import AsyncGenerator, AsyncIterator, Dict, List, Optional  # Import types for streaming responses.
 import httpx  # Import httpx for async HTTP requests to external LLM services.
+from .metrics import LLMCall  # Import upstream timing (connect, first token, rate, errors).
+
+log = logging.getLogger(__name__)  # Module logger.
+
+
+def _env_float(name: str, default: float) -> float:  # Read a float setting from env.
+    return float(os.getenv(name, str(default)))  # Parse with default.
+
+
+class LLMHttpPool:  # One app-lifetime httpx.AsyncClient shared by every LLM client (keep-alive, optional HTTP/2).
+    def __init__(  # Pool limits and timeouts; unset values come from env.
+        self,  # Instance.
+        max_connections: Optional[int] = None,  # Total open connections.
+        max_keepalive: Optional[int] = None,  # Idle connections kept for reuse.
+        keepalive_expiry: Optional[float] = None,  # Seconds an idle connection is kept.
+        connect_timeout: Optional[float] = None,  # Seconds for TCP + TLS handshake.
+        read_timeout: Optional[float] = None,  # Max seconds between two received chunks.
+        http2: Optional[bool] = None,  # Negotiate HTTP/2 when the server supports it.
+    ) -> None:  # No return value.
+        self.max_connections = max_connections or int(os.getenv("LLM_MAX_CONNECTIONS", "100"))  # Pool size.
+        self.max_keepalive = max_keepalive or int(os.getenv("LLM_MAX_KEEPALIVE", "20"))  # Idle pool size.
+        self.keepalive_expiry = keepalive_expiry or _env_float("LLM_KEEPALIVE_EXPIRY_S", 30.0)  # Idle expiry.
+        self.connect_timeout = connect_timeout or _env_float("LLM_CONNECT_TIMEOUT_S", 5.0)  # Connect timeout.
+        self.read_timeout = read_timeout or _env_float("LLM_READ_TIMEOUT_S", 120.0)  # Read timeout (per chunk, not per stream).
+        self.http2 = http2 if http2 is not None else os.getenv("LLM_HTTP2", "0").strip() in ("1", "true", "yes")  # HTTP/2 flag.
+        self._client: Optional[httpx.AsyncClient] = None  # Created on first use.
+
+    def client(self) -> httpx.AsyncClient:  # Return the shared client, creating it on first use.
+        if self._client is None or self._client.is_closed:  # Not created yet (or closed by shutdown).
+            http2 = self.http2  # Requested protocol.
+            if http2:  # HTTP/2 needs the optional "h2" package.
+                try:  # Check availability.
+                    import h2  # noqa: F401  # Installed via `pip install httpx[http2]`.
+                except ImportError:  # Not installed.
+                    log.warning("LLM_HTTP2 is set but the h2 package is missing; using HTTP/1.1")  # Fall back.
+                    http2 = False  # Use HTTP/1.1 keep-alive.
+            self._client = httpx.AsyncClient(  # One client = one connection pool.
+                http2=http2,  # Protocol.
+                limits=httpx.Limits(  # Pool limits.
+                    max_connections=self.max_connections,  # Total connections.
+                    max_keepalive_connections=self.max_keepalive,  # Idle connections kept warm.
+                    keepalive_expiry=self.keepalive_expiry,  # Idle expiry.
+                ),
+                timeout=httpx.Timeout(  # Bounded connect, long read for streams.
+                    connect=self.connect_timeout,  # Handshake timeout.
+                    read=self.read_timeout,  # Gap between chunks.
+                    write=self.connect_timeout,  # Request upload timeout.
+                    pool=self.connect_timeout,  # Wait for a free pooled connection.
+                ),
+            )
+        return self._client  # Shared client.
+
+    @asynccontextmanager  # Usable as `async with pool.stream(...) as r`.
+    async def stream(self, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:  # Streaming request on a pooled connection.
+        async with self.client().stream(method, url, **kwargs) as r:  # Reuses a keep-alive connection when one is idle.
+            yield r  # Hand response to caller.
+
+    async def aclose(self) -> None:  # Close every pooled connection (call from the app lifespan).
+        if self._client is not None:  # Created.
+            await self._client.aclose()  # Close pool.
+            self._client = None  # Allow re-creation.
+
+
+async def iter_sse_data(r: httpx.Response) -> AsyncGenerator[str, None]:  # Yield `data:` payloads of an SSE response until [DONE].
+    done = False  # Set once [DONE] arrives.
+    async for line in r.aiter_lines():  # Iterate incoming lines.
+        if done or not line.startswith("data:"):  # Skip blank lines, comments and anything after [DONE].
+            continue  # Keep reading so the body is fully consumed and the connection goes back to the pool.
+        data = line[len("data:"):].strip()  # Payload after the field name.
+        if data == "[DONE]":  # OpenAI-style end marker.
+            done = True  # Stop yielding.
+            continue  # Drain the rest of the body.
+        yield data  # Raw JSON payload.
 
 
 class LLMClient:  # Define a client wrapper for your LLM calls.
-    def __init__(self) -> None:  # Initialize client.
+    def __init__(self, pool: Optional[LLMHttpPool] = None) -> None:  # Initialize client (pass the app's shared pool).
         self.base_url = os.getenv("LLM_BASE_URL", "").strip()  # Read base URL from env.
         self.model = os.getenv("LLM_MODEL", "gpt-4o-mini").strip()  # Read model name from env.
         self.api_key = os.getenv("LLM_API_KEY", "").strip()  # Read API key from env.
+        self.pool = pool or LLMHttpPool()  # Shared keep-alive pool (one per app, not one per request).
+
+    async def aclose(self) -> None:  # Close the underlying pool.
+        await self.pool.aclose()  # Close connections.
+
+    async def generate_stream(self, user_text: str) -> AsyncGenerator[str, None]:  # Stream assistant output for one message.
+        async for delta in self.stream_chat([{"role": "user", "content": user_text}]):  # Single-turn prompt.
+            yield delta  # Delta.
 
-    async def generate_stream(self, user_text: str) -> AsyncGenerator[str, None]:  # Stream assistant output.
+    async def stream_chat(self, messages: List[Dict[str, str]]) -> AsyncGenerator[str, None]:  # Stream output for a message list.
+        user_text = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")  # Latest user message.
         # If no base_url/api_key configured, we run a safe demo stream so frontend works.
         if not self.base_url or not self.api_key:  # Check configuration.
             demo = f"Demo response (no LLM configured): you said -> {user_text}"  # Create demo text.
-            for ch in demo:  # Stream character-by-character to mimic tokens.
-                await asyncio.sleep(0.01)  # Tiny delay to show streaming effect.
-                yield ch  # Yield one character as a delta.
+            with LLMCall("demo") as call:  # Same metrics as a real call.
+                call.connected()  # No network.
+                for word in re.findall(r"\S+\s*", demo):  # Stream word-by-word, like real token chunks.
+                    await asyncio.sleep(0.01)  # Tiny delay to show streaming effect.
+                    call.delta()  # Count delta.
+                    yield word  # Yield one word (with its trailing space) as a delta.
             return  # End generator.
 
         # Example generic LLM call (you will adapt this to your VOX/OpenAI gateway later).
@@ -201,43 +904,151 @@ class LLMClient:  # Define a client wrapper for your LLM calls.
         payload = {  # Prepare minimal payload.
             "model": self.model,  # Model name.
             "input": user_text,  # User input.
+            "messages": messages,  # Summary + recent turns (from context.py).
             "stream": True,  # Ask server to stream (depends on provider).
         }
 
-        async with httpx.AsyncClient(timeout=None) as client:  # Create async HTTP client with no timeout for streams.
-            async with client.stream("POST", f"{self.base_url}/chat", headers=headers, json=payload) as r:  # Make streaming request.
+        with LLMCall("http") as call:  # Connect time, time to first token, tokens/sec, errors (/metrics).
+            async with self.pool.stream("POST", f"{self.base_url}/chat", headers=headers, json=payload) as r:  # Streaming request on a pooled connection.
+                call.connected()  # Headers received.
                 r.raise_for_status()  # Raise if server returns error.
                 async for line in r.aiter_lines():  # Iterate incoming lines.
                     if not line:  # Skip empty lines.
                         continue  # Continue loop.
                     # In real providers you parse event format; here we just yield raw line text.
+                    call.delta()  # Count delta.
                     yield line  # Yield delta to caller.
 
 
 ✅ Today it works even without LLM credentials.
-Later we’ll replace payload/parsing to match your VOX token + LLM API (from your screenshots) and keep the same generate_stream() interface.
+The VOX client in mcall.py reuses LLMHttpPool and iter_sse_data, so both providers share one connection pool and the same generate_stream() / stream_chat(messages) interface.
 
 7) backend/app/routes_chat.py (all APIs + SSE streaming)
-import json  # Import json to serialize SSE payloads.
-from fastapi import APIRouter, HTTPException, Query  # Import router tools and HTTPException for errors.
+import time  # Import time to measure coalescing delay.
+import asyncio  # Import asyncio to wait for deltas with a flush deadline.
+import logging  # Import logging to report per-stream framing stats.
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response  # Import router tools and HTTPException for errors.
 from fastapi.responses import StreamingResponse  # Import StreamingResponse for SSE streaming.
-from typing import AsyncGenerator  # Import AsyncGenerator for streaming generator.
+from typing import AsyncGenerator, AsyncIterator, List, Optional  # Import AsyncGenerator for streaming generator.
 from .schemas import CreateChatRequest, RenameChatRequest, SendMessageRequest  # Import request schemas.
 from .storage_json import JsonChatStore  # Import JSON storage layer.
 from .llm_client import LLMClient  # Import LLM client wrapper.
+from .streams import StreamRegistry, StreamSession, parse_last_event_id  # Import resumable stream registry.
+from .context import ContextBuilder  # Import token-budgeted prompt builder.
+from .scheduler import QueueFull, StreamScheduler  # Import admission control for LLM streams.
 
 
 router = APIRouter(prefix="/api", tags=["chat"])  # Create a router with /api prefix and tag it.
+log = logging.getLogger(__name__)  # Module logger.
+
+SSE_HEADERS = {  # Headers for streaming responses.
+    "Cache-Control": "no-cache",  # Never cache a live stream.
+    "X-Accel-Buffering": "no",  # Tell nginx-style proxies not to buffer.
+}
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:  # If-None-Match check (weak comparison, as the spec requires).
+    if not if_none_match:  # Unconditional request.
+        return False  # Send the body.
+    tags = [t.strip() for t in if_none_match.split(",")]  # One or more tags.
+    return "*" in tags or any((t[2:] if t.startswith("W/") else t) == etag for t in tags)  # Any match.
+
+
+def not_modified(etag: str) -> Response:  # 304 with the validator headers only.
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})  # No body, nothing serialized.
+
 
+class DeltaCoalescer:  # Merge small LLM deltas into fewer SSE frames (flush on a time window or byte threshold).
+    def __init__(self, window_ms: float = 30.0, max_bytes: int = 512) -> None:  # Configure flush policy.
+        self.window = window_ms / 1000.0  # Max time a delta may wait in the buffer.
+        self.max_bytes = max_bytes  # Flush as soon as the buffer holds this many characters.
+        self.frames = 0  # Frames emitted.
+        self.deltas = 0  # Deltas received from the LLM.
+        self.delay_total = 0.0  # Sum of the wait of the oldest delta in each frame.
+        self.delay_max = 0.0  # Worst wait added by coalescing.
 
-def sse_event(event: str, data_obj: dict) -> str:  # Create a helper to format SSE event frames.
-    return f"event: {event}\n" f"data: {json.dumps(data_obj)}\n\n"  # Return correctly formatted SSE string.
+    def _flush(self, parts: List[str], first_at: float) -> str:  # Join the buffer into one frame and record stats.
+        delay = time.monotonic() - first_at  # How long the oldest delta waited.
+        self.frames += 1  # Count frame.
+        self.delay_total += delay  # Accumulate delay.
+        self.delay_max = max(self.delay_max, delay)  # Track worst case.
+        return "".join(parts)  # One join per frame (no quadratic string growth).
+
+    async def frames_from(self, deltas: AsyncIterator[str]) -> AsyncGenerator[str, None]:  # Re-chunk a delta stream.
+        it = deltas.__aiter__()  # Source iterator.
+        parts: List[str] = []  # Buffered deltas.
+        size = 0  # Buffered characters.
+        first_at = 0.0  # When the oldest buffered delta arrived.
+        pending: Optional[asyncio.Future] = None  # In-flight __anext__ call.
+        try:  # Always release the source on exit.
+            while True:  # Until the source is exhausted.
+                if pending is None:  # Ask for the next delta.
+                    pending = asyncio.ensure_future(it.__anext__())  # Run it as a task so we can time out.
+                timeout = max(0.0, first_at + self.window - time.monotonic()) if parts else None  # Deadline of the buffer.
+                done, _ = await asyncio.wait({pending}, timeout=timeout)  # Wait for a delta or the deadline.
+                if not done:  # Window elapsed with data buffered.
+                    yield self._flush(parts, first_at)  # Send what we have.
+                    parts, size = [], 0  # Reset buffer.
+                    continue  # Keep waiting for the same pending delta.
+                task, pending = pending, None  # Delta (or end) arrived.
+                try:  # Unwrap result.
+                    delta = task.result()  # Next delta.
+                except StopAsyncIteration:  # Source finished.
+                    break  # Flush remainder below.
+                if not delta:  # Ignore empty deltas.
+                    continue  # Next.
+                self.deltas += 1  # Count delta.
+                if not parts:  # Buffer was empty.
+                    first_at = time.monotonic()  # Start the window.
+                parts.append(delta)  # Buffer it.
+                size += len(delta)  # Track size.
+                if self.frames == 0 or size >= self.max_bytes:  # First frame goes out at once (time to first token).
+                    yield self._flush(parts, first_at)  # Send frame.
+                    parts, size = [], 0  # Reset buffer.
+            if parts:  # Leftover deltas.
+                yield self._flush(parts, first_at)  # Final frame.
+        finally:  # Consumer stopped early or source finished.
+            if pending is not None:  # A read is still running.
+                pending.cancel()  # Stop it.
+                try:  # Wait for the cancellation to land.
+                    await pending  # Settle task.
+                except (asyncio.CancelledError, StopAsyncIteration, Exception):  # Expected outcomes.
+                    pass  # Ignore.
+            aclose = getattr(it, "aclose", None)  # Async generators can be closed explicitly.
+            if aclose is not None:  # Close upstream (releases the HTTP stream).
+                await aclose()  # Close source.
+
+    def stats(self) -> dict:  # Framing stats for the done event and logs.
+        return {  # Stats payload.
+            "frames": self.frames,  # Frames sent.
+            "deltas": self.deltas,  # Deltas received.
+            "coalesceDelayMsAvg": round(1000 * self.delay_total / self.frames, 2) if self.frames else 0.0,  # Mean added latency.
+            "coalesceDelayMsMax": round(1000 * self.delay_max, 2),  # Worst added latency.
+        }
 
 
 @router.get("/chats")  # Define endpoint: GET /api/chats
-async def get_chats(search: str = Query(default="")):  # Accept optional search query.
+async def get_chats(  # List chats, optionally one page at a time.
+    response: Response,  # Used to return the next-page cursor header.
+    search: str = Query(default=""),  # Accept optional search query.
+    limit: Optional[int] = Query(default=None, ge=1, le=500),  # Page size (omit for the full list).
+    cursor: Optional[str] = Query(default=None),  # Opaque cursor from the previous page's X-Next-Cursor.
+    if_none_match: Optional[str] = Header(default=None),  # ETag of the copy the client already has.
+):
     store = router.state.store  # Access shared store injected from app startup.
-    chats = await store.list_chats(search=search)  # Load chats from JSON file.
+    etag = f'"{await store.version()}"'  # Read before the data: a write in between only costs the client a refetch.
+    if etag_matches(if_none_match, etag):  # Nothing changed since the client's copy.
+        return not_modified(etag)  # Skip reading + serializing.
+    response.headers["ETag"] = etag  # Same URL + same store version = same body.
+    response.headers["Cache-Control"] = "no-cache"  # Browsers may keep it but must revalidate (fetch sends If-None-Match itself).
+    if search.strip():  # Full-text search over titles + message bodies (ranked, not paginated).
+        return await store.search_chats(search, limit=limit or 50)  # Summaries + matching message snippets.
+    try:  # Bad cursors are client errors.
+        chats, next_cursor = await store.page_chats(search=search, limit=limit, cursor=cursor)  # Read from the in-memory indexes.
+    except ValueError:  # Cursor could not be decoded.
+        raise HTTPException(status_code=400, detail="Invalid cursor")  # Return 400.
+    if next_cursor:  # More chats are available.
+        response.headers["X-Next-Cursor"] = next_cursor  # Body stays a plain array for existing clients.
     return chats  # Return list (frontend expects array of summaries).
 
 
@@ -269,34 +1080,3597 @@ async def delete_chat(chat_id: str):  # Accept chat id.
 
 
 @router.get("/chats/{chat_id}/messages")  # Define endpoint: GET /api/chats/{id}/messages
-async def get_messages(chat_id: str):  # Accept chat id.
+async def get_messages(  # Return a chat's messages, optionally the newest `limit` before a message id.
+    chat_id: str,  # Accept chat id.
+    response: Response,  # Used to return the next-page cursor header.
+    limit: Optional[int] = Query(default=None, ge=1, le=500),  # Page size (omit for the whole history).
+    before: Optional[str] = Query(default=None),  # Only messages older than this message id.
+    cursor: Optional[str] = Query(default=None),  # Alias of `before` (value of X-Next-Cursor).
+    since: Optional[str] = Query(default=None),  # Delta: messages added or changed after this ETag value.
+    after: Optional[str] = Query(default=None),  # Delta: messages added after this message id.
+    if_none_match: Optional[str] = Header(default=None),  # ETag of the copy the client already has.
+):
     store = router.state.store  # Access JSON store.
     try:  # Try reading.
-        msgs = await store.list_messages(chat_id=chat_id)  # Load messages for chat.
-        return msgs  # Return messages list.
+        etag = f'"{await store.version(chat_id)}"'  # This chat's history version (before the data, like /chats).
+        if etag_matches(if_none_match, etag):  # Nothing changed since the client's copy.
+            return not_modified(etag)  # Skip reading + serializing.
+        response.headers["ETag"] = etag  # Same URL + same history version = same body.
+        response.headers["Cache-Control"] = "no-cache"  # Revalidate on every use.
+        if since or after:  # Delta sync.
+            msgs = await store.messages_since(chat_id=chat_id, since=since, after=after)  # Only what is new.
+            if msgs is not None:  # Tag from this store epoch (or an `after` id).
+                response.headers["X-Delta"] = "1"  # Merge by id into the client's copy.
+                return msgs  # Changed messages (oldest first).
+        msgs, next_before = await store.page_messages(chat_id=chat_id, limit=limit, before=before or cursor)  # Load one window.
     except KeyError:  # If missing.
         raise HTTPException(status_code=404, detail="Chat not found")  # Return 404.
+    except ValueError:  # Unknown message id.
+        raise HTTPException(status_code=400, detail="Invalid cursor")  # Return 400.
+    if next_before:  # Older messages exist.
+        response.headers["X-Next-Cursor"] = next_before  # Pass back as `before` to load the previous page.
+    return msgs  # Return messages list (oldest first).
 
 
 @router.post("/chats/{chat_id}/stream")  # Define endpoint: POST /api/chats/{id}/stream
-async def post_stream(chat_id: str, body: SendMessageRequest):  # Accept chat id + user message.
+async def post_stream(chat_id: str, body: SendMessageRequest, request: Request):  # Accept chat id + user message.
     store = router.state.store  # Access JSON store.
     llm = router.state.llm  # Access LLM client.
+    streams: StreamRegistry = router.state.streams  # Access stream registry.
+    context: ContextBuilder = router.state.context  # Access prompt builder.
+    scheduler: StreamScheduler = router.state.scheduler  # Access admission control.
+    checkpoint_s = getattr(router.state, "checkpoint_ms", 1000.0) / 1000.0  # How often partial text is saved.
 
-    try:  # Ensure chat exists by appending message; KeyError if missing.
-        await store.append_message(chat_id=chat_id, role="user", content=body.message)  # Save user message to JSON.
-    except KeyError:  # If chat missing.
-        raise HTTPException(status_code=404, detail="Chat not found")  # Return 404.
+    user = request.headers.get("X-User-Id") or (request.client.host if request.client else "anonymous")  # Fairness key.
+    try:  # Admit, queue, or reject before touching the store.
+        ticket = scheduler.reserve(user)  # Slot now or a place in the queue.
+    except QueueFull as e:  # Queue is full.
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})  # Ask to retry later.
+
+    handed_off = False  # Set once the stream task owns the ticket (it releases the slot when it ends).
+    try:  # Any failure before that (404, store or context errors) must give the slot back.
+        try:  # Ensure chat exists by appending message; KeyError if missing.
+            await store.append_message(chat_id=chat_id, role="user", content=body.message)  # Save user message to JSON.
+            reply = await store.append_message(chat_id=chat_id, role="assistant", content="", status="streaming")  # Placeholder, filled by checkpoints.
+            messages = await context.build(chat_id)  # Summary + newest turns within the token budget.
+        except KeyError:  # If chat missing.
+            raise HTTPException(status_code=404, detail="Chat not found")  # Return 404 (the slot is released below).
+
+        coalescer = DeltaCoalescer(  # Fewer, larger SSE frames.
+            window_ms=getattr(router.state, "coalesce_ms", 30.0),  # Flush window (set in main.py).
+            max_bytes=getattr(router.state, "coalesce_bytes", 512),  # Flush threshold (set in main.py).
+        )
+
+        async def generate(session: StreamSession) -> None:  # Runs as a background task (survives client disconnects).
+            failed = True  # Cleared once the final text is saved.
+            try:  # Wrap streaming in try to send error event.
+                session.publish("stream", {"streamId": session.id, "messageId": session.message_id})  # Ids for reconnects.
+                if not ticket.ready:  # Over the concurrency limit.
+                    session.publish("queued", {"position": ticket.position()})  # Let the UI show it is waiting.
+                await ticket.acquire()  # Wait for a slot (cancelled if the client leaves meanwhile).
+                checkpoint_at = time.monotonic() + checkpoint_s  # Next checkpoint.
+                async for text in coalescer.frames_from(llm.stream_chat(messages)):  # Coalesced LLM deltas.
+                    session.publish("delta", {"text": text})  # Buffered for every current and future subscriber.
+                    if time.monotonic() >= checkpoint_at:  # Save partial text so a crash or reload loses little.
+                        await store.update_message(chat_id, reply["id"], session.text(), status="streaming", durable=False)  # Checkpoint.
+                        checkpoint_at = time.monotonic() + checkpoint_s  # Schedule next one.
+                await store.update_message(chat_id, reply["id"], session.text())  # Persist final assistant message.
+                failed = False  # Saved.
+                context.schedule_summary(chat_id)  # Fold turns that left the window into the summary (background).
+                stats = coalescer.stats()  # Framing stats.
+                log.info("stream chat=%s id=%s %s", chat_id, session.id, stats)  # Report frames + added latency.
+                session.publish("done", stats)  # Send SSE done event (with framing stats).
+            except Exception as e:  # Catch any error during streaming.
+                session.publish("error", {"message": str(e)})  # Send SSE error event to frontend.
+            finally:  # Error or cancellation: keep whatever was generated.
+                ticket.release()  # Free the slot for the next queued stream.
+                if failed:  # Final save did not happen.
+                    try:  # Chat may have been deleted meanwhile.
+                        await store.update_message(chat_id, reply["id"], session.text(), status="error")  # Mark partial reply.
+                    except KeyError:  # Chat or message gone.
+                        pass  # Nothing to save.
+
+        session = streams.start(chat_id, reply["id"], generate)  # Start generation independent of this connection.
+        handed_off = True  # generate() releases the ticket from here on.
+    finally:  # Success or error.
+        if not handed_off:  # Stream never started.
+            ticket.release()  # Give the slot back.
+
+    headers = {**SSE_HEADERS, "X-Stream-Id": session.id}  # Stream id also travels in the first event.
+    return StreamingResponse(session.subscribe(), media_type="text/event-stream", headers=headers)  # Return SSE streaming response (never gzipped, see main.py).
+
+
+@router.get("/streams/{stream_id}")  # Define endpoint: GET /api/streams/{id}
+async def resume_stream(  # Reconnect to a running (or recently finished) stream.
+    stream_id: str,  # Stream id from X-Stream-Id / the "stream" event.
+    last_event_id: Optional[str] = Header(default=None),  # Standard SSE Last-Event-ID header.
+):
+    session = router.state.streams.get(stream_id)  # Look up session.
+    if session is None:  # Unknown or expired (the saved message has the text).
+        raise HTTPException(status_code=404, detail="Stream not found")  # Return 404.
+    after = parse_last_event_id(last_event_id)  # Last event the client saw.
+    return StreamingResponse(session.subscribe(after), media_type="text/event-stream", headers=SSE_HEADERS)  # Replay + follow live.
+
+
+@router.get("/scheduler")  # Define endpoint: GET /api/scheduler
+async def get_scheduler():  # Queue depth, wait times and limits.
+    return router.state.scheduler.stats()  # Stats snapshot.
+8) backend/app/storage_journal.py (append-only journal mode)
+Same methods as JsonChatStore, but every change is one JSON line appended to chats.json.journal
+instead of a full rewrite of chats.json. The journal is folded into the snapshot in the background.
+
+import json  # Import json to encode journal lines and snapshots.
+import os  # Import os for file paths, fsync and atomic rename.
+import uuid  # Import uuid to generate unique IDs.
+import time  # Import time to measure lock and commit waits.
+import asyncio  # Import asyncio for the store lock and background compaction.
+import logging  # Import logging to report failed background compactions.
+from typing import Any, Dict, List, Optional  # Import types for clarity.
+from .storage_json import ChatIndex, GroupCommitWriter, JsonChatStore, now_iso  # Reuse indexes, writer, read API + timestamps.
+from .context import count_tokens  # Import token counter (counts are journaled with each message).
+from .metrics import STORE_BYTES, STORE_COMMIT_WAIT, STORE_IO, STORE_LOCK_WAIT  # Import store metrics (/metrics).
+
+log = logging.getLogger(__name__)  # Module logger.
+
+
+class JournalChatStore(JsonChatStore):  # JSON store that logs mutations to a JSONL journal instead of rewriting the file.
+    def __init__(  # Initialize with snapshot path, compaction threshold and durability settings.
+        self,  # Instance.
+        file_path: str,  # Snapshot file path.
+        compact_bytes: int = 4 * 1024 * 1024,  # Journal size that triggers compaction.
+        durability: str = "commit",  # "commit" waits for fsync; "memory" returns once applied in memory.
+        commit_window_ms: float = 5.0,  # Batching window for journal fsyncs.
+    ) -> None:  # No return value.
+        super().__init__(file_path, durability=durability, commit_window_ms=commit_window_ms)  # Shared indexes, search, seq.
+        self.journal_path = f"{file_path}.journal"  # Active journal file (one mutation per line).
+        self.old_journal_path = f"{file_path}.journal.old"  # Journal being folded into the snapshot.
+        self.compact_bytes = compact_bytes  # Journal size that triggers a background compaction.
+        self._loaded = False  # Whether snapshot + journal were loaded.
+        self._journal = None  # Open append handle for the active journal.
+        self._journal_bytes = 0  # Current size of the active journal.
+        self._compact_task: Optional[asyncio.Task] = None  # Running compaction task, if any.
+        self._pending: List[bytes] = []  # Encoded journal lines waiting for the next group commit.
+        self._writer = GroupCommitWriter(self._take_pending, self._write_lines, commit_window_ms)  # Batches journal fsyncs.
+
+    # -----------------------------
+    # Loading + crash recovery
+    # -----------------------------
+    def _replay_file(self, path: str) -> int:  # Replay one journal file; return the byte offset of the last good line.
+        good = 0  # Offset after the last complete, parseable line.
+        if not os.path.exists(path):  # Nothing to replay.
+            return good  # Return zero offset.
+        with open(path, "rb") as f:  # Read raw bytes so offsets are exact.
+            for raw in f:  # Iterate journal lines.
+                if not raw.endswith(b"\n"):  # Last line was cut off by a crash.
+                    break  # Stop at the torn write.
+                try:  # Parse the entry.
+                    op = json.loads(raw)  # Decode JSON line.
+                except ValueError:  # Corrupt line (torn write).
+                    break  # Stop replay here.
+                if op.get("seq", 0) > self._seq:  # Skip entries already contained in the snapshot.
+                    self._apply(op)  # Apply mutation to memory.
+                good += len(raw)  # Advance the good offset.
+        return good  # Return truncation point.
+
+    def _load(self) -> None:  # Load snapshot, then replay old + active journals (runs in a worker thread).
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)  # Create parent directory if missing.
+        self._index = ChatIndex([])  # Empty store by default.
+        self._seq = 0  # No mutations applied yet.
+        self._search = None  # Built after replay (replayed ops must not touch a half-loaded index).
+        if os.path.exists(self.file_path):  # Snapshot exists.
+            data = self._parse_file()  # Read + parse snapshot (timed).
+            self._index = ChatIndex(data.get("chats", []))  # Restore chats + build indexes.
+            self._seq = data.get("seq", 0)  # Restore last folded sequence number.
+        self._replay_file(self.old_journal_path)  # Replay a journal whose compaction did not finish.
+        good = self._replay_file(self.journal_path)  # Replay the active journal.
+        self._search = self._load_search(self._index.chats())  # Last checkpoint caught up to the final seq, else rebuild.
+        self._journal = open(self.journal_path, "ab")  # Open active journal for appends.
+        self._journal.truncate(good)  # Drop a torn trailing line so new entries start clean.
+        self._journal_bytes = good  # Track journal size.
+        self._loaded = True  # Mark as loaded.
+
+    async def _read(self) -> ChatIndex:  # Return the in-memory indexes, loading snapshot + journal on first use.
+        if not self._loaded:  # Only load once.
+            async with self._lock:  # Prevent two concurrent first calls from loading twice.
+                if not self._loaded:  # Re-check inside lock.
+                    await asyncio.to_thread(self._load)  # Load snapshot + journal off the event loop.
+        return self._index  # Return live indexes.
+
+    # -----------------------------
+    # Mutations
+    # -----------------------------
+    def _apply(self, op: Dict[str, Any]) -> None:  # Apply one mutation to the in-memory state.
+        kind = op["op"]  # Mutation type.
+        search = self._search  # None while replaying at startup.
+        if kind == "create":  # New chat.
+            chat = dict(op["chat"], messages=[], version=op.get("seq", 0))  # Fresh copy (the op dict stays immutable).
+            self._index.add(chat)  # Index it.
+            if search is not None:  # Live update.
+                search.add_chat(chat)  # Index title.
+        elif kind == "rename":  # Title change.
+            chat = self._index.get(op["id"])  # Find chat.
+            if chat is not None:  # Ignore entries for chats deleted later.
+                chat["title"] = op["title"]  # Update title.
+                self._index.touch(chat, op["updatedAt"])  # Update timestamp + order.
+                if search is not None:  # Live update.
+                    search.set_title(op["id"], op["title"])  # Re-index title.
+        elif kind == "delete":  # Chat removal.
+            self._index.remove(op["id"])  # Remove from every index.
+            if search is not None:  # Live update.
+                search.remove_chat(op["id"])  # Drop from search.
+        elif kind == "append":  # New message.
+            chat = self._index.get(op["chatId"])  # Find chat.
+            if chat is not None:  # Ignore entries for deleted chats.
+                self._index.add_message(chat, op["message"])  # Append message.
+                self._index.touch(chat, op["updatedAt"])  # Update timestamp + order.
+                chat["version"] = op.get("seq", 0)  # History changed at this version.
+                if search is not None:  # Live update.
+                    search.add_message(op["chatId"], op["message"])  # Index body.
+        elif kind == "update":  # New version of a message.
+            chat = self._index.get(op["chatId"])  # Find chat.
+            old = self._index.replace_message(chat, op["message"]) if chat is not None else None  # Swap in.
+            if old is not None:  # Message still exists.
+                chat["version"] = op.get("seq", 0)  # History changed at this version.
+            if old is not None and search is not None:  # Live update.
+                search.update_message(op["chatId"], old, op["message"])  # Re-index body.
+        elif kind == "summary":  # Rolling summary of older turns.
+            chat = self._index.get(op["id"])  # Find chat.
+            if chat is not None:  # Ignore entries for deleted chats.
+                chat["summary"] = op["summary"]  # Replace summary.
+        self._seq = max(self._seq, op.get("seq", 0))  # Track applied sequence number.
+
+    def _take_pending(self) -> List[bytes]:  # Hand buffered lines to the writer (runs on the loop).
+        lines, self._pending = self._pending, []  # Swap buffer.
+        return lines  # Lines for this batch.
+
+    def _write_lines(self, lines: List[bytes]) -> None:  # Append a batch of lines with one fsync (runs in a worker thread).
+        if not lines:  # Nothing buffered (e.g. drain with no changes).
+            return  # Skip the fsync.
+        batch = b"".join(lines)  # One buffer for the whole batch.
+        STORE_BYTES.observe(len(batch), "journal")  # Size.
+        with STORE_IO.time("journal"):  # Append + fsync.
+            self._journal.write(batch)  # One write for the whole batch.
+            self._journal.flush()  # Push to OS.
+            os.fsync(self._journal.fileno())  # One fsync covers every line in the batch.
+
+    def _log(self, op: Dict[str, Any], durable: Optional[bool]) -> Optional[asyncio.Future]:  # Apply + queue one mutation (caller holds lock).
+        op["seq"] = self._seq + 1  # Assign next sequence number.
+        if "message" in op:  # Append/update: the message carries the version it was written at.
+            op["message"]["version"] = op["seq"]  # Journaled with it, so replay restores it.
+        line = (json.dumps(op, ensure_ascii=False) + "\n").encode("utf-8")  # Encode as one JSONL line.
+        self._pending.append(line)  # Queue for the next group commit.
+        self._journal_bytes += len(line)  # Track journal size.
+        self._apply(op)  # Change is visible in memory right away.
+        wait = self.durability == "commit" if durable is None else durable  # Per-call override of the store default.
+        fut = self._writer.request(wait=wait)  # Join the next batch.
+        if self._journal_bytes >= self.compact_bytes and (self._compact_task is None or self._compact_task.done()):  # Threshold hit.
+            self._compact_task = asyncio.create_task(self._compact())  # Compact in the background.
+        return fut  # Caller awaits it outside the lock so other writers can join the batch.
+
+    async def _journal_op(self, op: Dict[str, Any], chat_id: Optional[str], durable: Optional[bool]) -> None:  # Validate, journal, wait.
+        await self._read()  # Load on first use.
+        started = time.perf_counter()  # Lock wait clock.
+        async with self._lock:  # Serialize journal appends.
+            STORE_LOCK_WAIT.observe(time.perf_counter() - started, "journal")  # Behind other appends / compaction.
+            if chat_id is not None and self._index.get(chat_id) is None:  # Unknown chat.
+                raise KeyError("Chat not found")  # Raise not found.
+            fut = self._log(op, durable)  # Journal + apply.
+        if fut is not None:  # Durable commit requested.
+            started = time.perf_counter()  # Commit wait clock.
+            await fut  # Wait for fsync.
+            STORE_COMMIT_WAIT.observe(time.perf_counter() - started, "journal")  # Batching window + fsync.
+
+    # -----------------------------
+    # Compaction
+    # -----------------------------
+    def _rotate(self) -> None:  # Move the active journal aside and start a fresh one (worker thread; caller holds lock).
+        self._journal.close()  # Close active handle.
+        try:  # Appends must keep working even if the move fails.
+            if os.path.exists(self.old_journal_path):  # A previous compaction did not finish.
+                with open(self.old_journal_path, "ab") as dst, open(self.journal_path, "rb") as src:  # Merge into it.
+                    dst.write(src.read())  # Keep every entry until a snapshot covers it.
+                    dst.flush()  # Push to OS.
+                    os.fsync(dst.fileno())  # Make merge durable.
+                os.remove(self.journal_path)  # Remove merged journal.
+            else:  # Normal case.
+                os.replace(self.journal_path, self.old_journal_path)  # Atomic rename.
+            self._journal_bytes = 0  # Reset size.
+        finally:  # Moved or not.
+            self._journal = open(self.journal_path, "ab")  # Fresh active journal (the same one again if the move failed; replay skips duplicates by seq).
+
+    def _write_snapshot(self, snapshot: Dict[str, Any]) -> None:  # Write snapshot atomically (runs in a worker thread).
+        self._write_file(snapshot)  # Temp file + fsync + rename.
+        if os.path.exists(self.old_journal_path):  # Folded journal is no longer needed.
+            os.remove(self.old_journal_path)  # Remove it.
+
+    async def _compact(self) -> None:  # Fold journal into the snapshot without blocking writers (failures are logged; the next one retries).
+        try:  # Background task: nobody awaits its result except close().
+            async with self._lock:  # Short critical section: drain + rotate + copy references.
+                await self._writer.drain()  # Everything applied so far is in the active journal.
+                await asyncio.to_thread(self._rotate)  # New writes go to a fresh journal.
+                snapshot = self._snapshot()  # Point-in-time copy (messages are never mutated, so list copies are enough).
+            await asyncio.to_thread(self._write_snapshot, snapshot)  # Serialize + write off the event loop.
+        except Exception:  # Disk full, etc.
+            log.warning("journal compaction failed", exc_info=True)  # The journal still holds every change.
+            return  # Skip the search checkpoint too.
+        await self._checkpoint_search()  # Search index checkpoint alongside the snapshot.
+
+    async def close(self) -> None:  # Finish compaction, flush pending lines and close the journal.
+        if self._compact_task is not None:  # Compaction in flight.
+            await self._compact_task  # Wait for it (never raises: errors were logged).
+        await self._writer.close()  # Final group commit.
+        await self._save_search(flush=False)  # Persist search index with the current seq.
+        if self._journal is not None:  # Journal open.
+            self._journal.close()  # Close handle.
+            self._journal = None  # Clear handle.
+            self._loaded = False  # Next use reloads from disk.
+
+    # -----------------------------
+    # Mutating API (reads are inherited from JsonChatStore)
+    # -----------------------------
+    async def create_chat(self, title: str, durable: Optional[bool] = None) -> Dict[str, Any]:  # Create a new chat.
+        chat = {"id": str(uuid.uuid4()), "title": title or "New chat", "updatedAt": now_iso(), "messages": []}  # Build chat.
+        await self._journal_op({"op": "create", "chat": chat}, None, durable)  # Journal + apply.
+        return {"id": chat["id"], "title": chat["title"], "updatedAt": chat["updatedAt"]}  # Return summary.
+
+    async def rename_chat(self, chat_id: str, title: str, durable: Optional[bool] = None) -> None:  # Rename an existing chat.
+        await self._journal_op({"op": "rename", "id": chat_id, "title": title, "updatedAt": now_iso()}, chat_id, durable)  # Journal + apply.
+
+    async def delete_chat(self, chat_id: str, durable: Optional[bool] = None) -> None:  # Delete a chat.
+        await self._journal_op({"op": "delete", "id": chat_id}, chat_id, durable)  # Journal + apply.
+
+    async def append_message(  # Add a message.
+        self, chat_id: str, role: str, content: str, durable: Optional[bool] = None, status: Optional[str] = None
+    ) -> Dict[str, Any]:
+        msg = {"id": str(uuid.uuid4()), "role": role, "content": content, "createdAt": now_iso(), "tokens": count_tokens(content)}  # Build message.
+        if status:  # E.g. "streaming" for an assistant placeholder.
+            msg["status"] = status  # Store status.
+        await self._journal_op({"op": "append", "chatId": chat_id, "message": msg, "updatedAt": now_iso()}, chat_id, durable)  # Journal + apply.
+        return msg  # Return created message.
+
+    async def update_message(  # Replace a message's content (checkpoints of a streaming reply).
+        self, chat_id: str, message_id: str, content: str, status: Optional[str] = None, durable: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        index = await self._read()  # Load on first use.
+        c = index.get(chat_id)  # O(1) lookup.
+        old = index.get_message(c, message_id) if c is not None else None  # O(1) message lookup.
+        if old is None:  # Unknown chat or message.
+            raise KeyError("Message not found")  # Raise if missing.
+        msg = {k: v for k, v in old.items() if k != "status"}  # New dict; status is cleared unless given.
+        msg["content"] = content  # New content.
+        msg["tokens"] = count_tokens(content)  # Re-count for the new content.
+        if status:  # Still streaming / failed.
+            msg["status"] = status  # Store status.
+        await self._journal_op({"op": "update", "chatId": chat_id, "message": msg}, chat_id, durable)  # Journal + apply.
+        return msg  # Return updated message.
+
+    async def set_summary(self, chat_id: str, summary: Dict[str, Any], durable: Optional[bool] = None) -> None:  # Replace the summary.
+        await self._journal_op({"op": "summary", "id": chat_id, "summary": summary}, chat_id, durable)  # Journal + apply.
+
+9) backend/app/search_index.py (full-text search over titles + messages)
+
+Inverted index behind GET /api/chats?search=. Checkpointed to chats.json.search while the app runs (every
+SEARCH_CHECKPOINT_EVERY changes in plain JSON mode, after each compaction in journal mode) and on shutdown.
+At startup the checkpoint is loaded and only chats changed since its seq are re-indexed, so even after a
+crash startup does not rebuild the whole index; it is rebuilt only if the file is missing, corrupt or ahead of the data.
+
+import json  # Import json to persist the index next to the data file.
+import math  # Import math for idf / tf weighting.
+import os  # Import os for atomic file replace.
+import re  # Import re for tokenization.
+import bisect  # Import bisect for prefix lookups over the sorted term list.
+from collections import Counter  # Import Counter to count term frequency per document.
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple  # Import types for clarity.
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)  # Words = runs of letters/digits/underscore.
+TITLE_WEIGHT = 3.0  # A title hit counts as much as three message hits.
+TITLE_FIELD = ""  # Field key used for the chat title (message fields use the message id).
+
+
+def tokenize(text: str) -> List[str]:  # Split text into lowercase terms.
+    return TOKEN_RE.findall((text or "").lower())  # Lowercase + regex split.
+
+
+def make_snippet(text: str, terms: List[str], width: int = 120) -> str:  # Cut a short window around the first hit.
+    low = text.lower()  # Case-insensitive search.
+    hits = [i for i in (low.find(t) for t in terms) if i >= 0]  # Positions of each query term.
+    start = max(0, min(hits) - width // 3) if hits else 0  # Put the hit roughly a third into the window.
+    snippet = text[start:start + width].strip()  # Cut window.
+    prefix = "…" if start > 0 else ""  # Leading ellipsis when cut.
+    suffix = "…" if start + width < len(text) else ""  # Trailing ellipsis when cut.
+    return f"{prefix}{snippet}{suffix}"  # Return snippet.
+
+
+class SearchIndex:  # Incrementally maintained inverted index over chat titles and message bodies.
+    def __init__(self, seq: int = 0) -> None:  # Create an empty index.
+        self.seq = seq  # Store mutation number of the last load/checkpoint (changes after it are re-indexed on load).
+        self._postings: Dict[str, Dict[str, Dict[str, int]]] = {}  # term -> chat id -> field (title or message id) -> tf.
+        self._terms: List[str] = []  # Sorted term list for prefix matching.
+        self._chat_terms: Dict[str, Set[str]] = {}  # chat id -> every term it contains (for O(terms) removal).
+        self._title_terms: Dict[str, List[str]] = {}  # chat id -> title terms (to re-index on rename).
+
+    # -----------------------------
+    # Incremental updates
+    # -----------------------------
+    def _add(self, chat_id: str, field: str, text: str) -> List[str]:  # Index one field; return its distinct terms.
+        counts = Counter(tokenize(text))  # Term frequencies.
+        for term, n in counts.items():  # Each distinct term.
+            chats = self._postings.get(term)  # Existing postings.
+            if chats is None:  # First time we see this term.
+                chats = self._postings[term] = {}  # New postings dict.
+                bisect.insort(self._terms, term)  # Keep term list sorted.
+            chats.setdefault(chat_id, {})[field] = n  # Record tf.
+        self._chat_terms.setdefault(chat_id, set()).update(counts)  # Remember terms for removal.
+        return list(counts)  # Distinct terms.
+
+    def _drop_term(self, term: str, chat_id: str) -> None:  # Remove a chat from one term's postings.
+        chats = self._postings.get(term)  # Postings.
+        if chats is None:  # Already gone.
+            return  # Nothing to do.
+        chats.pop(chat_id, None)  # Drop chat.
+        if not chats:  # Term no longer used anywhere.
+            del self._postings[term]  # Drop postings.
+            i = bisect.bisect_left(self._terms, term)  # Find in sorted list.
+            if i < len(self._terms) and self._terms[i] == term:  # Present.
+                del self._terms[i]  # Remove.
+
+    def set_title(self, chat_id: str, title: str) -> None:  # (Re)index a chat title.
+        for term in self._title_terms.pop(chat_id, []):  # Old title terms.
+            fields = self._postings.get(term, {}).get(chat_id)  # Fields for this chat.
+            if fields is not None:  # Present.
+                fields.pop(TITLE_FIELD, None)  # Remove title tf.
+                if not fields:  # Term only appeared in the old title.
+                    self._drop_term(term, chat_id)  # Remove posting.
+        self._title_terms[chat_id] = self._add(chat_id, TITLE_FIELD, title)  # Index new title.
+
+    def add_message(self, chat_id: str, msg: Dict[str, Any]) -> None:  # Index one message body.
+        self._add(chat_id, msg["id"], msg.get("content", ""))  # Field key = message id.
+
+    def update_message(self, chat_id: str, old: Dict[str, Any], msg: Dict[str, Any]) -> None:  # Re-index an edited message body.
+        for term in set(tokenize(old.get("content", ""))):  # Terms of the old body.
+            fields = self._postings.get(term, {}).get(chat_id)  # Fields for this chat.
+            if fields is not None:  # Present.
+                fields.pop(old["id"], None)  # Remove message tf.
+                if not fields:  # Term only appeared in this message.
+                    self._drop_term(term, chat_id)  # Remove posting.
+                    self._chat_terms.get(chat_id, set()).discard(term)  # Forget it for this chat.
+        self.add_message(chat_id, msg)  # Index new body.
+
+    def add_chat(self, chat: Dict[str, Any]) -> None:  # Index a whole chat (title + messages).
+        self.set_title(chat["id"], chat.get("title", ""))  # Title.
+        for msg in chat.get("messages", []):  # Messages.
+            self.add_message(chat["id"], msg)  # Body.
+
+    def remove_chat(self, chat_id: str) -> None:  # Drop a chat from the index.
+        for term in self._chat_terms.pop(chat_id, set()):  # Every term the chat used.
+            self._drop_term(term, chat_id)  # Remove posting.
+        self._title_terms.pop(chat_id, None)  # Forget title terms.
+
+    # -----------------------------
+    # Query
+    # -----------------------------
+    def _expand(self, prefix: str) -> List[str]:  # All indexed terms starting with prefix.
+        lo = bisect.bisect_left(self._terms, prefix)  # First candidate.
+        hi = bisect.bisect_left(self._terms, prefix + "\U0010ffff")  # Past the last candidate.
+        return self._terms[lo:hi]  # Matching terms.
+
+    def search(self, query: str, limit: int = 20, max_messages: int = 3) -> List[Tuple[str, float, List[str]]]:  # Ranked (chat id, score, message ids).
+        tokens = tokenize(query)  # Query terms (each one is a prefix).
+        if not tokens:  # Empty query.
+            return []  # No results.
+        n_chats = max(1, len(self._chat_terms))  # Collection size for idf.
+        scores: Optional[Dict[str, float]] = None  # Running AND of per-token scores.
+        msg_hits: Dict[str, Counter] = {}  # chat id -> message id -> number of query tokens it matched.
+        for token in tokens:  # Each query token must match (AND).
+            token_scores: Dict[str, float] = {}  # Scores for this token.
+            token_msgs: Dict[str, Set[str]] = {}  # Messages matching this token.
+            for term in self._expand(token):  # Prefix expansion.
+                chats = self._postings[term]  # Postings.
+                idf = math.log(1.0 + n_chats / len(chats))  # Rare terms count more.
+                for chat_id, fields in chats.items():  # Each chat containing the term.
+                    s = 0.0  # Score contribution.
+                    for field, tf in fields.items():  # Title and/or messages.
+                        s += (TITLE_WEIGHT if field == TITLE_FIELD else 1.0) * (1.0 + math.log(tf))  # Dampened tf.
+                        if field != TITLE_FIELD:  # Message hit.
+                            token_msgs.setdefault(chat_id, set()).add(field)  # Remember for snippets.
+                    token_scores[chat_id] = token_scores.get(chat_id, 0.0) + idf * s  # Accumulate.
+            if scores is None:  # First token.
+                scores = token_scores  # Start with its matches.
+            else:  # Later tokens.
+                scores = {c: scores[c] + token_scores[c] for c in scores if c in token_scores}  # Intersect.
+            for chat_id, ids in token_msgs.items():  # Count per-message token coverage.
+                msg_hits.setdefault(chat_id, Counter()).update(ids)  # +1 per token matched.
+            if not scores:  # Nothing left to intersect.
+                return []  # No results.
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:limit]  # Top chats.
+        return [  # Attach the best-matching messages of each chat.
+            (chat_id, score, [m for m, _ in msg_hits.get(chat_id, Counter()).most_common(max_messages)])  # Most tokens first.
+            for chat_id, score in ranked  # Ranked chats.
+        ]
+
+    # -----------------------------
+    # Persistence
+    # -----------------------------
+    @classmethod
+    def build(cls, chats: Iterable[Dict[str, Any]], seq: int) -> "SearchIndex":  # Full rebuild from chats.
+        index = cls(seq)  # Empty index.
+        for chat in chats:  # Every chat.
+            index.add_chat(chat)  # Index it.
+        return index  # Return built index.
+
+    def snapshot(self) -> Dict[str, Any]:  # Point-in-time copy for write() (on the loop; copies dicts, not strings).
+        postings = {term: {chat_id: dict(fields) for chat_id, fields in chats.items()} for term, chats in self._postings.items()}  # Nested copy.
+        return {"seq": self.seq, "postings": postings, "titles": dict(self._title_terms)}  # Persisted form.
+
+    @staticmethod
+    def write(data: Dict[str, Any], path: str) -> None:  # Persist a snapshot() atomically (blocking; call from a worker thread).
+        raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")  # One C-accelerated pass (json.dump to a file is ~3x slower).
+        tmp = f"{path}.{os.getpid()}.tmp"  # Temp file next to the target (per process: workers may save at once).
+        with open(tmp, "wb") as f:  # Open temp file.
+            f.write(raw)  # One write.
+            f.flush()  # Push to OS.
+            os.fsync(f.fileno())  # Durable before rename.
+        os.replace(tmp, path)  # Atomic swap.
+
+    def save(self, path: str) -> None:  # Persist atomically (blocking; no concurrent updates).
+        self.write(self.snapshot(), path)  # Copy + write.
+
+    @classmethod
+    def load(cls, path: str, seq: int) -> Optional["SearchIndex"]:  # Load a persisted index taken at or before the store's seq.
+        try:  # Missing or corrupt file means rebuild.
+            with open(path, "r", encoding="utf-8") as f:  # Open index file.
+                data = json.load(f)  # Parse.
+        except (OSError, ValueError):  # Not usable.
+            return None  # Caller rebuilds.
+        if not isinstance(data.get("seq"), int) or data["seq"] > seq:  # Ahead of the data (changes lost in a crash): cannot be undone.
+            return None  # Caller rebuilds.
+        index = cls(data["seq"])  # Empty index (catch_up() brings it to the store's seq).
+        index._postings = data.get("postings", {})  # Restore postings.
+        index._title_terms = data.get("titles", {})  # Restore title terms.
+        index._terms = sorted(index._postings)  # Rebuild sorted term list.
+        for term, chats in index._postings.items():  # Rebuild chat -> terms map.
+            for chat_id in chats:  # Each chat.
+                index._chat_terms.setdefault(chat_id, set()).add(term)  # Record term.
+        for chat_id in index._title_terms:  # Chats with empty bodies still count.
+            index._chat_terms.setdefault(chat_id, set())  # Ensure entry.
+        return index  # Return loaded index.
+
+    def catch_up(self, chats: Iterable[Dict[str, Any]], seq: int) -> int:  # Re-index chats changed since this index's seq; return how many.
+        present: Set[str] = set()  # Chats in the data.
+        changed = 0  # Re-indexed chats.
+        for chat in chats:  # One cheap comparison per chat.
+            present.add(chat["id"])  # Still exists.
+            if chat.get("version", 0) > self.seq or self._title_terms.get(chat["id"]) != list(Counter(tokenize(chat.get("title", "")))):  # New, messages added/updated, or renamed.
+                self.remove_chat(chat["id"])  # Old title + bodies.
+                self.add_chat(chat)  # Current title + bodies.
+                changed += 1  # Count.
+        for chat_id in [c for c in self._chat_terms if c not in present]:  # Deleted since the checkpoint.
+            self.remove_chat(chat_id)  # Drop.
+            changed += 1  # Count.
+        self.seq = seq  # Now reflects the data.
+        return changed  # Usually a handful.
+
+
+10) backend/app/streams.py (resumable SSE streams)
+
+Each POST /stream starts a background generation task that writes numbered events into a bounded
+replay buffer. The HTTP response is just one subscriber: if it drops, the client reconnects to
+GET /api/streams/{id} with Last-Event-ID and gets the missed events, then the live ones. If the
+buffer no longer holds them, a "reset" event carries the full text so far instead.
+
+import json  # Import json to serialize SSE payloads.
+import uuid  # Import uuid to generate stream ids.
+import asyncio  # Import asyncio for the background generation task and subscriber wakeups.
+from collections import deque  # Import deque for the bounded replay buffer.
+from typing import AsyncGenerator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple  # Import types for clarity.
+
+
+def sse_event(event: str, data_obj: dict, event_id: Optional[str] = None) -> str:  # Create a helper to format SSE event frames.
+    head = f"id: {event_id}\n" if event_id is not None else ""  # Optional id line (used for Last-Event-ID resume).
+    return f"{head}event: {event}\n" f"data: {json.dumps(data_obj)}\n\n"  # Return correctly formatted SSE string.
+
+
+def parse_last_event_id(value: Optional[str]) -> int:  # "<stream id>:<seq>" or "<seq>" -> seq (0 when missing/garbage).
+    if not value:  # Header absent.
+        return 0  # Replay from the start.
+    try:  # Accept both forms.
+        return int(value.rsplit(":", 1)[-1])  # Sequence number part.
+    except ValueError:  # Not a number.
+        return 0  # Replay from the start.
+
+
+class StreamSession:  # One assistant generation, decoupled from the HTTP connection that started it.
+    def __init__(self, chat_id: str, message_id: str, buffer_events: int) -> None:  # Create an empty session.
+        self.id = str(uuid.uuid4())  # Stream id.
+        self.chat_id = chat_id  # Chat being answered.
+        self.message_id = message_id  # Assistant message being filled in.
+        self.events: Deque[Tuple[int, str, dict]] = deque(maxlen=buffer_events)  # Bounded replay buffer of (seq, event, data).
+        self.seq = 0  # Last published sequence number.
+        self.parts: List[str] = []  # Every delta so far (the full text, for checkpoints and buffer-overflow resets).
+        self.finished = False  # Set once done/error has been published.
+        self.task: Optional[asyncio.Task] = None  # Background generation task.
+        self.subscribers = 0  # Connected clients.
+        self.on_idle: Optional[Callable[[], None]] = None  # Called when the last client disconnects mid-stream.
+        self.idle_timer: Optional[asyncio.TimerHandle] = None  # Pending grace-period check (one per session).
+        self._changed = asyncio.Event()  # Replaced on every publish; subscribers wait on it.
+
+    def text(self) -> str:  # Full assistant text so far.
+        return "".join(self.parts)  # One join.
+
+    def publish(self, event: str, data: dict) -> None:  # Append an event to the buffer and wake subscribers.
+        self.seq += 1  # Next sequence number.
+        if event == "delta":  # Text chunk.
+            self.parts.append(data["text"])  # Keep full text.
+        self.events.append((self.seq, event, data))  # Oldest events fall off when the buffer is full.
+        if event in ("done", "error"):  # Terminal event.
+            self.finished = True  # No more events.
+        changed, self._changed = self._changed, asyncio.Event()  # Swap event so late waiters block again.
+        changed.set()  # Wake current waiters.
+
+    async def subscribe(self, after: int = 0) -> AsyncGenerator[str, None]:  # Replay events after `after`, then follow live.
+        self.subscribers += 1  # Client connected.
+        try:  # Track disconnects.
+            last = after  # Last sequence number the client has.
+            oldest = self.events[0][0] if self.events else self.seq + 1  # Oldest replayable event.
+            if last + 1 < oldest and self.parts:  # Client missed events that were trimmed from the buffer.
+                last = max((s for s, e, _ in self.events if e == "delta"), default=self.seq)  # Newest delta (covered by the text).
+                yield sse_event("reset", {"text": self.text()}, f"{self.id}:{last}")  # Client replaces its partial text.
+            while True:  # Follow the stream.
+                changed = self._changed  # Capture before reading so no publish is missed.
+                for seq, event, data in list(self.events):  # Buffered events.
+                    if seq > last:  # Not yet sent to this client.
+                        yield sse_event(event, data, f"{self.id}:{seq}")  # Numbered frame.
+                        last = seq  # Advance.
+                if self.finished and last >= self.seq:  # Everything delivered.
+                    return  # End response.
+                await changed.wait()  # Sleep until the next publish.
+        finally:  # Finished, or the client went away (the server cancels this generator).
+            self.subscribers -= 1  # Client gone.
+            if self.subscribers == 0 and not self.finished and self.on_idle is not None:  # Nobody is listening.
+                self.on_idle()  # Let the registry cancel the upstream call.
+
+
+class StreamRegistry:  # Live (and recently finished) generations, by stream id.
+    def __init__(self, buffer_events: int = 2048, retain_s: float = 60.0, disconnect_grace_s: float = 20.0) -> None:  # Configure.
+        self.buffer_events = buffer_events  # Replay buffer size per stream.
+        self.retain_s = retain_s  # How long a finished stream stays resumable.
+        self.disconnect_grace_s = disconnect_grace_s  # How long a stream with no clients keeps generating.
+        self._sessions: Dict[str, StreamSession] = {}  # Stream id -> session.
+
+    def get(self, stream_id: str) -> Optional[StreamSession]:  # Look up a session.
+        return self._sessions.get(stream_id)  # Session or None.
+
+    def start(self, chat_id: str, message_id: str, run: Callable[[StreamSession], Awaitable[None]]) -> StreamSession:  # Start a generation task.
+        session = StreamSession(chat_id, message_id, self.buffer_events)  # New session.
+        session.on_idle = lambda: self._idle(session)  # Cancel upstream when every client is gone.
+        self._sessions[session.id] = session  # Register.
+
+        async def runner() -> None:  # Owns the session lifetime.
+            try:  # Generate.
+                await run(session)  # Produces events until done/error.
+            finally:  # Always end the session.
+                if not session.finished:  # Cancelled or crashed before a terminal event.
+                    session.publish("error", {"message": "Stream interrupted"})  # Tell subscribers (and late resumers).
+                asyncio.get_running_loop().call_later(self.retain_s, self._sessions.pop, session.id, None)  # Expire later.
+
+        session.task = asyncio.create_task(runner())  # Runs independently of any HTTP connection.
+        return session  # Caller subscribes to it.
+
+    def _idle(self, session: StreamSession) -> None:  # Last client disconnected before the stream finished.
+        if session.idle_timer is not None:  # An earlier disconnect is still counting down.
+            session.idle_timer.cancel()  # Each disconnect gets the full grace period.
+            session.idle_timer = None  # Cleared.
+        if self.disconnect_grace_s > 0:  # Give the client a chance to resume (default covers the frontend's retry backoff).
+            session.idle_timer = asyncio.get_running_loop().call_later(self.disconnect_grace_s, self._cancel_if_idle, session)  # Check later.
+        else:  # 0: stop paying for tokens nobody reads right away (no resume).
+            self._cancel_if_idle(session)  # Cancel now.
+
+    def _cancel_if_idle(self, session: StreamSession) -> None:  # Cancel the generation unless a client came back.
+        session.idle_timer = None  # Fired (or called directly).
+        if session.subscribers == 0 and session.task is not None and not session.task.done():  # Still abandoned.
+            session.task.cancel()  # Cancels the LLM request (the partial reply is saved with status=error).
+
+    async def aclose(self) -> None:  # Cancel running generations (app shutdown).
+        tasks = [s.task for s in self._sessions.values() if s.task is not None and not s.task.done()]  # Running tasks.
+        for t in tasks:  # Cancel each.
+            t.cancel()  # Request cancellation.
+        await asyncio.gather(*tasks, return_exceptions=True)  # Wait (their checkpoints run in finally blocks).
+
+
+11) backend/app/llm_cache.py (optional LLM response cache)
+
+Wraps the LLM client: identical prompts (same model, temperature and messages after whitespace
+normalization) are replayed from an LRU/TTL cache through the same generate_stream() interface,
+and concurrent identical prompts share one upstream call. Enabled with LLM_CACHE=1 in main.py.
+
+import os  # Import os for the on-disk tier.
+import json  # Import json to hash normalized prompts and store entries.
+import time  # Import time for TTL bookkeeping.
+import asyncio  # Import asyncio for single-flight upstream calls.
+import hashlib  # Import hashlib for cache keys.
+import logging  # Import logging to report disk tier errors.
+from collections import OrderedDict  # Import OrderedDict for LRU order.
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple  # Import types for clarity.
+
+log = logging.getLogger(__name__)  # Module logger.
+
+
+def cache_key(model: Optional[str], temperature: Optional[float], messages: List[Dict[str, Any]]) -> str:  # Normalized prompt hash.
+    norm = {  # Only what changes the answer; whitespace and role case do not.
+        "model": (model or "").strip().lower(),  # Model name.
+        "temperature": None if temperature is None else round(float(temperature), 3),  # Avoid 0.3 vs 0.30000001.
+        "messages": [[str(m.get("role", "")).strip().lower(), " ".join(str(m.get("content", "")).split())] for m in messages],  # Roles + collapsed text.
+    }
+    raw = json.dumps(norm, ensure_ascii=False, separators=(",", ":"), sort_keys=True)  # Stable encoding.
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()  # Hex digest (also a safe file name).
+
+
+class _Flight:  # One upstream call shared by every concurrent identical prompt.
+    def __init__(self) -> None:  # Empty flight.
+        self.chunks: List[str] = []  # Deltas received so far.
+        self.done = False  # Upstream finished.
+        self.error: Optional[BaseException] = None  # Upstream failure, re-raised to every subscriber.
+        self.subscribers = 0  # Active readers (upstream is cancelled when this drops to 0).
+        self.task: Optional[asyncio.Task] = None  # Upstream pump.
+        self._changed = asyncio.Event()  # Replaced on every update.
+
+    def _notify(self) -> None:  # Wake readers.
+        changed, self._changed = self._changed, asyncio.Event()  # Swap event.
+        changed.set()  # Wake.
+
+    async def read(self) -> AsyncGenerator[str, None]:  # Replay received chunks, then follow live.
+        i = 0  # Next chunk to yield.
+        while True:  # Until done.
+            changed = self._changed  # Capture before reading.
+            while i < len(self.chunks):  # New chunks.
+                yield self.chunks[i]  # Delta.
+                i += 1  # Advance.
+            if self.error is not None:  # Upstream failed.
+                raise self.error  # Same error for everyone.
+            if self.done:  # Finished.
+                return  # End.
+            await changed.wait()  # Sleep until the next chunk.
+
+
+class ResponseCache:  # LRU + TTL cache of finished LLM replies, with an optional on-disk tier.
+    def __init__(  # Size limits, TTL and disk directory.
+        self,  # Instance.
+        max_entries: int = 1000,  # Entries kept in memory.
+        max_bytes: int = 32 * 1024 * 1024,  # Characters kept in memory (sum of reply lengths).
+        ttl_s: float = 86400.0,  # Seconds a reply stays valid.
+        disk_dir: Optional[str] = None,  # Directory for the disk tier (None = memory only).
+        max_disk_entries: int = 10000,  # Files kept on disk.
+    ) -> None:  # No return value.
+        self.max_entries = max_entries  # Entry bound.
+        self.max_bytes = max_bytes  # Size bound.
+        self.ttl_s = ttl_s  # TTL.
+        self.disk_dir = disk_dir  # Disk tier.
+        self.max_disk_entries = max_disk_entries  # Disk bound.
+        self._mem: "OrderedDict[str, Tuple[float, List[str], int]]" = OrderedDict()  # key -> (expires at, chunks, size); LRU first.
+        self._bytes = 0  # Current size.
+        self._inflight: Dict[str, _Flight] = {}  # key -> running upstream call.
+        self._disk_writes = 0  # Writes since the last disk prune.
+        self.stats: Dict[str, int] = {"hits": 0, "diskHits": 0, "misses": 0, "shared": 0, "evictions": 0}  # Counters.
+        if disk_dir:  # Disk tier enabled.
+            os.makedirs(disk_dir, exist_ok=True)  # Ensure directory exists.
+
+    # -----------------------------
+    # Memory tier
+    # -----------------------------
+    def _get_mem(self, key: str) -> Optional[List[str]]:  # LRU lookup.
+        entry = self._mem.get(key)  # Entry.
+        if entry is None:  # Miss.
+            return None  # Nothing.
+        if entry[0] < time.time():  # Expired.
+            self._drop(key)  # Evict.
+            return None  # Miss.
+        self._mem.move_to_end(key)  # Most recently used.
+        return entry[1]  # Chunks.
+
+    def _drop(self, key: str) -> None:  # Remove one memory entry.
+        entry = self._mem.pop(key, None)  # Remove.
+        if entry is not None:  # Was present.
+            self._bytes -= entry[2]  # Release size.
+
+    def _put_mem(self, key: str, chunks: List[str], expires_at: float) -> None:  # Insert and evict LRU entries.
+        self._drop(key)  # Replace existing.
+        size = sum(len(c) for c in chunks)  # Entry size.
+        if size > self.max_bytes:  # Would evict everything else.
+            return  # Do not cache in memory.
+        self._mem[key] = (expires_at, chunks, size)  # Insert as most recent.
+        self._bytes += size  # Account.
+        while len(self._mem) > self.max_entries or self._bytes > self.max_bytes:  # Over budget.
+            old, _ = next(iter(self._mem.items()))  # Least recently used.
+            self._drop(old)  # Evict.
+            self.stats["evictions"] += 1  # Count.
+
+    # -----------------------------
+    # Disk tier (blocking; called via asyncio.to_thread)
+    # -----------------------------
+    def _path(self, key: str) -> str:  # File for one key.
+        return os.path.join(self.disk_dir, key + ".json")  # <dir>/<sha256>.json
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, List[str]]]:  # Load one entry (None if missing/expired/corrupt).
+        try:  # Missing files are normal misses.
+            with open(self._path(key), "r", encoding="utf-8") as f:  # Open entry.
+                data = json.load(f)  # Parse.
+        except (OSError, ValueError):  # Missing or corrupt.
+            return None  # Miss.
+        if data.get("expiresAt", 0) < time.time():  # Expired.
+            try:  # Clean up lazily.
+                os.remove(self._path(key))  # Remove file.
+            except OSError:  # Already gone.
+                pass  # Ignore.
+            return None  # Miss.
+        return data["expiresAt"], data["chunks"]  # Entry.
+
+    def _write_disk(self, key: str, chunks: List[str], expires_at: float) -> None:  # Store one entry atomically.
+        path = self._path(key)  # Target.
+        tmp = f"{path}.{os.getpid()}.tmp"  # Temp file (per process: workers share the directory).
+        with open(tmp, "w", encoding="utf-8") as f:  # Write temp.
+            json.dump({"expiresAt": expires_at, "chunks": chunks}, f, ensure_ascii=False, separators=(",", ":"))  # Compact JSON.
+        os.replace(tmp, path)  # Atomic rename (no fsync: losing a cache entry is harmless).
+        self._disk_writes += 1  # Count write.
+        if self._disk_writes >= max(1, self.max_disk_entries // 10):  # Prune every ~10% of capacity.
+            self._disk_writes = 0  # Reset.
+            self._prune_disk()  # Enforce the bound.
+
+    def _prune_disk(self) -> None:  # Remove the oldest files beyond max_disk_entries.
+        with os.scandir(self.disk_dir) as it:  # List entries.
+            files = sorted((e.stat().st_mtime, e.path) for e in it if e.name.endswith(".json"))  # Oldest first.
+        for _, path in files[: max(0, len(files) - self.max_disk_entries)]:  # Excess files.
+            try:  # Best effort.
+                os.remove(path)  # Remove.
+            except OSError:  # Raced with another remove.
+                pass  # Ignore.
+
+    # -----------------------------
+    # Public API
+    # -----------------------------
+    async def get(self, key: str) -> Optional[List[str]]:  # Memory, then disk.
+        chunks = self._get_mem(key)  # Memory tier.
+        if chunks is not None:  # Hit.
+            self.stats["hits"] += 1  # Count.
+            return chunks  # Replay.
+        if self.disk_dir:  # Disk tier.
+            entry = await asyncio.to_thread(self._read_disk, key)  # Off the event loop.
+            if entry is not None:  # Hit.
+                self.stats["diskHits"] += 1  # Count.
+                self._put_mem(key, entry[1], entry[0])  # Promote.
+                return entry[1]  # Replay.
+        return None  # Miss.
+
+    async def put(self, key: str, chunks: List[str]) -> None:  # Store a finished reply in both tiers.
+        expires_at = time.time() + self.ttl_s  # Absolute expiry (valid across restarts for the disk tier).
+        self._put_mem(key, chunks, expires_at)  # Memory tier.
+        if self.disk_dir:  # Disk tier.
+            try:  # A full disk must not fail the request.
+                await asyncio.to_thread(self._write_disk, key, chunks, expires_at)  # Off the event loop.
+            except OSError:  # Write failed.
+                log.warning("llm cache: could not write %s", key, exc_info=True)  # Report and continue.
+
+    async def stream(self, key: str, upstream: AsyncGenerator[str, None]) -> AsyncGenerator[str, None]:  # Cached or shared stream.
+        chunks = await self.get(key)  # Finished reply?
+        if chunks is not None:  # Cache hit.
+            await upstream.aclose()  # Never started; release it.
+            for chunk in chunks:  # Replay with the original chunking.
+                yield chunk  # Delta.
+            return  # Done.
+        flight = self._inflight.get(key)  # Same prompt already running?
+        if flight is None:  # First caller starts the upstream call.
+            self.stats["misses"] += 1  # Count.
+            flight = self._inflight[key] = _Flight()  # Register.
+            flight.task = asyncio.create_task(self._pump(key, flight, upstream))  # Owned by the flight, not the caller.
+        else:  # Join the running call.
+            self.stats["shared"] += 1  # Count.
+            await upstream.aclose()  # Not needed.
+        flight.subscribers += 1  # Register reader.
+        try:  # Read shared output.
+            async for chunk in flight.read():  # Replayed + live chunks.
+                yield chunk  # Delta.
+        finally:  # Reader finished or went away.
+            flight.subscribers -= 1  # Unregister.
+            if flight.subscribers == 0 and flight.task is not None and not flight.task.done():  # Nobody is listening.
+                if self._inflight.get(key) is flight:  # Still registered.
+                    del self._inflight[key]  # An identical prompt arriving now starts fresh instead of joining a dying call.
+                flight.task.cancel()  # Stop the upstream call.
+
+    async def _pump(self, key: str, flight: _Flight, upstream: AsyncGenerator[str, None]) -> None:  # Run one upstream call.
+        try:  # Collect deltas.
+            async for chunk in upstream:  # Upstream deltas.
+                if chunk:  # Skip empty deltas.
+                    flight.chunks.append(chunk)  # Share.
+                    flight._notify()  # Wake readers.
+            if flight.chunks:  # Only complete, non-empty replies are cached.
+                await self.put(key, flight.chunks)  # Store.
+        except BaseException as e:  # Error or cancellation.
+            flight.error = e if isinstance(e, Exception) else RuntimeError("LLM call cancelled")  # Shared error.
+            if not isinstance(e, Exception):  # Cancellation.
+                raise  # Propagate.
+        finally:  # Always settle the flight.
+            flight.done = True  # Finished.
+            if self._inflight.get(key) is flight:  # Not already replaced by a newer call for the same prompt.
+                del self._inflight[key]  # Next identical prompt starts fresh (or hits the cache).
+            flight._notify()  # Wake readers.
+            await upstream.aclose()  # Release the HTTP stream.
+
+
+class CachedLLMClient:  # Wraps any client with generate_stream(); same interface, cached replies.
+    def __init__(self, llm: Any, cache: ResponseCache) -> None:  # Wrap a client.
+        self.llm = llm  # Real client (llm_client.LLMClient or mcall.LLMClient).
+        self.cache = cache  # Shared cache.
+
+    def __getattr__(self, name: str) -> Any:  # Everything else goes to the wrapped client.
+        return getattr(self.llm, name)  # Delegate.
+
+    def _key(self, messages: List[Dict[str, Any]]) -> str:  # Key for a message list with this client's settings.
+        model = getattr(self.llm, "model", None) or getattr(self.llm, "engine", None)  # httpx client vs VOX client.
+        return cache_key(model, getattr(self.llm, "temperature", None), messages)  # Normalized hash.
+
+    async def generate_stream(self, user_text: str) -> AsyncGenerator[str, None]:  # Same signature as the wrapped client.
+        async for delta in self.stream_chat([{"role": "user", "content": user_text}]):  # One-message prompt.
+            yield delta  # Delta.
+
+    async def stream_chat(self, messages: List[Dict[str, Any]]) -> AsyncGenerator[str, None]:  # Same signature as the wrapped client.
+        async for delta in self.cache.stream(self._key(messages), self.llm.stream_chat(messages)):  # Hit, shared or fresh.
+            yield delta  # Delta.
+
+
+12) backend/app/context.py (token-budgeted prompt context)
+
+Builds the message list for each reply: the newest turns that fit CONTEXT_BUDGET_TOKENS (token counts
+are stored with each message, so nothing is re-counted), preceded by a rolling summary of older turns.
+The summary is updated in the background after a reply, in batches, and stored with the chat; building
+a prompt only walks back from the newest message, so long chats cost the same as short ones. No turn is
+ever dropped: the background refresh leaves room for the next batch, and if the turns after the summary
+still do not fit (a burst of long turns, or an old chat seen for the first time) they are folded into
+the summary before the prompt is built.
+
+import os  # Import os to pick the tokenizer encoding.
+import asyncio  # Import asyncio for background summary refreshes.
+import logging  # Import logging to report summary failures.
+from typing import Any, Dict, List, Optional, Tuple  # Import types for clarity.
+
+log = logging.getLogger(__name__)  # Module logger.
+
+MESSAGE_OVERHEAD = 4  # Tokens the chat format adds per message (role + separators).
+_encoding: Any = None  # tiktoken encoding, resolved on first use (False = not available).
+
+
+def count_tokens(text: str) -> int:  # Token count of one text (tiktoken when installed, else an estimate).
+    global _encoding  # Module-level cache.
+    if _encoding is None:  # First call.
+        try:  # Optional dependency: pip install tiktoken
+            import tiktoken  # Exact counts for OpenAI-style models.
+            _encoding = tiktoken.get_encoding(os.getenv("TOKENIZER_ENCODING", "cl100k_base"))  # Load vocabulary once.
+        except Exception:  # Not installed (or vocabulary not downloadable).
+            _encoding = False  # Use the estimate below.
+    if _encoding:  # Exact.
+        return len(_encoding.encode(text, disallowed_special=()))  # Token ids.
+    return (len(text) + 3) // 4  # ~4 characters per token for English text.
+
+
+def message_tokens(msg: Dict[str, Any]) -> int:  # Cached count of a stored message (counted now for old messages).
+    n = msg.get("tokens")  # Stored with the message by the store.
+    return (n if n is not None else count_tokens(msg.get("content", ""))) + MESSAGE_OVERHEAD  # Plus format overhead.
+
+
+def _usable(msg: Dict[str, Any]) -> bool:  # Whether a stored message belongs in a prompt.
+    return bool(msg.get("content")) and not msg.get("status")  # Skip empty placeholders and streaming/failed replies.
+
+
+class ContextBuilder:  # Builds the LLM message list: rolling summary + newest turns within a token budget.
+    def __init__(  # Budgets and summary settings.
+        self,  # Instance.
+        store: Any,  # Chat store (page_messages / get_summary / set_summary).
+        llm: Any = None,  # Client with stream_chat(messages), used to write summaries.
+        budget_tokens: int = 3000,  # Prompt budget (summary + turns).
+        summary_tokens: int = 400,  # Max size of the rolling summary.
+        summarize_after_tokens: int = 1000,  # Fold older turns in batches of at least this size.
+        mode: str = "llm",  # "llm" = model-written summary, "extract" = first line of each turn (no LLM call).
+        page_size: int = 32,  # Messages read per store call while walking back.
+    ) -> None:  # No return value.
+        self.store = store  # Store.
+        self.llm = llm  # Summarizer model.
+        self.budget_tokens = budget_tokens  # Prompt budget.
+        self.summary_tokens = summary_tokens  # Summary cap.
+        self.summarize_after_tokens = summarize_after_tokens  # Batch threshold.
+        self.mode = mode  # Summary mode.
+        self.page_size = page_size  # Walk page size.
+        self._tasks: Dict[str, asyncio.Task] = {}  # chat id -> running summary refresh (one per chat).
+
+    def _turn_budget(self, summary: Dict[str, Any]) -> int:  # Tokens left for verbatim turns next to this summary.
+        return self.budget_tokens - (summary.get("tokens", 0) + MESSAGE_OVERHEAD if summary else 0)  # Budget minus summary.
+
+    async def _window(self, chat_id: str, budget: int, upto: Optional[str] = None) -> Tuple[List[Dict[str, Any]], bool]:  # Newest turns that fit (oldest first) + whether they reach the summary.
+        window: List[Dict[str, Any]] = []  # Newest first while walking.
+        used = 0  # Tokens so far.
+        before: Optional[str] = None  # Page cursor.
+        while True:  # Walk back one page at a time (cost ~ window size, not history size).
+            msgs, before = await self.store.page_messages(chat_id, limit=self.page_size, before=before)  # Older page.
+            for m in reversed(msgs):  # Newest first.
+                if m["id"] == upto:  # Everything older is in the summary.
+                    return window[::-1], True  # Oldest first, nothing left out.
+                if not _usable(m):  # Placeholder / failed reply.
+                    continue  # Skip.
+                n = message_tokens(m)  # Cached count.
+                if window and used + n > budget:  # Full (the newest message is always kept).
+                    return window[::-1], False  # Older unsummarized turns do not fit.
+                window.append(m)  # Keep.
+                used += n  # Account.
+            if before is None:  # Reached the first message.
+                return window[::-1], True  # Oldest first, whole chat.
+
+    async def build(self, chat_id: str) -> List[Dict[str, str]]:  # Messages to send for the next reply.
+        summary = await self.store.get_summary(chat_id) or {}  # Rolling summary of older turns.
+        window, complete = await self._window(chat_id, self._turn_budget(summary), summary.get("upto"))  # Recent turns.
+        if not complete:  # Turns between the summary and the window would be lost: fold them in first.
+            task = self._tasks.get(chat_id)  # Background refresh that may already cover them.
+            if task is not None and not task.done():  # Running.
+                await asyncio.shield(task)  # Shield: a cancelled request must not cancel the shared refresh.
+            await asyncio.shield(self._start(chat_id, 0))  # Fold every pending turn (joins a concurrent build's fold).
+            summary = await self.store.get_summary(chat_id) or {}  # Updated summary.
+            window, _ = await self._window(chat_id, self._turn_budget(summary), summary.get("upto"))  # Fits unless the summary call failed.
+        out: List[Dict[str, str]] = []  # Prompt.
+        if summary.get("text"):  # Older turns exist.
+            out.append({"role": "system", "content": "Summary of the earlier conversation:\n" + summary["text"]})  # Summary first.
+        out.extend({"role": m["role"], "content": m["content"]} for m in window)  # Recent turns.
+        return out  # Oldest first, newest user message last.
+
+    # -----------------------------
+    # Rolling summary
+    # -----------------------------
+    def schedule_summary(self, chat_id: str) -> None:  # Fold turns that left the window into the summary (background).
+        self._start(chat_id, self.summarize_after_tokens)  # Never delays the reply.
+
+    def _start(self, chat_id: str, min_tokens: int) -> asyncio.Task:  # Run (or join) the chat's summary refresh.
+        task = self._tasks.get(chat_id)  # Running refresh.
+        if task is not None and not task.done():  # Already running.
+            return task  # It will see the new turns next time.
+        task = self._tasks[chat_id] = asyncio.create_task(self._refresh(chat_id, min_tokens))  # One per chat.
+        task.add_done_callback(lambda t: self._tasks.pop(chat_id, None) if self._tasks.get(chat_id) is t else None)  # Forget it.
+        return task  # Awaitable by build().
+
+    async def _refresh(self, chat_id: str, min_tokens: int) -> None:  # Summarize the turns between the summary and the window.
+        try:  # Summary failures must not affect chats.
+            summary = await self.store.get_summary(chat_id) or {}  # Current summary.
+            keep = max(self.budget_tokens - self.summary_tokens - MESSAGE_OVERHEAD - self.summarize_after_tokens, 0)  # Room for a full summary + the next batch.
+            window, complete = await self._window(chat_id, keep, summary.get("upto"))  # Turns that stay verbatim.
+            if complete:  # Nothing between the summary and the window (or an empty chat).
+                return  # Nothing to do.
+            pending: List[Dict[str, Any]] = []  # Dropped turns not yet summarized (newest first).
+            before: Optional[str] = window[0]["id"]  # Start just before the window.
+            while before is not None:  # Walk back to the last summarized message.
+                msgs, before = await self.store.page_messages(chat_id, limit=self.page_size, before=before)  # Older page.
+                for m in reversed(msgs):  # Newest first.
+                    if m["id"] == summary.get("upto"):  # Already summarized from here on.
+                        before = None  # Stop walking.
+                        break  # Done.
+                    if _usable(m):  # Real turn.
+                        pending.append(m)  # Collect.
+            pending.reverse()  # Oldest first.
+            total = sum(message_tokens(m) for m in pending)  # Unsummarized tokens.
+            if total < min_tokens:  # Not worth a summary call yet (build() passes 0).
+                return  # Wait for more turns.
+            while pending:  # Fold in batches so one prompt never exceeds the budget.
+                batch, used = [], 0  # Next batch.
+                while pending and (not batch or used + message_tokens(pending[0]) <= self.budget_tokens):  # Fill batch.
+                    used += message_tokens(pending[0])  # Account.
+                    batch.append(pending.pop(0))  # Take oldest.
+                text = await self._summarize(summary.get("text", ""), batch)  # New summary text.
+                summary = {"text": text, "upto": batch[-1]["id"], "tokens": count_tokens(text)}  # Covers up to this turn.
+                await self.store.set_summary(chat_id, summary, durable=False)  # Persist with the chat.
+        except KeyError:  # Chat deleted meanwhile.
+            pass  # Nothing to summarize.
+        except Exception:  # LLM or store error.
+            log.warning("summary refresh failed for chat %s", chat_id, exc_info=True)  # Retry on the next reply.
+
+    async def _summarize(self, previous: str, msgs: List[Dict[str, Any]]) -> str:  # Merge turns into the summary.
+        if self.mode == "llm" and self.llm is not None:  # Model-written summary.
+            transcript = "\n".join(f"{m['role']}: {m['content']}" for m in msgs)  # New turns.
+            prompt = [  # Summary request.
+                {"role": "system", "content": (  # Instructions.
+                    "Update the running summary of a conversation with the new messages. Keep names, facts, "
+                    f"decisions and open questions. Reply with the summary only, at most {self.summary_tokens} tokens."
+                )},
+                {"role": "user", "content": f"Current summary:\n{previous or '(none)'}\n\nNew messages:\n{transcript}"},  # Input.
+            ]
+            text = "".join([d async for d in self.llm.stream_chat(prompt)]).strip()  # Collect reply.
+        else:  # Extractive: first line of each turn, no extra LLM call.
+            lines = [f"{m['role']}: {(m['content'].strip().splitlines() or [''])[0][:200]}" for m in msgs]  # One line per turn.
+            text = "\n".join(([previous] if previous else []) + lines)  # Append to the summary.
+        while count_tokens(text) > self.summary_tokens and "\n" in text:  # Over the cap.
+            text = text.split("\n", 1)[1]  # Drop the oldest line.
+        return text if count_tokens(text) <= self.summary_tokens else text[-self.summary_tokens * 4:]  # Hard cap.
+
+    async def aclose(self) -> None:  # Stop running summary refreshes (app shutdown).
+        tasks = list(self._tasks.values())  # Running tasks.
+        for t in tasks:  # Cancel each.
+            t.cancel()  # Request cancellation.
+        await asyncio.gather(*tasks, return_exceptions=True)  # Wait for them.
+
+
+13) backend/app/scheduler.py (admission control for LLM streams)
+
+Caps concurrent upstream LLM streams globally and per user. Streams over the limit wait in a bounded
+queue served round-robin across users (one busy user cannot starve the others); when the queue is
+full POST /stream answers 429 with Retry-After. GET /api/scheduler reports depth and wait times.
+
+import math  # Import math to round Retry-After up.
+import time  # Import time to measure queue wait and run time.
+import asyncio  # Import asyncio futures for queued tickets.
+from collections import OrderedDict, deque  # Import OrderedDict (round-robin over users) and deque (per-user FIFO).
+from typing import Any, Deque, Dict  # Import types for clarity.
+
+
+class QueueFull(Exception):  # Raised when a stream cannot even be queued (route answers 429).
+    def __init__(self, retry_after: int) -> None:  # Carry a Retry-After hint.
+        super().__init__("Too many concurrent streams")  # Message.
+        self.retry_after = retry_after  # Seconds.
+
+
+class Ticket:  # One stream's place in the scheduler: admitted at once, or queued until a slot frees up.
+    def __init__(self, scheduler: "StreamScheduler", user: str) -> None:  # New ticket.
+        self.scheduler = scheduler  # Owner.
+        self.user = user  # Fairness key.
+        self.enqueued_at = time.monotonic()  # For wait-time stats.
+        self.admitted_at = 0.0  # Set when a slot is granted.
+        self.state = "queued"  # queued -> running -> released.
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()  # Resolved on admission.
+
+    @property  # Read-only view.
+    def ready(self) -> bool:  # Admitted (no waiting needed).
+        return self.future.done()  # Resolved future.
+
+    def position(self) -> int:  # 1-based queue position (approximate under round-robin).
+        return self.scheduler._position(self)  # Ask scheduler.
+
+    async def acquire(self) -> None:  # Wait for a slot.
+        try:  # Cancellation while queued must leave the queue.
+            await asyncio.shield(self.future)  # Shield: cancelling the waiter must not cancel the shared future.
+        except asyncio.CancelledError:  # Client went away while queued.
+            self.release()  # Leave queue (or give the slot back if it was granted meanwhile).
+            raise  # Propagate.
+
+    def release(self) -> None:  # Give back the slot (idempotent).
+        self.scheduler._release(self)  # Scheduler bookkeeping.
+
+
+class StreamScheduler:  # Global + per-user concurrency limits with a bounded, round-robin fair wait queue.
+    def __init__(  # Limits.
+        self,  # Instance.
+        max_active: int = 32,  # Upstream LLM streams running at once.
+        max_per_user: int = 4,  # Streams one user may run at once.
+        max_queue: int = 64,  # Streams waiting for a slot (beyond this: 429).
+        max_queue_per_user: int = 8,  # Waiting streams per user (one user cannot fill the queue).
+    ) -> None:  # No return value.
+        self.max_active = max_active  # Global limit.
+        self.max_per_user = max_per_user  # Per-user limit.
+        self.max_queue = max_queue  # Queue bound.
+        self.max_queue_per_user = max_queue_per_user  # Per-user queue bound.
+        self._active = 0  # Running streams.
+        self._user_active: Dict[str, int] = {}  # user -> running streams.
+        self._queues: "OrderedDict[str, Deque[Ticket]]" = OrderedDict()  # user -> waiting tickets; order = whose turn is next.
+        self._queued = 0  # Waiting streams (all users).
+        self._run_avg = 5.0  # Moving average of stream duration in seconds (for Retry-After).
+        self._stats: Dict[str, float] = {  # Counters.
+            "admitted": 0,  # Streams that got a slot.
+            "rejected": 0,  # 429s.
+            "queuedTotal": 0,  # Streams that had to wait.
+            "queueDepthMax": 0,  # Deepest queue seen.
+            "waitSecondsTotal": 0.0,  # Sum of waits.
+            "waitSecondsMax": 0.0,  # Worst wait.
+            "waitSecondsLast": 0.0,  # Most recent wait.
+        }
+
+    def reserve(self, user: str) -> Ticket:  # Admit or queue a stream; QueueFull if the queue is full.
+        ticket = Ticket(self, user)  # New ticket.
+        queue = self._queues.get(user)  # User's waiting streams.
+        if not queue and self._active < self.max_active and self._user_active.get(user, 0) < self.max_per_user:  # Free slot.
+            self._admit(ticket)  # Run now.
+            return ticket  # Ready.
+        if self._queued >= self.max_queue or (queue is not None and len(queue) >= self.max_queue_per_user):  # No room.
+            self._stats["rejected"] += 1  # Count.
+            waves = math.ceil((self._queued + 1) / max(1, self.max_active))  # Slot turnovers needed.
+            raise QueueFull(max(1, math.ceil(self._run_avg * waves)))  # Route turns it into 429 + Retry-After.
+        if queue is None:  # First waiter of this user joins the round-robin at the end.
+            queue = self._queues[user] = deque()  # New FIFO.
+        queue.append(ticket)  # Wait.
+        self._queued += 1  # Count.
+        self._stats["queuedTotal"] += 1  # Count.
+        self._stats["queueDepthMax"] = max(self._stats["queueDepthMax"], self._queued)  # Track depth.
+        return ticket  # Caller awaits acquire().
+
+    def _admit(self, ticket: Ticket) -> None:  # Grant a slot.
+        ticket.state = "running"  # Running.
+        ticket.admitted_at = time.monotonic()  # Start of run.
+        self._active += 1  # Global count.
+        self._user_active[ticket.user] = self._user_active.get(ticket.user, 0) + 1  # Per-user count.
+        wait = ticket.admitted_at - ticket.enqueued_at  # Time spent queued.
+        self._stats["admitted"] += 1  # Count.
+        self._stats["waitSecondsTotal"] += wait  # Sum.
+        self._stats["waitSecondsMax"] = max(self._stats["waitSecondsMax"], wait)  # Worst.
+        self._stats["waitSecondsLast"] = wait  # Last.
+        ticket.future.set_result(None)  # Wake the waiter.
+
+    def _release(self, ticket: Ticket) -> None:  # Free a slot or leave the queue.
+        if ticket.state == "queued":  # Still waiting (cancelled).
+            queue = self._queues.get(ticket.user)  # User's FIFO.
+            if queue is not None and ticket in queue:  # Present.
+                queue.remove(ticket)  # Leave queue.
+                self._queued -= 1  # Count.
+                if not queue:  # Last waiter of this user.
+                    del self._queues[ticket.user]  # Leave round-robin.
+        elif ticket.state == "running":  # Finished (or cancelled) stream.
+            self._active -= 1  # Global count.
+            left = self._user_active[ticket.user] - 1  # Per-user count.
+            if left:  # Still running others.
+                self._user_active[ticket.user] = left  # Update.
+            else:  # None left.
+                del self._user_active[ticket.user]  # Keep the dict small.
+            self._run_avg = 0.9 * self._run_avg + 0.1 * (time.monotonic() - ticket.admitted_at)  # Update duration estimate.
+        ticket.state = "released"  # Idempotent.
+        self._dispatch()  # Hand freed slots to waiters.
+
+    def _dispatch(self) -> None:  # Admit waiters round-robin across users while slots are free.
+        while self._active < self.max_active and self._queued:  # Capacity + waiters.
+            for user, queue in self._queues.items():  # Users in turn order.
+                if self._user_active.get(user, 0) < self.max_per_user:  # User may run another stream.
+                    break  # Found.
+            else:  # Every waiting user is at its own limit.
+                return  # Wait for one of their streams to finish.
+            ticket = queue.popleft()  # Oldest stream of this user.
+            self._queued -= 1  # Count.
+            if queue:  # More waiting: go to the back of the line.
+                self._queues.move_to_end(user)  # Round-robin.
+            else:  # Nothing left.
+                del self._queues[user]  # Leave round-robin.
+            self._admit(ticket)  # Run it.
+
+    def _position(self, ticket: Ticket) -> int:  # 1-based queue position (0 = not queued).
+        queue = self._queues.get(ticket.user)  # Own FIFO.
+        if queue is None or ticket not in queue:  # Admitted or gone.
+            return 0  # Not queued.
+        rank = queue.index(ticket)  # Own streams ahead of this one.
+        ahead, before = rank, True  # Each user gets one turn per round.
+        for user, q in self._queues.items():  # Turn order.
+            if user == ticket.user:  # Users after us get one turn fewer.
+                before = False  # Switch.
+                continue  # Own queue counted above.
+            ahead += min(len(q), rank + 1 if before else rank)  # Their turns before ours.
+        return ahead + 1  # Position (ignores per-user limits, so approximate).
+
+    def stats(self) -> Dict[str, Any]:  # Snapshot for /api/scheduler and logs.
+        admitted = self._stats["admitted"]  # For the average.
+        return {  # Stats payload.
+            "active": self._active,  # Running streams.
+            "queued": self._queued,  # Queue depth now.
+            "users": len(self._user_active),  # Users with running streams.
+            "maxActive": self.max_active,  # Limits.
+            "maxPerUser": self.max_per_user,  # Limits.
+            "maxQueue": self.max_queue,  # Limits.
+            "admitted": int(admitted),  # Counters.
+            "rejected": int(self._stats["rejected"]),  # 429s.
+            "queuedTotal": int(self._stats["queuedTotal"]),  # Streams that waited.
+            "queueDepthMax": int(self._stats["queueDepthMax"]),  # Deepest queue.
+            "waitMsAvg": round(1000 * self._stats["waitSecondsTotal"] / admitted, 2) if admitted else 0.0,  # Mean wait.
+            "waitMsMax": round(1000 * self._stats["waitSecondsMax"], 2),  # Worst wait.
+            "waitMsLast": round(1000 * self._stats["waitSecondsLast"], 2),  # Latest wait.
+            "runSecondsAvg": round(self._run_avg, 2),  # Duration estimate used for Retry-After.
+        }
+
+
+14) backend/app/storage_sqlite.py (SQLite WAL mode)
+
+Same async methods as JsonChatStore, but nothing is held in memory: every call is one indexed query
+(chats by updated_at, messages by chat id) on a thread pool. WAL lets the reader threads run while the
+single writer thread commits. Titles and messages are searchable through an FTS5 table when available.
+
+import os  # Import os to create the data directory.
+import json  # Import json to store rolling summaries.
+import uuid  # Import uuid to generate unique IDs.
+import asyncio  # Import asyncio to await thread-pool work.
+import sqlite3  # Import sqlite3 (standard library) for the database.
+import threading  # Import threading for per-thread connections.
+from concurrent.futures import ThreadPoolExecutor  # Import ThreadPoolExecutor for blocking SQLite calls.
+from typing import Any, Callable, Dict, List, Optional, Tuple  # Import types for clarity.
+from .storage_json import decode_cursor, encode_cursor, now_iso, parse_version, version_tag  # Reuse cursor/version formats + timestamps (same API as JSON store).
+from .search_index import TITLE_WEIGHT, make_snippet, tokenize  # Reuse tokenizer, snippet helper and title weight.
+from .context import count_tokens  # Import token counter (counts are stored with each message).
+
+SCHEMA = [  # Idempotent schema (also used by migrate_sqlite.py).
+    """CREATE TABLE IF NOT EXISTS chats (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        summary TEXT,
+        version INTEGER NOT NULL DEFAULT 0
+    )""",  # One row per chat (implicit rowid is used for the title's search row; version = last history change).
+    "CREATE INDEX IF NOT EXISTS chats_updated ON chats(updated_at, id)",  # Newest-first paging.
+    """CREATE TABLE IF NOT EXISTS messages (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        id TEXT NOT NULL UNIQUE,
+        chat_id TEXT NOT NULL REFERENCES chats(id) ON DELETE CASCADE,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        tokens INTEGER,
+        status TEXT,
+        version INTEGER NOT NULL DEFAULT 0
+    )""",  # seq keeps insertion order; id is the public message id; version = last write.
+    "CREATE INDEX IF NOT EXISTS messages_chat ON messages(chat_id, seq)",  # Per-chat history + cascade deletes.
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)",  # Store-wide values.
+    "INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0), ('epoch', lower(hex(randomblob(4))))",  # Store version + tag epoch (created once, so tags survive restarts).
+]
+COLUMNS = [("chats", "version", "INTEGER NOT NULL DEFAULT 0"), ("messages", "version", "INTEGER NOT NULL DEFAULT 0")]  # Added after the first release.
+FTS_SCHEMA = "CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(body, chat_id UNINDEXED)"  # rowid = message seq, or -chat rowid for titles.
+
+MSG_COLUMNS = "id, role, content, created_at, tokens, status, version"  # Column order for _message().
+
+
+def connect(path: str) -> sqlite3.Connection:  # Open a connection with the store's pragmas.
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, cached_statements=256)  # Autocommit; explicit BEGIN for writes.
+    conn.execute("PRAGMA journal_mode=WAL")  # Readers never block the writer (and vice versa).
+    conn.execute("PRAGMA foreign_keys=ON")  # Cascade message deletes.
+    conn.execute("PRAGMA busy_timeout=5000")  # Wait for locks instead of failing.
+    return conn  # Ready connection.
+
+
+def upgrade(conn: sqlite3.Connection) -> None:  # Add columns missing from a database created by an older version.
+    for table, column, decl in COLUMNS:  # Each later column.
+        if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:  # Not there yet.
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")  # Metadata-only change (no table rewrite).
+
+
+def _message(row: Tuple[Any, ...]) -> Dict[str, Any]:  # Row -> message dict (same shape as the JSON store).
+    msg = {"id": row[0], "role": row[1], "content": row[2], "createdAt": row[3], "tokens": row[4], "version": row[6]}  # Base fields.
+    if row[5]:  # Streaming / failed reply.
+        msg["status"] = row[5]  # Only present when set.
+    return msg  # Message.
+
+
+class SqliteChatStore:  # SQLite (WAL) store with the same async API as JsonChatStore.
+    def __init__(self, file_path: str, durability: str = "commit", readers: int = 4) -> None:  # Initialize store.
+        self.file_path = file_path  # Database path.
+        self.durability = durability  # "commit": synchronous=FULL; "memory": synchronous=NORMAL (may lose the last commits on power loss).
+        self._local = threading.local()  # One connection per worker thread.
+        self._conns: List[sqlite3.Connection] = []  # Every connection opened (closed on shutdown).
+        self._conns_lock = threading.Lock()  # Guards _conns.
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="sqlite-read")  # Concurrent readers (WAL).
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-write")  # SQLite has one writer anyway.
+        self._lock = asyncio.Lock()  # Serializes first-use setup.
+        self._ready = False  # Schema created.
+        self._fts = False  # FTS5 available.
+
+    # -----------------------------
+    # Threads + connections
+    # -----------------------------
+    def _conn(self) -> sqlite3.Connection:  # Connection of the current worker thread.
+        conn = getattr(self._local, "conn", None)  # Existing.
+        if conn is None:  # First use in this thread.
+            conn = self._local.conn = connect(self.file_path)  # Open.
+            with self._conns_lock:  # Register for close().
+                self._conns.append(conn)  # Track.
+        return conn  # Connection.
+
+    def _setup(self) -> None:  # Create schema (writer thread).
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)  # Create parent directory if missing.
+        conn = self._conn()  # Writer connection.
+        for stmt in SCHEMA:  # Tables + indexes.
+            conn.execute(stmt)  # Create if missing.
+        upgrade(conn)  # Databases from before a column existed.
+        try:  # FTS5 is compiled into most SQLite builds.
+            conn.execute(FTS_SCHEMA)  # Full-text index.
+            self._fts = True  # Use it.
+        except sqlite3.OperationalError:  # Not available.
+            self._fts = False  # search_chats falls back to title matching.
+
+    async def _ensure(self) -> None:  # Run setup once.
+        if not self._ready:  # Not set up yet.
+            async with self._lock:  # Only one caller sets up.
+                if not self._ready:  # Re-check inside lock.
+                    await asyncio.get_running_loop().run_in_executor(self._writer, self._setup)  # Create schema.
+                    self._ready = True  # Done.
+
+    async def _read(self, fn: Callable[..., Any], *args: Any) -> Any:  # Run a read on the reader pool.
+        await self._ensure()  # Schema exists.
+        return await asyncio.get_running_loop().run_in_executor(self._readers, lambda: fn(self._conn(), *args))  # Off the loop.
+
+    async def _write(self, fn: Callable[..., Any], *args: Any, durable: Optional[bool] = None) -> Any:  # Run a transaction on the writer.
+        await self._ensure()  # Schema exists.
+        sync = "FULL" if (self.durability == "commit" if durable is None else durable) else "NORMAL"  # Per-call override.
+
+        def tx() -> Any:  # Writer thread.
+            conn = self._conn()  # Writer connection.
+            conn.execute(f"PRAGMA synchronous={sync}")  # Applies to the commit below.
+            conn.execute("BEGIN IMMEDIATE")  # Take the write lock up front.
+            try:  # Commit or roll back.
+                result = fn(conn, *args)  # Statements.
+            except BaseException:  # Any failure.
+                conn.execute("ROLLBACK")  # Undo.
+                raise  # Propagate (e.g. KeyError -> 404).
+            conn.execute("COMMIT")  # Durable per `sync`.
+            return result  # Result.
+
+        return await asyncio.get_running_loop().run_in_executor(self._writer, tx)  # Off the loop.
+
+    async def close(self) -> None:  # Finish queued work and close connections (call on shutdown).
+        await asyncio.to_thread(self._writer.shutdown, True)  # Wait for pending writes.
+        await asyncio.to_thread(self._readers.shutdown, True)  # Wait for pending reads.
+        with self._conns_lock:  # No worker threads left.
+            for conn in self._conns:  # Every connection.
+                conn.close()  # Close.
+            self._conns.clear()  # Forget.
+
+    # -----------------------------
+    # Reads
+    # -----------------------------
+    @staticmethod  # Runs in a reader thread.
+    def _page_chats(conn: sqlite3.Connection, search: str, limit: Optional[int], cursor: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:  # Reader thread.
+        where, args = [], []  # Filters.
+        if cursor:  # Continue below the last returned chat.
+            where.append("(updated_at, id) < (?, ?)")  # Row-value comparison uses the (updated_at, id) index.
+            args.extend(decode_cursor(cursor))  # ValueError on garbage.
+        if search:  # Title substring, as in the JSON store.
+            where.append("instr(lower(title), ?) > 0")  # Case-insensitive contains.
+            args.append(search)  # Lowercased by caller.
+        sql = "SELECT id, title, updated_at FROM chats"  # Summaries only (no message bodies).
+        if where:  # Any filter.
+            sql += " WHERE " + " AND ".join(where)  # Combine.
+        sql += " ORDER BY updated_at DESC, id DESC"  # Newest first.
+        if limit is not None:  # Paged.
+            sql += " LIMIT ?"  # One extra row tells whether another page exists.
+            args.append(limit + 1)  # Page + 1.
+        rows = conn.execute(sql, args).fetchall()  # Run.
+        more = limit is not None and len(rows) > limit  # Another page?
+        rows = rows[:limit] if limit is not None else rows  # Trim.
+        chats = [{"id": r[0], "title": r[1], "updatedAt": r[2]} for r in rows]  # Map to summary.
+        return chats, (encode_cursor((rows[-1][2], rows[-1][0])) if more else None)  # Cursor = last returned key.
+
+    async def page_chats(  # Return one newest-first page of chat summaries plus the next cursor.
+        self, search: str = "", limit: Optional[int] = None, cursor: Optional[str] = None  # Filter + paging.
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:  # (summaries, next cursor).
+        return await self._read(self._page_chats, search.lower().strip(), limit, cursor)  # Indexed query.
+
+    async def list_chats(self, search: str = "") -> List[Dict[str, Any]]:  # Return chat summaries.
+        chats, _ = await self.page_chats(search=search)  # Unpaged.
+        return chats  # Newest first.
+
+    def _search(self, conn: sqlite3.Connection, query: str, limit: int) -> List[Dict[str, Any]]:  # Reader thread.
+        terms = tokenize(query)  # Same tokenizer as the JSON store.
+        if not terms:  # Nothing searchable.
+            return []  # No hits.
+        match = " ".join('"%s"*' % t.replace('"', '""') for t in terms)  # Every term, prefix match (AND).
+        rows = conn.execute(  # Best rows by bm25 (lower is better).
+            "SELECT rowid, chat_id, bm25(search) FROM search WHERE search MATCH ? ORDER BY bm25(search) LIMIT ?",
+            (match, limit * 20),  # Enough rows to rank `limit` chats.
+        ).fetchall()
+        scores: Dict[str, float] = {}  # chat id -> score.
+        hits: Dict[str, List[int]] = {}  # chat id -> best message seqs.
+        for rowid, chat_id, rank in rows:  # Aggregate per chat.
+            scores[chat_id] = scores.get(chat_id, 0.0) - rank * (TITLE_WEIGHT if rowid < 0 else 1.0)  # Title rows weigh more.
+            if rowid > 0 and len(hits.setdefault(chat_id, [])) < 3:  # Message row.
+                hits[chat_id].append(rowid)  # Snippet candidate.
+        results = []  # Ranked summaries.
+        for chat_id in sorted(scores, key=scores.get, reverse=True)[:limit]:  # Best chats.
+            chat = conn.execute("SELECT id, title, updated_at FROM chats WHERE id = ?", (chat_id,)).fetchone()  # Summary.
+            if chat is None:  # Deleted meanwhile.
+                continue  # Skip.
+            snippets = []  # Matching message snippets.
+            for seq in hits.get(chat_id, []):  # Best-matching messages.
+                m = conn.execute("SELECT id, role, content FROM messages WHERE seq = ?", (seq,)).fetchone()  # Message.
+                if m is not None:  # Present.
+                    snippets.append({"messageId": m[0], "role": m[1], "text": make_snippet(m[2], terms)})  # Snippet.
+            results.append({"id": chat[0], "title": chat[1], "updatedAt": chat[2], "score": round(scores[chat_id], 4), "snippets": snippets})  # Summary + hits.
+        return results  # Best match first.
+
+    async def search_chats(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:  # Full-text search over titles + messages.
+        await self._ensure()  # Know whether FTS5 exists.
+        if not self._fts:  # No FTS5 in this SQLite build.
+            chats, _ = await self.page_chats(search=query, limit=limit)  # Title match only.
+            return [dict(c, score=0.0, snippets=[]) for c in chats]  # Same shape.
+        return await self._read(self._search, query, limit)  # Ranked search.
+
+    @staticmethod  # Runs in a reader thread.
+    def _page_messages(conn: sqlite3.Connection, chat_id: str, limit: Optional[int], before: Optional[str]) -> Tuple[List[Dict[str, Any]], Optional[str]]:  # Reader thread.
+        if conn.execute("SELECT 1 FROM chats WHERE id = ?", (chat_id,)).fetchone() is None:  # Unknown chat.
+            raise KeyError("Chat not found")  # Raise if missing.
+        end = None  # Exclusive upper seq.
+        if before:  # Page ends before a known message.
+            row = conn.execute("SELECT seq FROM messages WHERE id = ? AND chat_id = ?", (before, chat_id)).fetchone()  # Position.
+            if row is None:  # Unknown message id.
+                raise ValueError("Invalid cursor")  # Let the route turn it into a 400.
+            end = row[0]  # Exclusive end.
+        if limit is None:  # Whole history (up to `before`).
+            rows = conn.execute(  # Oldest first.
+                f"SELECT {MSG_COLUMNS} FROM messages WHERE chat_id = ? AND seq < ? ORDER BY seq",
+                (chat_id, end if end is not None else 2 ** 63 - 1),  # No upper bound.
+            ).fetchall()
+            return [_message(r) for r in rows], None  # All messages.
+        rows = conn.execute(  # Newest `limit + 1` before the cursor (uses the (chat_id, seq) index).
+            f"SELECT {MSG_COLUMNS} FROM messages WHERE chat_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?",
+            (chat_id, end if end is not None else 2 ** 63 - 1, limit + 1),  # One extra row = more pages.
+        ).fetchall()
+        more = len(rows) > limit  # Older messages exist?
+        msgs = [_message(r) for r in reversed(rows[:limit])]  # Oldest first.
+        return msgs, (msgs[0]["id"] if more and msgs else None)  # Slice + next `before`.
+
+    async def page_messages(  # Return a window of a chat's messages (oldest first) plus the next `before` id.
+        self, chat_id: str, limit: Optional[int] = None, before: Optional[str] = None  # Paging.
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:  # (messages, next before).
+        return await self._read(self._page_messages, chat_id, limit, before)  # Indexed query.
+
+    async def list_messages(self, chat_id: str) -> List[Dict[str, Any]]:  # Return messages for a chat.
+        msgs, _ = await self.page_messages(chat_id)  # Unpaged.
+        return msgs  # All messages.
+
+    @staticmethod  # Runs in a reader thread.
+    def _version(conn: sqlite3.Connection, chat_id: Optional[str]) -> str:  # Reader thread.
+        epoch, version = conn.execute("SELECT (SELECT value FROM meta WHERE key = 'epoch'), value FROM meta WHERE key = 'version'").fetchone()  # Store.
+        if chat_id is None:  # Chat list / search results.
+            return version_tag(epoch, version)  # Changes on every write.
+        row = conn.execute("SELECT version FROM chats WHERE id = ?", (chat_id,)).fetchone()  # Primary-key lookup.
+        if row is None:  # Unknown chat.
+            raise KeyError("Chat not found")  # Raise if missing.
+        return version_tag(epoch, row[0])  # Changes when a message is added or updated.
+
+    async def version(self, chat_id: Optional[str] = None) -> str:  # Tag of the whole store, or of one chat's message history.
+        return await self._read(self._version, chat_id)  # Two small lookups (kept in the epoch/version rows, so every worker agrees).
+
+    @staticmethod  # Runs in a reader thread.
+    def _messages_since(conn: sqlite3.Connection, chat_id: str, since: Optional[str], after: Optional[str]) -> Optional[List[Dict[str, Any]]]:  # Reader thread.
+        row = conn.execute("SELECT version, (SELECT value FROM meta WHERE key = 'epoch') FROM chats WHERE id = ?", (chat_id,)).fetchone()  # Chat version + epoch.
+        if row is None:  # Unknown chat.
+            raise KeyError("Chat not found")  # Raise if missing.
+        if after:  # New messages only.
+            pos = conn.execute("SELECT seq FROM messages WHERE id = ? AND chat_id = ?", (after, chat_id)).fetchone()  # Position.
+            if pos is None:  # Unknown message id.
+                raise ValueError("Invalid cursor")  # Let the route turn it into a 400.
+            rows = conn.execute(f"SELECT {MSG_COLUMNS} FROM messages WHERE chat_id = ? AND seq > ? ORDER BY seq", (chat_id, pos[0])).fetchall()  # Newer rows.
+            return [_message(r) for r in rows]  # Oldest first.
+        version = parse_version(since or "", row[1])  # Client's last seen version.
+        if version is None:  # Restarted store or garbage.
+            return None  # Full history needed.
+        if row[0] <= version:  # Nothing changed.
+            return []  # Skip the scan.
+        rows = conn.execute(f"SELECT {MSG_COLUMNS} FROM messages WHERE chat_id = ? AND version > ? ORDER BY seq", (chat_id, version)).fetchall()  # New + updated.
+        return [_message(r) for r in rows]  # Oldest first.
+
+    async def messages_since(  # Messages added/changed after a version tag, or added after a message id (delta sync).
+        self, chat_id: str, since: Optional[str] = None, after: Optional[str] = None  # One of the two.
+    ) -> Optional[List[Dict[str, Any]]]:  # Oldest first; None if `since` is from another epoch (caller sends everything).
+        return await self._read(self._messages_since, chat_id, since, after)  # Indexed query.
+
+    @staticmethod  # Runs in a reader thread.
+    def _get_summary(conn: sqlite3.Connection, chat_id: str) -> Optional[Dict[str, Any]]:  # Reader thread.
+        row = conn.execute("SELECT summary FROM chats WHERE id = ?", (chat_id,)).fetchone()  # Summary column.
+        if row is None:  # Unknown chat.
+            raise KeyError("Chat not found")  # Raise if missing.
+        return json.loads(row[0]) if row[0] else None  # {"text", "upto", "tokens"} or None.
+
+    async def get_summary(self, chat_id: str) -> Optional[Dict[str, Any]]:  # Rolling summary of older turns (or None).
+        return await self._read(self._get_summary, chat_id)  # Primary-key lookup.
+
+    # -----------------------------
+    # Writes (each runs as one transaction on the writer thread)
+    # -----------------------------
+    @staticmethod  # Runs in the writer thread.
+    def _bump(conn: sqlite3.Connection) -> int:  # Next store version (inside the write transaction, so a rollback undoes it).
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")  # Increment.
+        return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]  # New value.
+
+    def _insert_chat(self, conn: sqlite3.Connection, chat: Dict[str, Any]) -> None:  # Writer thread.
+        cur = conn.execute(  # Row.
+            "INSERT INTO chats (id, title, updated_at, version) VALUES (?, ?, ?, ?)", (chat["id"], chat["title"], chat["updatedAt"], self._bump(conn))
+        )
+        if self._fts:  # Index title.
+            conn.execute("INSERT INTO search (rowid, body, chat_id) VALUES (?, ?, ?)", (-cur.lastrowid, chat["title"], chat["id"]))  # Title row.
+
+    async def create_chat(self, title: str, durable: Optional[bool] = None) -> Dict[str, Any]:  # Create a new chat in store.
+        chat = {"id": str(uuid.uuid4()), "title": title or "New chat", "updatedAt": now_iso()}  # Build summary.
+        await self._write(self._insert_chat, chat, durable=durable)  # Insert.
+        return chat  # Return summary.
+
+    def _rename(self, conn: sqlite3.Connection, chat_id: str, title: str) -> None:  # Writer thread.
+        row = conn.execute("SELECT rowid FROM chats WHERE id = ?", (chat_id,)).fetchone()  # Find chat.
+        if row is None:  # Unknown chat.
+            raise KeyError("Chat not found")  # Raise not found.
+        self._bump(conn)  # Chat list changed.
+        conn.execute("UPDATE chats SET title = ?, updated_at = ? WHERE id = ?", (title, now_iso(), chat_id))  # Update.
+        if self._fts:  # Re-index title.
+            conn.execute("UPDATE search SET body = ? WHERE rowid = ?", (title, -row[0]))  # Title row.
+
+    async def rename_chat(self, chat_id: str, title: str, durable: Optional[bool] = None) -> None:  # Rename an existing chat.
+        await self._write(self._rename, chat_id, title, durable=durable)  # Update.
+
+    def _delete(self, conn: sqlite3.Connection, chat_id: str) -> None:  # Writer thread.
+        row = conn.execute("SELECT rowid FROM chats WHERE id = ?", (chat_id,)).fetchone()  # Find chat.
+        if row is None:  # Unknown chat.
+            raise KeyError("Chat not found")  # Raise not found.
+        self._bump(conn)  # Chat list changed.
+        if self._fts:  # Drop search rows (by rowid, so no scan).
+            conn.execute("DELETE FROM search WHERE rowid IN (SELECT seq FROM messages WHERE chat_id = ?)", (chat_id,))  # Messages.
+            conn.execute("DELETE FROM search WHERE rowid = ?", (-row[0],))  # Title.
+        conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))  # Messages go with it (ON DELETE CASCADE).
+
+    async def delete_chat(self, chat_id: str, durable: Optional[bool] = None) -> None:  # Delete a chat.
+        await self._write(self._delete, chat_id, durable=durable)  # Delete.
+
+    def _append(self, conn: sqlite3.Connection, chat_id: str, msg: Dict[str, Any]) -> None:  # Writer thread.
+        msg["version"] = self._bump(conn)  # History changed at this version.
+        if conn.execute("UPDATE chats SET updated_at = ?, version = ? WHERE id = ?", (msg["createdAt"], msg["version"], chat_id)).rowcount == 0:  # Touch chat.
+            raise KeyError("Chat not found")  # Raise if missing.
+        cur = conn.execute(  # Insert message.
+            "INSERT INTO messages (id, chat_id, role, content, created_at, tokens, status, version) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (msg["id"], chat_id, msg["role"], msg["content"], msg["createdAt"], msg["tokens"], msg.get("status"), msg["version"]),  # Values.
+        )
+        if self._fts and msg["content"]:  # Index body.
+            conn.execute("INSERT INTO search (rowid, body, chat_id) VALUES (?, ?, ?)", (cur.lastrowid, msg["content"], chat_id))  # Message row.
+
+    async def append_message(  # Add a message.
+        self, chat_id: str, role: str, content: str, durable: Optional[bool] = None, status: Optional[str] = None
+    ) -> Dict[str, Any]:
+        msg = {"id": str(uuid.uuid4()), "role": role, "content": content, "createdAt": now_iso(), "tokens": count_tokens(content)}  # Build message.
+        if status:  # E.g. "streaming" for an assistant placeholder.
+            msg["status"] = status  # Store status.
+        await self._write(self._append, chat_id, msg, durable=durable)  # Insert.
+        return msg  # Return created message.
+
+    def _update(self, conn: sqlite3.Connection, chat_id: str, message_id: str, content: str, status: Optional[str]) -> Dict[str, Any]:  # Writer thread.
+        row = conn.execute(f"SELECT seq, {MSG_COLUMNS} FROM messages WHERE id = ? AND chat_id = ?", (message_id, chat_id)).fetchone()  # Old row.
+        if row is None:  # Unknown chat or message.
+            raise KeyError("Message not found")  # Raise if missing.
+        tokens = count_tokens(content)  # Re-count for the new content.
+        version = self._bump(conn)  # History changed at this version.
+        conn.execute("UPDATE messages SET content = ?, tokens = ?, status = ?, version = ? WHERE seq = ?", (content, tokens, status, version, row[0]))  # Update.
+        conn.execute("UPDATE chats SET version = ? WHERE id = ?", (version, chat_id))  # Chat history version.
+        if self._fts:  # Re-index body.
+            conn.execute("DELETE FROM search WHERE rowid = ?", (row[0],))  # Old body.
+            if content:  # Non-empty.
+                conn.execute("INSERT INTO search (rowid, body, chat_id) VALUES (?, ?, ?)", (row[0], content, chat_id))  # New body.
+        return _message(row[1:3] + (content, row[4], tokens, status, version))  # Updated message.
+
+    async def update_message(  # Replace a message's content (checkpoints of a streaming reply).
+        self, chat_id: str, message_id: str, content: str, status: Optional[str] = None, durable: Optional[bool] = None
+    ) -> Dict[str, Any]:
+        return await self._write(self._update, chat_id, message_id, content, status, durable=durable)  # Update.
+
+    def _set_summary(self, conn: sqlite3.Connection, chat_id: str, summary: Dict[str, Any]) -> None:  # Writer thread.
+        self._bump(conn)  # Store changed.
+        if conn.execute("UPDATE chats SET summary = ? WHERE id = ?", (json.dumps(summary, ensure_ascii=False), chat_id)).rowcount == 0:  # Store.
+            raise KeyError("Chat not found")  # Raise if missing.
+
+    async def set_summary(self, chat_id: str, summary: Dict[str, Any], durable: Optional[bool] = None) -> None:  # Replace the summary.
+        await self._write(self._set_summary, chat_id, summary, durable=durable)  # Update.
+
+
+15) backend/app/migrate_sqlite.py (chats.json -> SQLite import)
+
+Streams chats.json one chat at a time (the file is never loaded whole), then replays chats.json.journal
+if the app ran in journal mode. Run it once with the app stopped, then switch DATA_FILE to sqlite://.
+
+import os  # Import os to find journal files.
+import sys  # Import sys for the exit status.
+import json  # Import json for the incremental decoder and journal lines.
+import argparse  # Import argparse for the command line.
+import sqlite3  # Import sqlite3 for the target database.
+from typing import Any, Dict, Iterator, TextIO, Tuple  # Import types for clarity.
+from .storage_sqlite import FTS_SCHEMA, SCHEMA, connect, upgrade  # Reuse the store's schema + pragmas.
+from .context import count_tokens  # Count tokens for messages stored before counts existed.
+
+
+class JsonStream:  # Pull parser: reads a large JSON document one value at a time instead of all at once.
+    def __init__(self, f: TextIO, chunk_size: int = 1 << 20) -> None:  # Wrap an open text file.
+        self.f = f  # Source.
+        self.chunk_size = chunk_size  # Read size.
+        self.buf = ""  # Unparsed text.
+        self.pos = 0  # Parse position in buf.
+        self.eof = False  # Source exhausted.
+        self.decoder = json.JSONDecoder()  # Stdlib decoder (raw_decode parses one value).
+
+    def _more(self, size: int) -> bool:  # Append more text; False at end of file.
+        data = "" if self.eof else self.f.read(size)  # Next chunk.
+        if not data:  # Nothing left.
+            self.eof = True  # Remember.
+            return False  # No progress.
+        self.buf = self.buf[self.pos:] + data  # Drop consumed text (memory stays ~ one value).
+        self.pos = 0  # Rebase.
+        return True  # Progress.
+
+    def peek(self) -> str:  # Next non-whitespace character ("" at end).
+        while True:  # Until a character or EOF.
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":  # Skip whitespace.
+                self.pos += 1  # Advance.
+            if self.pos < len(self.buf):  # Found one.
+                return self.buf[self.pos]  # Character.
+            if not self._more(self.chunk_size):  # Read more.
+                return ""  # End of file.
+
+    def expect(self, ch: str) -> None:  # Consume one structural character.
+        if self.peek() != ch:  # Unexpected input.
+            raise ValueError(f"expected {ch!r} in JSON input")  # Malformed file.
+        self.pos += 1  # Consume.
+
+    def skip_comma(self) -> None:  # Consume an optional separator.
+        if self.peek() == ",":  # Separator.
+            self.pos += 1  # Consume.
+
+    def value(self) -> Any:  # Decode the next complete value.
+        self.peek()  # Skip whitespace.
+        size = self.chunk_size  # Growth step (doubles so a huge value is not re-parsed many times).
+        while True:  # Until the value is complete.
+            try:  # Parse from the current position.
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)  # One value.
+                if end < len(self.buf) or self.eof:  # Not cut off at the buffer end (e.g. a number).
+                    self.pos = end  # Consume.
+                    return obj  # Value.
+            except json.JSONDecodeError:  # Value continues past the buffer.
+                if self.eof:  # Truly malformed.
+                    raise  # Propagate.
+            if self._more(size):  # Read more.
+                size *= 2  # Bigger next time.
+
+
+def iter_snapshot(f: TextIO) -> Iterator[Tuple[str, Any]]:  # Yield ("seq", n) and ("chat", chat) from chats.json, one chat at a time.
+    s = JsonStream(f)  # Pull parser.
+    if s.peek() == "":  # Empty file.
+        return  # Nothing to import.
+    s.expect("{")  # Top-level object.
+    while s.peek() != "}":  # Each key.
+        key = s.value()  # Key string.
+        s.expect(":")  # Separator.
+        if key == "chats":  # The big array.
+            s.expect("[")  # Start.
+            while s.peek() != "]":  # Each chat.
+                yield "chat", s.value()  # One chat (with its messages) in memory at a time.
+                s.skip_comma()  # Next.
+            s.expect("]")  # End.
+        else:  # Small scalar (e.g. "seq").
+            yield key, s.value()  # Pass through.
+        s.skip_comma()  # Next key.
+
+
+def _insert_chat(conn: sqlite3.Connection, chat: Dict[str, Any]) -> int:  # Insert one chat + messages; return message count.
+    summary = chat.get("summary")  # Rolling summary, if any.
+    conn.execute(  # Chat row.
+        "INSERT INTO chats (id, title, updated_at, summary, version) VALUES (?, ?, ?, ?, ?)",
+        (chat["id"], chat.get("title", "New chat"), chat.get("updatedAt", ""), json.dumps(summary, ensure_ascii=False) if summary else None, chat.get("version", 0)),  # Values.
+    )
+    msgs = chat.get("messages", [])  # Messages.
+    conn.executemany(  # Bulk insert (prepared once).
+        "INSERT INTO messages (id, chat_id, role, content, created_at, tokens, status, version) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        ((m["id"], chat["id"], m["role"], m.get("content", ""), m.get("createdAt", ""), m["tokens"] if m.get("tokens") is not None else count_tokens(m.get("content", "")), m.get("status"), m.get("version", 0)) for m in msgs),  # Rows.
+    )
+    return len(msgs)  # Count.
+
+
+def _apply_op(conn: sqlite3.Connection, op: Dict[str, Any]) -> None:  # Replay one journal line (journal mode stores).
+    kind = op["op"]  # Mutation type.
+    if kind == "create":  # New chat.
+        _insert_chat(conn, dict(op["chat"], messages=[], version=op.get("seq", 0)))  # Insert.
+    elif kind == "rename":  # Title change.
+        conn.execute("UPDATE chats SET title = ?, updated_at = ? WHERE id = ?", (op["title"], op["updatedAt"], op["id"]))  # Update.
+    elif kind == "delete":  # Chat removal.
+        conn.execute("DELETE FROM chats WHERE id = ?", (op["id"],))  # Cascades to messages.
+    elif kind == "append":  # New message.
+        if conn.execute("UPDATE chats SET updated_at = ?, version = ? WHERE id = ?", (op["updatedAt"], op.get("seq", 0), op["chatId"])).rowcount:  # Chat still exists.
+            m = op["message"]  # Message.
+            conn.execute(  # Insert.
+                "INSERT INTO messages (id, chat_id, role, content, created_at, tokens, status, version) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (m["id"], op["chatId"], m["role"], m.get("content", ""), m.get("createdAt", ""), m.get("tokens") if m.get("tokens") is not None else count_tokens(m.get("content", "")), m.get("status"), op.get("seq", 0)),  # Values.
+            )
+    elif kind == "update":  # New version of a message.
+        m = op["message"]  # Message.
+        conn.execute(  # Update in place.
+            "UPDATE messages SET content = ?, tokens = ?, status = ?, version = ? WHERE id = ?",
+            (m.get("content", ""), m.get("tokens") if m.get("tokens") is not None else count_tokens(m.get("content", "")), m.get("status"), op.get("seq", 0), m["id"]),  # Values.
+        )
+        conn.execute("UPDATE chats SET version = ? WHERE id = ?", (op.get("seq", 0), op["chatId"]))  # Chat history version.
+    elif kind == "summary":  # Rolling summary.
+        conn.execute("UPDATE chats SET summary = ? WHERE id = ?", (json.dumps(op["summary"], ensure_ascii=False), op["id"]))  # Update.
+
+
+def migrate(src: str, dst: str, batch: int = 500) -> Dict[str, int]:  # Import chats.json (+ journal files) into a new SQLite database.
+    conn = connect(dst)  # Same pragmas as the store (WAL).
+    for stmt in SCHEMA:  # Tables + indexes.
+        conn.execute(stmt)  # Create if missing.
+    upgrade(conn)  # An empty database from an older version.
+    if conn.execute("SELECT 1 FROM chats LIMIT 1").fetchone():  # Never merge into existing data.
+        raise SystemExit(f"{dst} already contains chats; migrate into a new file")  # Abort.
+    conn.execute("PRAGMA synchronous=OFF")  # Bulk load; the final checkpoint below makes it durable.
+    counts = {"chats": 0, "messages": 0, "journal": 0}  # Progress.
+    seq = 0  # Snapshot sequence number (journal mode).
+    last = 0  # Highest journal sequence number replayed.
+    conn.execute("BEGIN")  # First batch.
+    if os.path.exists(src) or not os.path.exists(src + ".journal"):  # A journal store writes its first snapshot on compaction.
+        with open(src, "r", encoding="utf-8") as f:  # Stream the snapshot.
+            for kind, value in iter_snapshot(f):  # One chat at a time.
+                if kind == "seq":  # Journal entries up to here are already in the snapshot.
+                    seq = int(value)  # Remember.
+                elif kind == "chat":  # Chat with messages.
+                    counts["messages"] += _insert_chat(conn, value)  # Insert.
+                    counts["chats"] += 1  # Count.
+                    if counts["chats"] % batch == 0:  # Keep transactions bounded.
+                        conn.execute("COMMIT")  # Flush batch.
+                        conn.execute("BEGIN")  # Next batch.
+    for path in (src + ".journal.old", src + ".journal"):  # Journal mode: replay changes not yet in the snapshot.
+        if not os.path.exists(path):  # Not journal mode (or nothing pending).
+            continue  # Skip.
+        with open(path, "r", encoding="utf-8") as f:  # Line by line.
+            for line in f:  # One mutation per line.
+                if not line.endswith("\n"):  # Last line was cut off by a crash (the journal store drops it too).
+                    break  # Stop at the torn write.
+                try:  # Parse the entry.
+                    op = json.loads(line)  # Decode.
+                except ValueError:  # Corrupt line.
+                    break  # Ignore the rest, like the journal store does.
+                if op.get("seq", 0) > seq:  # Not covered by the snapshot.
+                    _apply_op(conn, op)  # Replay.
+                    counts["journal"] += 1  # Count.
+                    last = max(last, op.get("seq", 0))  # Newest version seen.
+    conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (max(seq, last),))  # Continue the JSON store's versions.
+    conn.execute("COMMIT")  # Last batch.
+    try:  # Build the full-text index in two set-based statements.
+        conn.execute(FTS_SCHEMA)  # Create.
+        conn.execute("INSERT INTO search (rowid, body, chat_id) SELECT -rowid, title, id FROM chats")  # Title rows.
+        conn.execute("INSERT INTO search (rowid, body, chat_id) SELECT seq, content, chat_id FROM messages WHERE content != ''")  # Message rows.
+    except sqlite3.OperationalError:  # SQLite without FTS5.
+        pass  # The store falls back to title search.
+    conn.execute("PRAGMA synchronous=FULL")  # Durable from here.
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # Move everything into the main database file.
+    conn.close()  # Done.
+    return counts  # Summary.
+
+
+def main(argv: Any = None) -> int:  # Command-line entry point.
+    parser = argparse.ArgumentParser(description="Import chats.json (and its journal) into a SQLite database.")  # CLI.
+    parser.add_argument("src", help="path to chats.json")  # Source.
+    parser.add_argument("dst", help="path to the new SQLite file (then set DATA_FILE=sqlite://<dst>)")  # Target.
+    parser.add_argument("--batch", type=int, default=500, help="chats per transaction")  # Batch size.
+    args = parser.parse_args(argv)  # Parse.
+    counts = migrate(args.src, args.dst, batch=args.batch)  # Run.
+    print(f"imported {counts['chats']} chats, {counts['messages']} messages, {counts['journal']} journal entries")  # Report.
+    return 0  # Success.
+
+
+if __name__ == "__main__":  # python -m app.migrate_sqlite data/chats.json data/chats.db
+    sys.exit(main())  # Exit status.
+
+
+16) backend/bench/stub_llm.py (local fake LLM for benchmarks)
+Speaks both upstream protocols: POST /chat streams one token per line (llm_client.LLMClient) and
+POST /vox streams `data: {...}` SSE frames ending in `data: [DONE]` (mcall.LLMClient).
+First-token latency, token rate and reply length are configurable, so results do not depend on a real provider.
+Run: python -m bench.stub_llm --port 9100 --latency-ms 200 --tokens-per-s 50 --reply-tokens 100
+(loadtest.py starts it for you; for VOX point VESSSEL_OPENAI_API at http://127.0.0.1:9100/vox).
+
+import json  # Import json to encode VOX SSE frames.
+import time  # Import time to pace tokens on an absolute schedule.
+import random  # Import random for latency jitter.
+import asyncio  # Import asyncio for non-blocking sleeps.
+import argparse  # Import argparse for the command line.
+from typing import AsyncGenerator, Dict  # Import types for clarity.
+from fastapi import FastAPI, Request  # Import FastAPI to serve the fake endpoints.
+from fastapi.responses import StreamingResponse  # Import StreamingResponse to stream tokens.
+
+WORDS = ("the", "service", "streams", "tokens", "quickly", "while", "latency", "stays", "low", "and", "stable")  # Reply vocabulary.
+
+
+class StubConfig:  # Timing of every fake reply.
+    def __init__(self, latency_ms: float = 200.0, tokens_per_s: float = 50.0, reply_tokens: int = 100, jitter_ms: float = 0.0) -> None:  # Settings.
+        self.latency_ms = latency_ms  # Delay before the first token (model "thinking" time).
+        self.tokens_per_s = tokens_per_s  # Token rate after the first token (0 = as fast as possible).
+        self.reply_tokens = reply_tokens  # Tokens per reply.
+        self.jitter_ms = jitter_ms  # Random extra first-token delay (0..jitter).
+
+
+config = StubConfig()  # Replaced from the command line in main().
+stats: Dict[str, int] = {"requests": 0, "active": 0, "maxActive": 0, "tokens": 0}  # Counters (GET /stats).
+app = FastAPI()  # Stub app.
+
+
+async def tokens() -> AsyncGenerator[str, None]:  # Yield one reply at the configured pace.
+    stats["requests"] += 1  # Count request.
+    stats["active"] += 1  # Concurrent upstream streams (checks the app's admission control).
+    stats["maxActive"] = max(stats["maxActive"], stats["active"])  # High-water mark.
+    try:  # Always decrement.
+        await asyncio.sleep((config.latency_ms + random.uniform(0, config.jitter_ms)) / 1000.0)  # Time to first token.
+        start = time.monotonic()  # Pace from here.
+        for i in range(config.reply_tokens):  # Each token.
+            if config.tokens_per_s > 0:  # Rate-limited.
+                delay = start + i / config.tokens_per_s - time.monotonic()  # Absolute schedule (no drift).
+                if delay > 0:  # Ahead of schedule.
+                    await asyncio.sleep(delay)  # Wait.
+            stats["tokens"] += 1  # Count token.
+            yield WORDS[i % len(WORDS)] + " "  # One word per token.
+    finally:  # Done or client gone.
+        stats["active"] -= 1  # One fewer stream.
+
+
+async def line_stream() -> AsyncGenerator[bytes, None]:  # llm_client.LLMClient protocol: one delta per line.
+    async for token in tokens():  # Paced tokens.
+        yield (token + "\n").encode("utf-8")  # Line.
+
+
+async def vox_stream() -> AsyncGenerator[bytes, None]:  # mcall.LLMClient protocol: OpenAI-style SSE.
+    async for token in tokens():  # Paced tokens.
+        yield f"data: {json.dumps({'choices': [{'delta': {'content': token}}]})}\n\n".encode("utf-8")  # SSE frame.
+    yield b"data: [DONE]\n\n"  # End marker.
+
+
+@app.post("/chat")  # Define endpoint: POST /chat (LLM_BASE_URL)
+async def chat(request: Request):  # Body is ignored (prompt size does not change the timing).
+    await request.body()  # Read the request like a real server would.
+    return StreamingResponse(line_stream(), media_type="text/plain")  # Line stream.
+
+
+@app.post("/vox")  # Define endpoint: POST /vox (VESSSEL_OPENAI_API)
+async def vox(request: Request):  # Body is ignored.
+    await request.body()  # Read the request.
+    return StreamingResponse(vox_stream(), media_type="text/event-stream")  # SSE stream.
+
+
+@app.get("/stats")  # Define endpoint: GET /stats
+async def get_stats():  # Counters since start.
+    return stats  # Requests, active/max concurrent streams, tokens sent.
+
+
+def main() -> None:  # Command-line entry point.
+    import uvicorn  # Imported here so the module can be imported without starting a server.
+    parser = argparse.ArgumentParser(description="Fake streaming LLM for benchmarks.")  # CLI.
+    parser.add_argument("--host", default="127.0.0.1")  # Bind address.
+    parser.add_argument("--port", type=int, default=9100)  # Port.
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="delay before the first token")  # TTFT.
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="random extra first-token delay")  # Jitter.
+    parser.add_argument("--tokens-per-s", type=float, default=50.0, help="token rate (0 = unthrottled)")  # Rate.
+    parser.add_argument("--reply-tokens", type=int, default=100, help="tokens per reply")  # Length.
+    args = parser.parse_args()  # Parse.
+    global config  # Read by tokens() on every request.
+    config = StubConfig(args.latency_ms, args.tokens_per_s, args.reply_tokens, args.jitter_ms)  # Apply settings.
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")  # Serve.
+
+
+if __name__ == "__main__":  # python -m bench.stub_llm
+    main()  # Run.
+
+
+17) backend/bench/loadtest.py (benchmark + load test)
+Generates a chats.json of the requested size, starts the stub LLM and the app (uvicorn, one worker), then
+drives every /api/chats* route at a fixed concurrency. Reports p50/p95/p99 latency and throughput per route,
+time-to-first-token and tokens/sec for /stream, and writes everything to a JSON file for later comparison.
+Run from backend/: python -m bench.loadtest --chats 500 --messages 40 --concurrency 16 --out bench.json
+Compare two runs: python -m bench.loadtest --compare before.json after.json
+
+import os  # Import os for paths and the child environment.
+import re  # Import re to count streamed words (one stub token per word).
+import sys  # Import sys for the interpreter path and exit status.
+import json  # Import json for the store file, SSE payloads and results.
+import time  # Import time for latency measurement.
+import uuid  # Import uuid to build chat and message ids.
+import random  # Import random for reproducible generated content.
+import socket  # Import socket to pick free ports.
+import asyncio  # Import asyncio to run concurrent clients.
+import argparse  # Import argparse for the command line.
+import platform  # Import platform to record where the run happened.
+import tempfile  # Import tempfile for the generated data directory.
+import subprocess  # Import subprocess to run the stub, the app and the migration.
+from datetime import datetime, timedelta, timezone  # Import datetime to build timestamps.
+from typing import Any, Awaitable, Callable, Dict, List, Optional  # Import types for clarity.
+import httpx  # Import httpx as the load-generating client.
+
+WORDS = ("alpha", "deploy", "service", "latency", "budget", "python", "cache", "stream", "index", "review", "token", "queue")  # Content vocabulary.
+
+
+def percentile(sorted_values: List[float], p: float) -> float:  # Nearest-rank percentile of a sorted list.
+    if not sorted_values:  # No samples.
+        return 0.0  # Nothing to report.
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100.0 * len(sorted_values) + 0.5)) - 1))  # Nearest rank.
+    return sorted_values[k]  # Value.
+
+
+def summarize(values_s: List[float]) -> Dict[str, float]:  # Latency distribution in milliseconds.
+    v = sorted(x * 1000.0 for x in values_s)  # Milliseconds, sorted.
+    return {  # Distribution.
+        "p50": round(percentile(v, 50), 2),  # Median.
+        "p95": round(percentile(v, 95), 2),  # Tail.
+        "p99": round(percentile(v, 99), 2),  # Far tail.
+        "mean": round(sum(v) / len(v), 2) if v else 0.0,  # Mean.
+        "max": round(v[-1], 2) if v else 0.0,  # Worst.
+    }
+
+
+def generate_store(path: str, chats: int, messages: int, message_chars: int, seed: int = 1) -> List[str]:  # Write chats.json; return chat ids.
+    rng = random.Random(seed)  # Reproducible content.
+    now = datetime.now(timezone.utc)  # Newest timestamp.
+    data = {"seq": 0, "chats": []}  # Store layout used by JsonChatStore.
+    for i in range(chats):  # Each chat.
+        updated = now - timedelta(minutes=i)  # Distinct, ordered timestamps.
+        msgs = []  # Messages, oldest first.
+        for j in range(messages):  # Each message.
+            words, size = [], 0  # Build content of ~message_chars.
+            while size < message_chars:  # Until long enough.
+                w = rng.choice(WORDS)  # Next word.
+                words.append(w)  # Append.
+                size += len(w) + 1  # Plus space.
+            content = " ".join(words)  # Message text.
+            msgs.append({  # Message shape used by the stores.
+                "id": str(uuid.uuid4()),  # Message id.
+                "role": "user" if j % 2 == 0 else "assistant",  # Alternate roles.
+                "content": content,  # Text.
+                "createdAt": (updated - timedelta(seconds=messages - j)).isoformat(),  # Oldest first.
+                "tokens": max(1, len(content) // 4),  # Approximate count (like context.count_tokens without tiktoken).
+            })
+        data["chats"].append({"id": str(uuid.uuid4()), "title": f"Bench chat {i} {rng.choice(WORDS)}", "updatedAt": updated.isoformat(), "messages": msgs})  # Chat.
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)  # Create directory.
+    with open(path, "w", encoding="utf-8") as f:  # Write the store.
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))  # Compact, like the store writes it.
+    return [c["id"] for c in data["chats"]]  # Ids for the scenarios.
+
+
+def free_port() -> int:  # Ask the OS for an unused TCP port.
+    with socket.socket() as s:  # Temporary socket.
+        s.bind(("127.0.0.1", 0))  # Any port.
+        return s.getsockname()[1]  # Port number.
+
+
+async def wait_ready(url: str, proc: subprocess.Popen, timeout_s: float = 30.0) -> None:  # Poll until a child server answers.
+    deadline = time.monotonic() + timeout_s  # Give up after this.
+    async with httpx.AsyncClient() as client:  # Short-lived client.
+        while True:  # Until ready.
+            try:  # Server may still be starting.
+                await client.get(url, timeout=1.0)  # Any response means it is up.
+                return  # Ready.
+            except httpx.HTTPError:  # Not listening yet.
+                if proc.poll() is not None:  # Exited (import error, port in use, ...).
+                    raise RuntimeError(f"{url}: server exited with status {proc.returncode}")  # Abort (log is printed by run()).
+                if time.monotonic() > deadline:  # Took too long.
+                    raise RuntimeError(f"{url} did not start within {timeout_s:.0f}s")  # Abort.
+                await asyncio.sleep(0.1)  # Retry.
+
+
+class RouteResult:  # Samples for one scenario.
+    def __init__(self) -> None:  # Empty.
+        self.latencies: List[float] = []  # Seconds per successful request.
+        self.status: Dict[str, int] = {}  # Count per HTTP status (or exception name).
+        self.elapsed = 0.0  # Wall time of the scenario.
+
+    def record(self, status: str, latency: float, ok: bool) -> None:  # Add one sample.
+        self.status[status] = self.status.get(status, 0) + 1  # Count status.
+        if ok:  # Only successful requests count towards latency.
+            self.latencies.append(latency)  # Keep sample.
+
+    def report(self) -> Dict[str, Any]:  # JSON-ready summary.
+        n = sum(self.status.values())  # Requests sent.
+        return {  # Summary.
+            "requests": n,  # Total.
+            "ok": len(self.latencies),  # Successful.
+            "status": self.status,  # Breakdown.
+            "throughputRps": round(len(self.latencies) / self.elapsed, 2) if self.elapsed else 0.0,  # Successful requests per second.
+            "latencyMs": summarize(self.latencies),  # Distribution.
+        }
+
+
+async def run_scenario(requests: int, concurrency: int, one: Callable[[int], Awaitable[Any]]) -> RouteResult:  # Run `requests` calls with `concurrency` workers.
+    result = RouteResult()  # Samples.
+    counter = iter(range(requests))  # Shared work queue (next() is atomic on the loop).
+
+    async def worker() -> None:  # One client.
+        for i in counter:  # Take the next request number.
+            started = time.perf_counter()  # Start clock.
+            try:  # Network errors are recorded, not raised.
+                status = await one(i)  # Send + read the full response.
+                result.record(str(status), time.perf_counter() - started, 200 <= status < 300 or status == 304)  # Sample (304 = revalidated).
+            except Exception as e:  # Timeout, connection reset, ...
+                result.record(type(e).__name__, time.perf_counter() - started, False)  # Count failure.
+
+    started = time.perf_counter()  # Scenario clock.
+    await asyncio.gather(*(worker() for _ in range(concurrency)))  # Run workers.
+    result.elapsed = time.perf_counter() - started  # Wall time.
+    return result  # Samples.
+
+
+async def stream_once(client: httpx.AsyncClient, chat_id: str, user: str, sample: Dict[str, List[float]]) -> int:  # One POST /stream; record TTFT + rate.
+    started = time.perf_counter()  # Request start.
+    first = None  # Time of the first delta.
+    words = 0  # Streamed words (= stub tokens).
+    event = ""  # Current SSE event name.
+    async with client.stream("POST", f"/api/chats/{chat_id}/stream", json={"message": "benchmark question"}, headers={"X-User-Id": user}) as r:  # Open stream.
+        if r.status_code != 200:  # Rejected (e.g. 429 from admission control).
+            await r.aread()  # Drain.
+            return r.status_code  # Status.
+        async for line in r.aiter_lines():  # Read SSE.
+            if line.startswith("event:"):  # Event name.
+                event = line[len("event:"):].strip()  # Remember.
+            elif line.startswith("data:") and event == "delta":  # Text frame.
+                if first is None:  # First token reached the client.
+                    first = time.perf_counter()  # TTFT mark.
+                words += len(re.findall(r"\S+", json.loads(line[len("data:"):])["text"]))  # Count tokens.
+            elif line.startswith("data:") and event == "error":  # Generation failed.
+                return 599  # Count as failure.
+    end = time.perf_counter()  # Stream end.
+    sample["tokens"].append(words)  # For the aggregate rate.
+    if first is not None:  # Got text.
+        sample["ttft"].append(first - started)  # Time to first token.
+        if end > first and words > 1:  # Enough to measure a rate.
+            sample["tokensPerS"].append((words - 1) / (end - first))  # Rate after the first token.
+    return r.status_code  # Status.
+
+
+async def run_benchmarks(base_url: str, chat_ids: List[str], args: argparse.Namespace) -> Dict[str, Any]:  # Drive every route.
+    limits = httpx.Limits(max_connections=max(args.concurrency, args.stream_concurrency) * 2)  # Enough connections for every worker.
+    timeout = httpx.Timeout(args.timeout_s)  # Per-request timeout.
+    rng = random.Random(2)  # Reproducible chat choice.
+    pick = lambda: rng.choice(chat_ids)  # Random existing chat.
+    created: List[str] = []  # Chats made by POST, deleted by DELETE.
+    etags: Dict[str, str] = {}  # Chat id -> ETag of the history last fetched (revalidation scenario).
+    routes: Dict[str, Any] = {}  # Results.
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:  # Shared keep-alive client.
+
+        async def get(path: str, **params: Any) -> int:  # GET and read the whole body.
+            r = await client.get(path, params=params)  # Request.
+            return r.status_code  # Status.
+
+        async def revalidate(i: int) -> int:  # Conditional GET of a history the client already has (304 while unchanged).
+            chat_id = pick()  # Random chat.
+            r = await client.get(f"/api/chats/{chat_id}/messages", headers={"If-None-Match": etags.get(chat_id, "")})  # Revalidate.
+            if r.status_code == 200:  # First fetch (or changed): remember the new tag.
+                etags[chat_id] = r.headers.get("ETag", "")  # Validator.
+            return r.status_code  # Status.
+
+        async def post_chat(i: int) -> int:  # POST /api/chats.
+            r = await client.post("/api/chats", json={"title": f"created {i}"})  # Create.
+            if r.status_code == 200:  # Created.
+                created.append(r.json()["id"])  # Delete later.
+            return r.status_code  # Status.
+
+        scenarios: List[tuple] = [  # (name, call) in run order; writes last so reads see the generated store.
+            ("GET /api/chats?limit=50", lambda i: get("/api/chats", limit=50)),  # First sidebar page.
+            ("GET /api/chats", lambda i: get("/api/chats")),  # Full list.
+            ("GET /api/chats?search=", lambda i: get("/api/chats", search=WORDS[i % len(WORDS)])),  # Full-text search.
+            ("GET /api/chats/{id}/messages?limit=50", lambda i: get(f"/api/chats/{pick()}/messages", limit=50)),  # Newest page.
+            ("GET /api/chats/{id}/messages", lambda i: get(f"/api/chats/{pick()}/messages")),  # Whole history.
+            ("GET /api/chats/{id}/messages If-None-Match", revalidate),  # Same, revalidated with the ETag (mostly 304).
+            ("POST /api/chats", post_chat),  # Create.
+            ("PATCH /api/chats/{id}", lambda i: client.patch(f"/api/chats/{pick()}", json={"title": f"renamed {i}"})),  # Rename.
+            ("DELETE /api/chats/{id}", lambda i: client.delete(f"/api/chats/{created[i]}")),  # Delete the created chats.
+        ]
+        for name, call in scenarios:  # One scenario at a time (no cross-talk).
+            if args.routes and not any(r in name for r in args.routes):  # Filtered out.
+                continue  # Skip.
+            n = min(args.requests, len(created)) if name.startswith("DELETE") else args.requests  # Only delete what exists.
+
+            async def one(i: int, call=call) -> int:  # Normalize to a status code.
+                r = await call(i)  # Request.
+                return r if isinstance(r, int) else r.status_code  # Status.
+
+            routes[name] = (await run_scenario(n, args.concurrency, one)).report()  # Run + summarize.
+            print(f"{name:42s} {routes[name]['throughputRps']:>9.1f} rps  p50 {routes[name]['latencyMs']['p50']:>8.2f}  p95 {routes[name]['latencyMs']['p95']:>8.2f}  p99 {routes[name]['latencyMs']['p99']:>8.2f} ms")  # Progress.
+
+        stream: Dict[str, Any] = {}  # Streaming results.
+        if args.stream_requests and (not args.routes or any("stream" in r for r in args.routes)):  # Streaming scenario enabled.
+            sample: Dict[str, List[float]] = {"ttft": [], "tokensPerS": [], "tokens": []}  # Per-stream samples.
+            users = args.users or args.stream_concurrency  # Distinct X-User-Id values (per-user limits).
+            result = await run_scenario(  # Concurrent streams.
+                args.stream_requests, args.stream_concurrency,  # Size.
+                lambda i: stream_once(client, pick(), f"bench-{i % users}", sample),  # One stream.
+            )
+            rates = sorted(sample["tokensPerS"])  # Per-stream token rates.
+            stream = result.report()  # Whole-stream latency + throughput.
+            stream["ttftMs"] = summarize(sample["ttft"])  # Time to first token.
+            stream["tokensPerS"] = {"p50": round(percentile(rates, 50), 2), "p5": round(percentile(rates, 5), 2), "mean": round(sum(rates) / len(rates), 2) if rates else 0.0}  # Rate per stream.
+            stream["totalTokensPerS"] = round(sum(sample["tokens"]) / result.elapsed, 2) if result.elapsed else 0.0  # Tokens delivered per second, all streams.
+            print(f"{'POST /api/chats/{id}/stream':42s} ttft p50 {stream['ttftMs']['p50']:.1f} p95 {stream['ttftMs']['p95']:.1f} ms  {stream['tokensPerS']['p50']:.1f} tok/s per stream  {stream['status']}")  # Progress.
+            try:  # Stub counters (how many streams really ran at once).
+                stream["upstream"] = (await client.get(args.stub_url + "/stats")).json() if args.stub_url else None  # Stub stats.
+            except httpx.HTTPError:  # Stub not reachable (external run).
+                stream["upstream"] = None  # Unknown.
+    return {"routes": routes, "stream": stream}  # Results.
+
+
+def compare(old_path: str, new_path: str) -> int:  # Print per-route latency/throughput change between two result files.
+    with open(old_path, encoding="utf-8") as f:  # Baseline.
+        old = json.load(f)  # Parse.
+    with open(new_path, encoding="utf-8") as f:  # Candidate.
+        new = json.load(f)  # Parse.
+    pct = lambda a, b: f"{(b - a) / a * 100:+7.1f}%" if a else "    n/a"  # Relative change.
+    for name, r in new["routes"].items():  # Each route in the new run.
+        o = old["routes"].get(name)  # Same route in the baseline.
+        if o is None:  # Not measured before.
+            continue  # Skip.
+        print(f"{name:42s} rps {pct(o['throughputRps'], r['throughputRps'])}  p50 {pct(o['latencyMs']['p50'], r['latencyMs']['p50'])}  p95 {pct(o['latencyMs']['p95'], r['latencyMs']['p95'])}  p99 {pct(o['latencyMs']['p99'], r['latencyMs']['p99'])}")  # Change.
+    if old.get("stream") and new.get("stream"):  # Both measured streaming.
+        o, r = old["stream"], new["stream"]  # Stream results.
+        print(f"{'POST /api/chats/{id}/stream':42s} ttft p50 {pct(o['ttftMs']['p50'], r['ttftMs']['p50'])}  p95 {pct(o['ttftMs']['p95'], r['ttftMs']['p95'])}  tok/s {pct(o['tokensPerS']['p50'], r['tokensPerS']['p50'])}")  # Change.
+    return 0  # Success.
+
+
+def start(cmd: List[str], env: Dict[str, str], cwd: str, log_path: str) -> subprocess.Popen:  # Start a child server process.
+    with open(log_path, "wb") as log:  # Output goes to a file (a full pipe would stall the server).
+        return subprocess.Popen(cmd, env=env, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)  # Child keeps its own handle.
+
+
+def stop(proc: Optional[subprocess.Popen]) -> None:  # Graceful shutdown (lets the app flush its store).
+    if proc is None or proc.poll() is not None:  # Not running.
+        return  # Nothing to do.
+    proc.terminate()  # SIGTERM: uvicorn runs the lifespan shutdown.
+    try:  # Wait a little.
+        proc.wait(timeout=15)  # Normal exit.
+    except subprocess.TimeoutExpired:  # Stuck.
+        proc.kill()  # Force.
+
+
+async def existing_chats(base_url: str) -> List[str]:  # Chat ids of an already running server (--url).
+    async with httpx.AsyncClient(base_url=base_url) as client:  # Short-lived client.
+        r = await client.get("/api/chats")  # Full list.
+        r.raise_for_status()  # Must be reachable.
+        ids = [c["id"] for c in r.json()]  # Ids.
+    if not ids:  # Nothing to read.
+        raise SystemExit(f"{base_url} has no chats to benchmark")  # Abort.
+    return ids  # Ids.
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:  # Set up data + servers, run, tear down.
+    if args.url:  # External server: use its data as-is.
+        results = await run_benchmarks(args.url, await existing_chats(args.url), args)  # Measure.
+        return {"meta": {"startedAt": datetime.now(timezone.utc).isoformat(), "url": args.url, "concurrency": args.concurrency, "requests": args.requests}, **results}  # Results.
+    work = tempfile.mkdtemp(prefix="chatbench-")  # Scratch directory (generated store lives here).
+    json_path = os.path.join(work, "chats.json")  # Generated snapshot.
+    t0 = time.perf_counter()  # Generation clock.
+    chat_ids = generate_store(json_path, args.chats, args.messages, args.message_chars, seed=args.seed)  # Build data.
+    data_file = json_path  # Plain JSON mode.
+    if args.store == "journal":  # Journal mode reads the same snapshot.
+        data_file = "journal://" + json_path  # Scheme.
+    elif args.store == "sqlite":  # SQLite mode: import with the real migration tool.
+        db_path = os.path.join(work, "chats.db")  # Target.
+        pkg = args.app.split(":")[0].rsplit(".", 1)[0]  # Package that holds migrate_sqlite (e.g. "app").
+        subprocess.run([sys.executable, "-m", f"{pkg}.migrate_sqlite", json_path, db_path], cwd=args.cwd, check=True, stdout=subprocess.DEVNULL)  # Import.
+        data_file = "sqlite://" + db_path  # Scheme.
+    setup_s = time.perf_counter() - t0  # Generation time.
+    size = os.path.getsize(json_path)  # Store size.
+    print(f"store: {args.chats} chats x {args.messages} messages, {size / 1e6:.1f} MB ({args.store}), generated in {setup_s:.1f}s")  # Progress.
+
+    stub = app = None  # Child processes.
+    try:  # Always stop children.
+        stub_port, app_port = free_port(), free_port()  # Ports.
+        env = dict(os.environ)  # Inherit settings (e.g. STREAM_MAX_ACTIVE), then point at the generated data + stub.
+        stub = start([  # Fake LLM.
+            sys.executable, "-m", "bench.stub_llm", "--port", str(stub_port),  # Server.
+            "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),  # First-token delay.
+            "--tokens-per-s", str(args.tokens_per_s), "--reply-tokens", str(args.reply_tokens),  # Rate + length.
+        ], env, args.cwd, os.path.join(work, "stub.log"))
+        args.stub_url = f"http://127.0.0.1:{stub_port}"  # For GET /stats.
+        env.update({"DATA_FILE": data_file, "LLM_BASE_URL": args.stub_url, "LLM_API_KEY": "bench"})  # Store + upstream.
+        app = start([sys.executable, "-m", "uvicorn", args.app, "--port", str(app_port), "--log-level", "warning"], env, args.cwd, os.path.join(work, "app.log"))  # App.
+        base_url = f"http://127.0.0.1:{app_port}"  # Target.
+        await wait_ready(args.stub_url + "/stats", stub)  # Stub up.
+        await wait_ready(base_url + "/api/chats?limit=1", app, timeout_s=120.0)  # App up (first request loads the store).
+        results = await run_benchmarks(base_url, chat_ids, args)  # Measure.
+    finally:  # Tear down.
+        stop(app)  # App first (flushes writes).
+        stop(stub)  # Then the stub.
+        for name, proc in (("app", app), ("stub", stub)):  # Show output of a child that crashed.
+            if proc is not None and proc.returncode not in (0, -15):  # Not a clean SIGTERM exit.
+                with open(os.path.join(work, f"{name}.log"), encoding="utf-8", errors="replace") as f:  # Its output.
+                    sys.stderr.write(f.read()[-4000:])  # Show why.
+    return {  # Result file content.
+        "meta": {  # Run description (compare like with like).
+            "startedAt": datetime.now(timezone.utc).isoformat(),  # When.
+            "python": platform.python_version(),  # Interpreter.
+            "platform": platform.platform(),  # OS.
+            "store": args.store, "chats": args.chats, "messages": args.messages, "messageChars": args.message_chars, "storeBytes": size,  # Data.
+            "concurrency": args.concurrency, "requests": args.requests,  # Route load.
+            "streamConcurrency": args.stream_concurrency, "streamRequests": args.stream_requests,  # Stream load.
+            "stub": {"latencyMs": args.latency_ms, "jitterMs": args.jitter_ms, "tokensPerS": args.tokens_per_s, "replyTokens": args.reply_tokens},  # Upstream.
+            "env": {k: v for k, v in os.environ.items() if k.startswith(("STORE_", "STREAM_", "SSE_", "LLM_CACHE", "CONTEXT_", "SQLITE_"))},  # Tuning in effect.
+        },
+        **results,  # Routes + stream.
+    }
+
+
+def main(argv: Any = None) -> int:  # Command-line entry point.
+    parser = argparse.ArgumentParser(description="Benchmark the chat API against a local stub LLM.")  # CLI.
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")  # Comparison mode.
+    parser.add_argument("--chats", type=int, default=200, help="chats in the generated store")  # Store size.
+    parser.add_argument("--messages", type=int, default=40, help="messages per chat")  # Store size.
+    parser.add_argument("--message-chars", type=int, default=200, help="characters per message")  # Store size.
+    parser.add_argument("--store", choices=("json", "journal", "sqlite"), default="json", help="DATA_FILE mode")  # Backend.
+    parser.add_argument("--seed", type=int, default=1, help="content seed")  # Reproducibility.
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients per route")  # Route load.
+    parser.add_argument("--requests", type=int, default=500, help="requests per route")  # Route load.
+    parser.add_argument("--routes", nargs="*", help="only scenarios whose name contains one of these (e.g. messages search stream)")  # Filter.
+    parser.add_argument("--stream-concurrency", type=int, default=8, help="concurrent /stream clients")  # Stream load.
+    parser.add_argument("--stream-requests", type=int, default=50, help="number of /stream requests (0 = skip)")  # Stream load.
+    parser.add_argument("--users", type=int, default=0, help="distinct X-User-Id values for /stream (default: one per client)")  # Fairness keys.
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="stub first-token latency")  # Stub.
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="stub random extra first-token latency")  # Stub.
+    parser.add_argument("--tokens-per-s", type=float, default=50.0, help="stub token rate (0 = unthrottled)")  # Stub.
+    parser.add_argument("--reply-tokens", type=int, default=100, help="stub tokens per reply")  # Stub.
+    parser.add_argument("--timeout-s", type=float, default=60.0, help="client timeout per request")  # Client.
+    parser.add_argument("--app", default="app.main:app", help="uvicorn app to start")  # Target app.
+    parser.add_argument("--cwd", default=".", help="directory to start the app from (backend/)")  # Import root.
+    parser.add_argument("--url", help="benchmark an already running server instead (its store must hold the generated chats)")  # External server.
+    parser.add_argument("--out", default="bench.json", help="result file")  # Output.
+    args = parser.parse_args(argv)  # Parse.
+    if args.compare:  # Comparison only.
+        return compare(*args.compare)  # Print diff.
+    args.stub_url = None  # Set when the stub is started.
+    results = asyncio.run(run(args))  # Run.
+    with open(args.out, "w", encoding="utf-8") as f:  # Save.
+        json.dump(results, f, indent=2)  # Human-readable.
+    print(f"results written to {args.out}")  # Done.
+    return 0  # Success.
+
+
+if __name__ == "__main__":  # python -m bench.loadtest
+    sys.exit(main())  # Exit status.
+
+
+18) backend/app/metrics.py (Prometheus /metrics + per-request sampling profiler)
+Counters, gauges and histograms in the Prometheus text format (no extra dependency), the metrics the
+routes, stores and LLM clients record, an ASGI middleware for per-route latency + in-flight counts, and an
+opt-in stack sampler: with PROFILE_DIR and PROFILE_TOKEN set, a request carrying `X-Profile: <PROFILE_TOKEN>` writes a
+collapsed-stack profile (flamegraph.pl / speedscope) of the whole process while that request runs.
+
+import os  # Import os to build profile file paths.
+import re  # Import re to make route names safe for file names.
+import hmac  # Import hmac for a constant-time X-Profile token check.
+import sys  # Import sys to sample thread stacks.
+import time  # Import time for durations.
+import asyncio  # Import asyncio to write profiles off the event loop.
+import threading  # Import threading for metric locks and the sampler thread.
+from contextlib import contextmanager  # Import contextmanager for the timing helper.
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple  # Import types for clarity.
+from starlette.datastructures import Headers, MutableHeaders  # Import header helpers for the middleware.
+from starlette.routing import Match  # Import Match to find the route template of a request.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # Seconds.
+BYTES_BUCKETS = tuple(256 * 4 ** i for i in range(11))  # 256 B .. 256 MiB.
+RATE_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 400, 800)  # Tokens per second.
+
+
+def _escape(value: str) -> str:  # Label value escaping (text format).
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')  # Backslash, newline, quote.
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:  # Render {a="x",b="y"}.
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]  # Pairs.
+    if extra:  # E.g. le="0.5" for histogram buckets.
+        parts.append(extra)  # Append.
+    return "{" + ",".join(parts) + "}" if parts else ""  # Empty when unlabeled.
+
+
+def _num(value: float) -> str:  # Prometheus number formatting.
+    return "+Inf" if value == float("inf") else repr(float(value)) if isinstance(value, float) else str(value)  # Stable output.
+
+
+class Metric:  # Base: name, help text, label names, thread-safe series map.
+    kind = "untyped"  # Prometheus TYPE.
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> None:  # Describe the metric.
+        self.name = name  # Metric name.
+        self.help = help_text  # HELP line.
+        self.label_names = labels  # Label names (values are passed positionally).
+        self._lock = threading.Lock()  # Stores and LLM clients record from worker threads too.
+        self._series: Dict[Tuple[str, ...], Any] = {}  # Label values -> value.
+
+    def render(self) -> List[str]:  # Text-format lines.
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]  # Header.
+        with self._lock:  # Consistent copy.
+            series = list(self._series.items())  # Snapshot.
+        for values, value in sorted(series):  # Stable order.
+            lines.extend(self._render_series(values, value))  # Series lines.
+        return lines  # Lines.
+
+    def _render_series(self, values: Tuple[str, ...], value: Any) -> List[str]:  # One series.
+        return [f"{self.name}{_labels(self.label_names, values)} {_num(value)}"]  # Single sample.
+
+
+class Counter(Metric):  # Monotonic count.
+    kind = "counter"  # TYPE.
+
+    def inc(self, *labels: str, amount: float = 1) -> None:  # Add to the series for these label values.
+        with self._lock:  # Atomic update.
+            self._series[labels] = self._series.get(labels, 0) + amount  # Increment.
+
+
+class Gauge(Metric):  # Value that goes up and down.
+    kind = "gauge"  # TYPE.
+
+    def inc(self, *labels: str, amount: float = 1) -> None:  # Increase.
+        with self._lock:  # Atomic update.
+            self._series[labels] = self._series.get(labels, 0) + amount  # Increment.
+
+    def dec(self, *labels: str, amount: float = 1) -> None:  # Decrease.
+        self.inc(*labels, amount=-amount)  # Negative increment.
+
+    def set(self, *labels: str, value: float) -> None:  # Overwrite.
+        with self._lock:  # Atomic update.
+            self._series[labels] = value  # Set.
+
+
+class Histogram(Metric):  # Bucketed distribution (cumulative buckets + sum + count).
+    kind = "histogram"  # TYPE.
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:  # Describe.
+        super().__init__(name, help_text, labels)  # Base.
+        self.buckets = tuple(sorted(buckets))  # Upper bounds (+Inf is implicit).
+
+    def observe(self, value: float, *labels: str) -> None:  # Record one sample.
+        with self._lock:  # Atomic update.
+            s = self._series.get(labels)  # [bucket counts..., +Inf count, sum].
+            if s is None:  # First sample for these labels.
+                s = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]  # Fresh series.
+            i = 0  # First bucket the value fits (non-cumulative; summed at render time).
+            while i < len(self.buckets) and value > self.buckets[i]:  # Short list; linear scan is fine.
+                i += 1  # Next bucket.
+            s[i] += 1  # Count.
+            s[-1] += value  # Sum.
+
+    @contextmanager  # Usage: with HIST.time("label"): ...
+    def time(self, *labels: str) -> Iterator[None]:  # Observe the duration of a block.
+        started = time.perf_counter()  # Start clock.
+        try:  # Observe even on error.
+            yield  # Run block.
+        finally:  # Always.
+            self.observe(time.perf_counter() - started, *labels)  # Record.
+
+    def _render_series(self, values: Tuple[str, ...], s: List[float]) -> List[str]:  # Buckets, sum and count.
+        lines, total = [], 0  # Output + cumulative count.
+        for bound, n in zip(self.buckets + (float("inf"),), s[:-1]):  # Each bucket.
+            total += n  # Cumulative.
+            le = 'le="%s"' % _num(bound)  # Upper bound label.
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, values, le)} {total}")  # Bucket line.
+        lines.append(f"{self.name}_sum{_labels(self.label_names, values)} {_num(s[-1])}")  # Sum.
+        lines.append(f"{self.name}_count{_labels(self.label_names, values)} {total}")  # Count.
+        return lines  # Lines.
+
+
+class Registry:  # All metrics of the process + callbacks that refresh gauges right before a scrape.
+    def __init__(self) -> None:  # Empty.
+        self._metrics: List[Metric] = []  # Registered metrics.
+        self._collectors: List[Callable[[], None]] = []  # Called before rendering.
+
+    def register(self, metric: Metric) -> Any:  # Add a metric; returns it for one-line definitions.
+        self._metrics.append(metric)  # Keep.
+        return metric  # Same object.
+
+    def on_collect(self, fn: Callable[[], None]) -> None:  # E.g. copy scheduler stats into gauges.
+        self._collectors.append(fn)  # Keep.
+
+    def render(self) -> str:  # Full text exposition.
+        for fn in self._collectors:  # Refresh snapshot gauges.
+            fn()  # Run.
+        lines: List[str] = []  # Output.
+        for m in self._metrics:  # Every metric.
+            lines.extend(m.render())  # Its lines.
+        return "\n".join(lines) + "\n"  # Trailing newline required.
+
+
+REGISTRY = Registry()  # Process-wide registry (one per worker process).
+
+# HTTP (recorded by MetricsMiddleware).
+HTTP_LATENCY = REGISTRY.register(Histogram("http_request_duration_seconds", "Time to the last response byte (streams: whole stream).", ("method", "route", "status")))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge("http_requests_in_flight", "Requests currently being served.", ("method", "route")))
+
+# Chat store (recorded by storage_json / storage_journal).
+STORE_LOCK_WAIT = REGISTRY.register(Histogram("store_lock_wait_seconds", "Time waiting for a store lock.", ("lock",)))
+STORE_COMMIT_WAIT = REGISTRY.register(Histogram("store_commit_wait_seconds", "Time a durable write waited for its group commit.", ("store",)))
+STORE_IO = REGISTRY.register(Histogram("store_io_seconds", "Store file work by phase (read, parse, serialize, write, journal).", ("phase",)))
+STORE_BYTES = REGISTRY.register(Histogram("store_io_bytes", "Bytes per store file operation.", ("phase",), buckets=BYTES_BUCKETS))
+
+# LLM upstream (recorded by llm_client / mcall).
+LLM_REQUESTS = REGISTRY.register(Counter("llm_requests_total", "Upstream LLM calls.", ("provider",)))
+LLM_ERRORS = REGISTRY.register(Counter("llm_errors_total", "Failed upstream LLM calls by kind (timeout, connect, http, other).", ("provider", "kind")))
+LLM_CONNECT = REGISTRY.register(Histogram("llm_connect_seconds", "Request start to response headers (pool wait + connect + server queue).", ("provider",)))
+LLM_TTFT = REGISTRY.register(Histogram("llm_time_to_first_token_seconds", "Request start to first streamed delta.", ("provider",)))
+LLM_TOKEN_RATE = REGISTRY.register(Histogram("llm_tokens_per_second", "Streamed deltas per second after the first one.", ("provider",), buckets=RATE_BUCKETS))
+
+# VOX OAuth token cache (recorded by mcall.TokenCache).
+TOKEN_CACHE = REGISTRY.register(Counter("vox_token_cache_total", "Token lookups and drops by result (hit, miss, invalidated).", ("result",)))
+TOKEN_REFRESH = REGISTRY.register(Histogram("vox_token_refresh_seconds", "Identity provider token calls by outcome (ok, error).", ("outcome",)))
+
+# LLM stream admission (refreshed from StreamScheduler.stats() on scrape, see main.py).
+STREAMS_ACTIVE = REGISTRY.register(Gauge("llm_streams_active", "Upstream streams running now."))
+STREAMS_QUEUED = REGISTRY.register(Gauge("llm_streams_queued", "Streams waiting for a slot."))
+STREAMS_REJECTED = REGISTRY.register(Gauge("llm_streams_rejected", "Streams rejected with 429 since start."))
+
+
+class LLMCall:  # Timing of one upstream call; `with LLMCall("http") as call:` around the request + stream.
+    def __init__(self, provider: str) -> None:  # Provider label ("http", "vox", "demo").
+        self.provider = provider  # Label.
+        self.started = 0.0  # Request start.
+        self.first = 0.0  # First delta time.
+        self.last = 0.0  # Latest delta time.
+        self.deltas = 0  # Deltas received.
+        self.failed = False  # Recorded as an error without raising (see error()).
+
+    def __enter__(self) -> "LLMCall":  # Start clock.
+        LLM_REQUESTS.inc(self.provider)  # Count call.
+        self.started = time.perf_counter()  # Start.
+        return self  # Tracker.
+
+    def connected(self) -> None:  # Response headers arrived.
+        LLM_CONNECT.observe(time.perf_counter() - self.started, self.provider)  # Connect time.
+
+    def delta(self) -> None:  # One streamed delta.
+        now = time.perf_counter()  # Time.
+        if self.deltas == 0:  # First one.
+            self.first = now  # Remember.
+            LLM_TTFT.observe(now - self.started, self.provider)  # Time to first token.
+        self.deltas += 1  # Count.
+        self.last = now  # Latest.
+
+    def error(self, kind: str) -> None:  # Failed attempt the caller handles itself (e.g. a 401 retried with a new token).
+        LLM_ERRORS.inc(self.provider, kind)  # Count by kind.
+        self.failed = True  # No rate sample on exit.
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:  # Classify errors, record the rate.
+        if self.failed:  # Already counted by error().
+            return  # Nothing else to record.
+        if exc_type is not None and not issubclass(exc_type, (GeneratorExit, asyncio.CancelledError)):  # Failed (not just abandoned).
+            LLM_ERRORS.inc(self.provider, _error_kind(exc))  # Count by kind.
+        elif self.deltas > 1 and self.last > self.first:  # Enough deltas for a rate.
+            LLM_TOKEN_RATE.observe((self.deltas - 1) / (self.last - self.first), self.provider)  # Deltas per second.
+
+
+def _error_kind(exc: BaseException) -> str:  # Map an exception to a small, fixed label set.
+    name = type(exc).__name__  # e.g. ReadTimeout, ConnectError, HTTPStatusError.
+    if "Timeout" in name:  # httpx.TimeoutException and subclasses, asyncio.TimeoutError.
+        return "timeout"  # Label.
+    if "Connect" in name:  # httpx.ConnectError.
+        return "connect"  # Label.
+    if name == "HTTPStatusError":  # raise_for_status().
+        return "http"  # Label.
+    return "other"  # Anything else (protocol errors, bad payloads, ...).
+
+
+def flatten_routes(routes: Any) -> List[Any]:  # Leaf routes, including those of routers newer FastAPI keeps nested.
+    out = []  # Leaf routes in matching order.
+    for route in routes:  # Top-level routes.
+        nested = getattr(route, "original_router", None)  # Included APIRouter (FastAPI resolves these lazily).
+        out.extend(flatten_routes(nested.routes) if nested is not None else [route])  # Recurse or keep.
+    return out  # Leaves.
+
+
+def route_label(scope: Dict[str, Any], routes: List[Any]) -> str:  # Route template (e.g. /api/chats/{chat_id}) so labels stay low-cardinality.
+    partial = None  # Path matched but method did not (405).
+    for route in routes:  # Leaf routes.
+        match, _ = route.matches(scope)  # Same matching the router does.
+        if match is Match.FULL:  # Found.
+            return getattr(route, "path", "other")  # Template.
+        if match is Match.PARTIAL and partial is None:  # Remember first partial.
+            partial = getattr(route, "path", "other")  # Template.
+    return partial or "unmatched"  # 404s share one label.
+
+
+class StackSampler:  # Samples every thread's Python stack on an interval; output is collapsed stacks ("a;b;c count").
+    def __init__(self, interval_s: float = 0.005) -> None:  # Sampling period.
+        self.interval_s = interval_s  # Period.
+        self.counts: Dict[str, int] = {}  # Stack -> samples.
+        self._stop = threading.Event()  # Stop signal.
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)  # Sampler thread.
+
+    def start(self) -> None:  # Begin sampling.
+        self._thread.start()  # Run.
+
+    def _run(self) -> None:  # Sampler loop (own thread; never samples itself).
+        me = threading.get_ident()  # Own id.
+        while not self._stop.wait(self.interval_s):  # Until stopped.
+            names = {t.ident: t.name for t in threading.enumerate()}  # Thread names (loop, asyncio.to_thread workers, ...).
+            for ident, frame in sys._current_frames().items():  # Every thread's current frame.
+                if ident == me:  # Skip the sampler.
+                    continue  # Next.
+                stack = []  # Innermost first.
+                while frame is not None:  # Walk to the root.
+                    code = frame.f_code  # Code object.
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")  # Function, not line (merges samples).
+                    frame = frame.f_back  # Caller.
+                key = ";".join([names.get(ident, str(ident))] + stack[::-1])  # Root first, thread name on top.
+                self.counts[key] = self.counts.get(key, 0) + 1  # Count sample.
+
+    def stop(self) -> str:  # Stop and return the collapsed-stack text.
+        self._stop.set()  # Signal.
+        self._thread.join()  # Wait (at most one interval).
+        return "".join(f"{k} {v}\n" for k, v in sorted(self.counts.items()))  # One line per distinct stack.
+
+
+_profile_lock = threading.Lock()  # One profile at a time (the sampler sees the whole process anyway).
+
+
+class MetricsMiddleware:  # ASGI middleware: per-route latency + in-flight gauges, optional per-request profile.
+    def __init__(self, app: Any, profile_dir: str = "", profile_token: str = "", profile_interval_ms: float = 5.0) -> None:  # Wrap the app.
+        self.app = app  # Inner ASGI app.
+        self.profile_dir = profile_dir if profile_token else ""  # Where profiles go ("" = profiling off; also off without a token).
+        self.profile_token = profile_token.encode("utf-8")  # Required X-Profile value.
+        self.profile_interval_s = profile_interval_ms / 1000.0  # Sampling period.
+        self._routes: Optional[List[Any]] = None  # Flattened route table (built on the first request).
+        self._routes_key: Any = None  # Identity of the route list it was built from.
+
+    def _leaf_routes(self, scope: Dict[str, Any]) -> List[Any]:  # Flattened routes of the app serving this request.
+        routes = getattr(getattr(scope.get("app"), "router", None), "routes", [])  # Set by Starlette before the middleware stack.
+        key = (id(routes), len(routes))  # Rebuild if routes are added later.
+        if key != self._routes_key:  # First request or changed.
+            self._routes, self._routes_key = flatten_routes(routes), key  # Cache.
+        return self._routes  # Leaves.
+
+    def _start_profile(self, scope: Dict[str, Any], route: str) -> Optional[Tuple[StackSampler, str]]:  # Sampler + file path, if requested.
+        if not self.profile_dir:  # Disabled.
+            return None  # No profile.
+        value = Headers(scope=scope).get("x-profile")  # Opt-in header.
+        if value is None or not hmac.compare_digest(value.encode("utf-8"), self.profile_token):  # Not requested / wrong token (constant time).
+            return None  # No profile.
+        if not _profile_lock.acquire(blocking=False):  # Another request is being profiled.
+            return None  # Skip this one.
+        name = f"profile-{time.strftime('%Y%m%d-%H%M%S')}-{scope['method']}-{re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'}-{time.time_ns() % 10**6}.txt"  # Unique name.
+        sampler = StackSampler(self.profile_interval_s)  # Sampler.
+        sampler.start()  # Begin.
+        return sampler, os.path.join(self.profile_dir, name)  # Handle.
+
+    async def _finish_profile(self, profile: Tuple[StackSampler, str]) -> None:  # Stop sampling and write the file.
+        sampler, path = profile  # Unpack.
+        try:  # Always release the lock.
+            text = sampler.stop()  # Collapsed stacks.
+            os.makedirs(self.profile_dir, exist_ok=True)  # Create directory.
+            await asyncio.to_thread(_write_text, path, text)  # Write off the loop.
+        finally:  # Next profile may start.
+            _profile_lock.release()  # Release.
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:  # ASGI entry point.
+        if scope["type"] != "http":  # Lifespan / websockets.
+            await self.app(scope, receive, send)  # Pass through.
+            return  # Done.
+        method = scope["method"]  # Label.
+        route = route_label(scope, self._leaf_routes(scope))  # Label (before routing, for the in-flight gauge).
+        profile = self._start_profile(scope, route)  # Usually None.
+        status = "500"  # Until the app says otherwise.
+        started = time.perf_counter()  # Start clock.
+        HTTP_IN_FLIGHT.inc(method, route)  # In flight.
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:  # Capture status, announce the profile file.
+            nonlocal status  # Updated on response start.
+            if message["type"] == "http.response.start":  # Headers.
+                status = str(message["status"])  # Status code.
+                if profile is not None:  # Tell the caller where the profile will be.
+                    MutableHeaders(scope=message)["X-Profile-File"] = os.path.basename(profile[1])  # File name only.
+            await send(message)  # Forward.
+
+        try:  # Observe even on errors / disconnects.
+            await self.app(scope, receive, send_wrapper)  # Serve (streams return after the last byte).
+        finally:  # Record.
+            HTTP_IN_FLIGHT.dec(method, route)  # Done.
+            matched = getattr(scope.get("route"), "path", None)  # Route the app actually dispatched to (set while routing).
+            HTTP_LATENCY.observe(time.perf_counter() - started, method, matched or route, status)  # Latency.
+            if profile is not None:  # Profiled request.
+                await self._finish_profile(profile)  # Write file.
+
+
+def _write_text(path: str, text: str) -> None:  # Blocking file write (worker thread).
+    with open(path, "w", encoding="utf-8") as f:  # Open.
+        f.write(text)  # Write.
+
+
+19) backend/tests/conftest.py (shared test fixtures)
+Tests run from backend/ with: python -m pytest tests   (pip install pytest; no other test dependency).
+Every store test runs once per backend (plain JSON, journal, SQLite) in a temporary directory, and the
+`client` fixture serves the real chat routes over that store with a scripted LLM, wired like main.py.
+Async code runs inside plain test functions with asyncio.run, one event loop per test.
+
+import os  # Import os to build store paths.
+import asyncio  # Import asyncio for the scripted LLM.
+from contextlib import asynccontextmanager  # Import asynccontextmanager for the test app lifespan.
+from types import SimpleNamespace  # Import SimpleNamespace for the router state.
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Iterator, List, Optional  # Import types for clarity.
+import pytest  # Import pytest for fixtures.
+from fastapi import FastAPI  # Import FastAPI to mount the chat router.
+from fastapi.testclient import TestClient  # Import TestClient to call the routes.
+from app.storage_json import JsonChatStore  # Import the plain JSON store.
+from app.storage_journal import JournalChatStore  # Import the journal store.
+from app.storage_sqlite import SqliteChatStore  # Import the SQLite store.
+from app.routes_chat import router  # Import the chat routes.
+from app.streams import StreamRegistry  # Import the stream registry.
+from app.context import ContextBuilder  # Import the prompt builder.
+from app.scheduler import StreamScheduler  # Import admission control.
+
+BACKENDS = ("json", "journal", "sqlite")  # Same choices as DATA_FILE in main.py.
+
+
+def open_store(backend: str, directory: str, **options: Any) -> Any:  # The store a DATA_FILE value selects.
+    if backend == "journal":  # journal://
+        return JournalChatStore(os.path.join(directory, "chats.json"), **options)  # Snapshot + journal.
+    if backend == "sqlite":  # sqlite://
+        return SqliteChatStore(os.path.join(directory, "chats.db"), **options)  # WAL database.
+    return JsonChatStore(os.path.join(directory, "chats.json"), **options)  # Plain path.
+
+
+class ScriptedLLM:  # Stand-in LLM: streams the words of the newest message back, optionally paced.
+    def __init__(self, delay_s: float = 0.0) -> None:  # Configure pacing.
+        self.delay_s = delay_s  # Pause before each word.
+        self.calls = 0  # Upstream calls made.
+        self.on_word: Optional[Callable[[int], Awaitable[None]]] = None  # Hook run before word i (inspect state mid-stream).
+
+    async def stream_chat(self, messages: List[Dict[str, Any]]) -> AsyncGenerator[str, None]:  # Same interface as llm_client.LLMClient.
+        self.calls += 1  # Count call.
+        for i, word in enumerate(messages[-1]["content"].split()):  # Echo the user message.
+            if self.delay_s:  # Paced.
+                await asyncio.sleep(self.delay_s)  # Wait.
+            if self.on_word is not None:  # Test hook.
+                await self.on_word(i)  # Runs inside the generation task.
+            yield word + " "  # One delta per word.
+
+
+@pytest.fixture(params=BACKENDS)  # Run each test once per backend.
+def backend(request: Any) -> str:  # Backend name.
+    return request.param  # "json", "journal" or "sqlite".
+
+
+@pytest.fixture  # Fresh directory per test.
+def make_store(backend: str, tmp_path: Any) -> Callable[..., Any]:  # Opens (or re-opens) the backend's store.
+    return lambda **options: open_store(backend, str(tmp_path), **options)  # Same files on every call.
+
+
+@pytest.fixture  # Default: instant replies.
+def llm() -> ScriptedLLM:  # Scripted LLM shared by the client and the test.
+    return ScriptedLLM()  # No pacing.
+
+
+@pytest.fixture  # Real routes over the parametrized store.
+def client(make_store: Callable[..., Any], llm: ScriptedLLM) -> Iterator[TestClient]:  # HTTP client for /api.
+    store = make_store()  # Store for this test.
+    streams = StreamRegistry()  # Resumable streams (default grace period).
+    context = ContextBuilder(store, llm, mode="extract")  # No summary LLM calls.
+
+    @asynccontextmanager  # Same shutdown order as main.py.
+    async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:  # Flush on exit.
+        yield  # Serve requests.
+        await streams.aclose()  # Stop generations.
+        await context.aclose()  # Stop summary refreshes.
+        await store.close()  # Flush the store.
+
+    router.state = SimpleNamespace(  # What main.py injects.
+        store=store, llm=llm, streams=streams, context=context, scheduler=StreamScheduler(),  # Shared objects.
+        coalesce_ms=0.0, coalesce_bytes=1, checkpoint_ms=20.0,  # One SSE frame per delta; frequent checkpoints.
+    )
+    app = FastAPI(lifespan=lifespan)  # Minimal app.
+    app.include_router(router)  # Chat routes under /api.
+    with TestClient(app) as c:  # Runs the lifespan.
+        yield c  # Test body.
+
+
+20) backend/tests/test_paging.py (cursor pagination, user-003)
+Walking /api/chats and a chat's history page by page returns every item exactly once and in order, also
+when chats change between two page requests; bad cursors are 400s.
+
+import asyncio  # Import asyncio to run store calls.
+from typing import Any, Callable, List, Optional  # Import types for clarity.
+
+
+async def walk_chats(store: Any, limit: int) -> List[str]:  # Every chat id, one page at a time.
+    ids: List[str] = []  # Collected ids.
+    cursor: Optional[str] = None  # First page.
+    while True:  # Until the last page.
+        chats, cursor = await store.page_chats(limit=limit, cursor=cursor)  # One page.
+        assert len(chats) <= limit  # Page size respected.
+        ids += [c["id"] for c in chats]  # Collect.
+        if cursor is None:  # No more pages.
+            return ids  # Newest first.
+
+
+def test_page_chats_matches_full_list(make_store: Callable[..., Any]) -> None:  # Pages concatenate to the full list.
+    async def main() -> None:  # Test body.
+        store = make_store()  # Fresh store.
+        try:  # Always close.
+            ids = [(await store.create_chat(f"chat {i}"))["id"] for i in range(23)]  # Several pages.
+            await store.rename_chat(ids[3], "renamed")  # Moves to the top.
+            await store.append_message(ids[7], "user", "hi")  # Moves to the top.
+            full = [c["id"] for c in await store.list_chats()]  # Unpaged order.
+            assert full[:2] == [ids[7], ids[3]]  # Newest first.
+            assert await walk_chats(store, 5) == full  # Same order, no duplicates or gaps.
+            assert await walk_chats(store, 100) == full  # Single page.
+        finally:  # Cleanup.
+            await store.close()  # Flush.
+    asyncio.run(main())  # Run.
+
+
+def test_page_chats_is_stable_across_changes(make_store: Callable[..., Any]) -> None:  # Cursor = position, not offset.
+    async def main() -> None:  # Test body.
+        store = make_store()  # Fresh store.
+        try:  # Always close.
+            for i in range(12):  # Three pages of four.
+                await store.create_chat(f"chat {i}")  # Create.
+            first, cursor = await store.page_chats(limit=4)  # Page 1.
+            expected = [c["id"] for c in await store.list_chats()][4:]  # Everything after page 1.
+            await store.create_chat("newer")  # Lands before the cursor.
+            await store.append_message(first[0]["id"], "user", "bump")  # Already-seen chat moves to the top.
+            rest: List[str] = []  # Pages 2+.
+            while cursor is not None:  # Remaining pages.
+                chats, cursor = await store.page_chats(limit=4, cursor=cursor)  # Next page.
+                rest += [c["id"] for c in chats]  # Collect.
+            assert rest == expected  # Nothing skipped or repeated.
+        finally:  # Cleanup.
+            await store.close()  # Flush.
+    asyncio.run(main())  # Run.
+
+
+def test_page_messages_walks_back_from_newest(make_store: Callable[..., Any]) -> None:  # `before` cursor.
+    async def main() -> None:  # Test body.
+        store = make_store()  # Fresh store.
+        try:  # Always close.
+            chat_id = (await store.create_chat("t"))["id"]  # One chat.
+            for i in range(12):  # Twelve messages.
+                await store.append_message(chat_id, "user", f"m{i}")  # Append.
+            pages = []  # Newest page first.
+            before: Optional[str] = None  # Start at the newest message.
+            while True:  # Until the first message.
+                msgs, before = await store.page_messages(chat_id, limit=5, before=before)  # One page (oldest first).
+                pages.append([m["content"] for m in msgs])  # Collect.
+                if before is None:  # Reached the start.
+                    break  # Done.
+            assert pages == [[f"m{i}" for i in range(7, 12)], [f"m{i}" for i in range(2, 7)], ["m0", "m1"]]  # 5 + 5 + 2.
+        finally:  # Cleanup.
+            await store.close()  # Flush.
+    asyncio.run(main())  # Run.
+
+
+def test_routes_page_with_next_cursor_header(client: Any) -> None:  # X-Next-Cursor round trip over HTTP.
+    ids = [client.post("/api/chats", json={"title": f"chat {i}"}).json()["id"] for i in range(7)]  # Seven chats.
+    seen: List[str] = []  # Ids from every page.
+    params = {"limit": 3}  # First page.
+    while True:  # Follow the header.
+        r = client.get("/api/chats", params=params)  # One page.
+        assert r.status_code == 200  # OK.
+        seen += [c["id"] for c in r.json()]  # Collect.
+        cursor = r.headers.get("x-next-cursor")  # Next page, if any.
+        if not cursor:  # Last page.
+            break  # Done.
+        params = {"limit": 3, "cursor": cursor}  # Next request.
+    assert seen == ids[::-1]  # Newest first, all seven.
+    for i in range(4):  # History for one chat.
+        r = client.post(f"/api/chats/{ids[0]}/stream", json={"message": f"q{i}"})  # User + assistant message.
+        assert r.status_code == 200  # Streamed.
+    r = client.get(f"/api/chats/{ids[0]}/messages", params={"limit": 3})  # Newest three.
+    assert [m["role"] for m in r.json()] == ["assistant", "user", "assistant"]  # Oldest first within the page.
+    older = client.get(f"/api/chats/{ids[0]}/messages", params={"limit": 3, "before": r.headers["x-next-cursor"]})  # Previous page.
+    assert len(older.json()) == 3 and older.json()[-1]["content"] == "q2"  # Directly before the first page.
+    assert client.get("/api/chats", params={"cursor": "not-a-cursor"}).status_code == 400  # Undecodable cursor.
+    assert client.get(f"/api/chats/{ids[0]}/messages", params={"before": "nope"}).status_code == 400  # Unknown message id.
+
+
+21) backend/tests/test_stream_resume.py (resumable streams, user-008)
+A client that drops mid-stream reconnects with Last-Event-ID and gets exactly the text it missed, partial
+text is checkpointed to the store while the reply is generated, and a client that fell behind the replay
+buffer gets one `reset` event with the whole text instead of a gap. (TestClient runs each response to
+the end before returning it, so mid-stream state is inspected from inside the scripted LLM.)
+
+import json  # Import json to decode SSE payloads.
+import asyncio  # Import asyncio to drive a StreamSession directly.
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple  # Import types for clarity.
+import pytest  # Import pytest for the fixture override.
+from conftest import ScriptedLLM  # Import the scripted LLM.
+from app.routes_chat import router  # Import the router (its state holds the test's store).
+from app.streams import StreamSession  # Import the session (replay buffer) itself.
+
+PROMPT = " ".join(f"w{i}" for i in range(60))  # Sixty deltas.
+FULL = "".join(f"w{i} " for i in range(60))  # What the scripted LLM streams back.
+
+
+@pytest.fixture  # Overrides conftest's instant LLM for this module.
+def llm() -> ScriptedLLM:  # Paced replies, so several checkpoint intervals pass during one.
+    return ScriptedLLM(delay_s=0.005)  # ~0.3 s per reply.
+
+
+def sse_frames(lines: Iterable[str]) -> Iterator[Tuple[Optional[str], str, Dict[str, Any]]]:  # (id, event, data) per frame.
+    event_id, event, data = None, "message", ""  # Current frame.
+    for line in lines:  # Text lines of the response.
+        if line.startswith("id:"):  # Frame id.
+            event_id = line[3:].strip()  # "<stream id>:<seq>".
+        elif line.startswith("event:"):  # Event name.
+            event = line[6:].strip()  # delta / done / reset / ...
+        elif line.startswith("data:"):  # Payload.
+            data += line[5:].strip()  # JSON.
+        elif not line and data:  # Blank line ends the frame.
+            yield event_id, event, json.loads(data)  # One frame.
+            event_id, event, data = None, "message", ""  # Next frame.
+
+
+def start_and_drop(client: Any, chat_id: str, deltas: int) -> Tuple[str, str, str]:  # Read a few deltas, then disconnect.
+    text, last = "", ""  # Received text + last event id.
+    with client.stream("POST", f"/api/chats/{chat_id}/stream", json={"message": PROMPT}) as r:  # Start generation.
+        stream_id = r.headers["x-stream-id"]  # For the reconnect.
+        for event_id, event, data in sse_frames(r.iter_lines()):  # Live frames.
+            last = event_id or last  # Remember position.
+            if event == "delta":  # Text.
+                text += data["text"]  # Collect.
+                deltas -= 1  # Count.
+                if deltas == 0:  # Enough.
+                    break  # Leaving the block closes the connection.
+    return stream_id, text, last  # Reconnect state.
+
+
+def test_resume_replays_exactly_the_missed_text(client: Any) -> None:  # Drop, reconnect, no gap or duplicate.
+    chat_id = client.post("/api/chats", json={"title": "t"}).json()["id"]  # One chat.
+    stream_id, text, last = start_and_drop(client, chat_id, 5)  # First five deltas.
+    assert text == FULL[:len(text)] and len(text) < len(FULL)  # Partial.
+    r = client.get(f"/api/streams/{stream_id}", headers={"Last-Event-ID": last})  # Reconnect (reads to the end).
+    frames = list(sse_frames(r.text.splitlines()))  # Replay + live frames.
+    text += "".join(d["text"] for _, e, d in frames if e == "delta")  # Missed text.
+    assert text == FULL  # Nothing lost, nothing repeated.
+    assert frames[-1][1] == "done"  # Finished normally.
+    reply = client.get(f"/api/chats/{chat_id}/messages").json()[-1]  # Saved assistant message.
+    assert reply["content"] == FULL and "status" not in reply  # Final text, no longer streaming.
+
+
+def test_partial_text_is_checkpointed_while_streaming(client: Any, llm: ScriptedLLM) -> None:  # A reload mid-stream shows progress.
+    chat_id = client.post("/api/chats", json={"title": "t"}).json()["id"]  # One chat.
+    saved: List[Dict[str, Any]] = []  # What a reload would have shown at word 40.
+
+    async def probe(i: int) -> None:  # Runs inside the generation.
+        if i == 40:  # ~0.2 s in (checkpoint_ms=20 in conftest).
+            saved.append((await router.state.store.list_messages(chat_id))[-1])  # Stored placeholder.
+
+    llm.on_word = probe  # Install hook.
+    client.post(f"/api/chats/{chat_id}/stream", json={"message": PROMPT})  # Whole stream.
+    assert saved[0]["status"] == "streaming"  # Still marked as in progress.
+    assert saved[0]["content"] and FULL[:len(saved[0]["content"])] == saved[0]["content"]  # A prefix of the final text.
+    assert len(saved[0]["content"]) <= len(FULL[:FULL.index("w40 ")])  # Nothing beyond what was generated.
+    reply = client.get(f"/api/chats/{chat_id}/messages").json()[-1]  # After the stream.
+    assert reply["content"] == FULL and "status" not in reply  # Final save replaces the checkpoint.
+
+
+def test_finished_stream_stays_resumable(client: Any, llm: ScriptedLLM) -> None:  # Replay from the start after it ended.
+    chat_id = client.post("/api/chats", json={"title": "t"}).json()["id"]  # One chat.
+    r = client.post(f"/api/chats/{chat_id}/stream", json={"message": "one two three"})  # Whole stream.
+    stream_id = r.headers["x-stream-id"]  # Its id.
+    frames = list(sse_frames(client.get(f"/api/streams/{stream_id}").text.splitlines()))  # No Last-Event-ID = everything.
+    assert "".join(d["text"] for _, e, d in frames if e == "delta") == "one two three "  # Same text again.
+    assert llm.calls == 1  # Replayed from the buffer, not generated again.
+    assert client.get("/api/streams/unknown").status_code == 404  # Unknown or expired id.
+
+
+def test_client_behind_the_buffer_gets_a_reset() -> None:  # Trimmed events are replaced by the full text.
+    async def main() -> List[Tuple[Optional[str], str, Dict[str, Any]]]:  # Drive the session directly.
+        session = StreamSession("chat", "message", buffer_events=4)  # Tiny replay buffer.
+        for i in range(10):  # Ten deltas (six fall out of the buffer).
+            session.publish("delta", {"text": str(i)})  # Publish.
+        session.publish("done", {})  # Finish.
+        frames = [f async for f in session.subscribe(2)]  # Client saw events 1-2 only.
+        return list(sse_frames("".join(frames).split("\n")))  # Parsed.
+    frames = asyncio.run(main())  # Run.
+    assert [e for _, e, _ in frames] == ["reset", "done"]  # Whole text once, then the rest.
+    assert frames[0][2]["text"] == "0123456789"  # Replaces the client's partial text.
+
+
+22) backend/tests/test_store_parity.py (JSON / journal / SQLite parity, user-012)
+The same sequence of calls gives the same chats, messages, summaries, search hits and errors on every
+backend, survives a restart, and a journal store imported with migrate_sqlite reads back identically
+(a torn final journal line is dropped by both).
+
+import json  # Import json to write a torn journal line.
+import asyncio  # Import asyncio to run store calls.
+from typing import Any, Callable, Dict, List  # Import types for clarity.
+import pytest  # Import pytest for error checks.
+from conftest import BACKENDS, open_store  # Import backend names + the DATA_FILE-style opener.
+from app.migrate_sqlite import migrate  # Import the importer.
+from app.storage_sqlite import SqliteChatStore  # Import the SQLite store.
+
+
+async def scenario(store: Any) -> None:  # Every mutation the routes use.
+    a = (await store.create_chat("alpha project"))["id"]  # Chat with history.
+    b = (await store.create_chat("beta notes"))["id"]  # Deleted later.
+    c = (await store.create_chat("gamma"))["id"]  # Renamed later.
+    first = await store.append_message(a, "user", "deploy the service please")  # User turn.
+    reply = await store.append_message(a, "assistant", "", status="streaming")  # Placeholder.
+    await store.update_message(a, reply["id"], "deploying", status="streaming", durable=False)  # Checkpoint.
+    await store.update_message(a, reply["id"], "deployed to staging")  # Final text (status cleared).
+    await store.append_message(b, "user", "budget review")  # Indexed, then deleted.
+    await store.append_message(c, "user", "queue latency")  # Other chat.
+    await store.rename_chat(c, "gamma renamed")  # Title change.
+    await store.delete_chat(b)  # Removal.
+    await store.set_summary(a, {"text": "user asked to deploy", "upto": first["id"], "tokens": 5})  # Rolling summary.
+    for call in (  # Unknown ids fail the same way everywhere.
+        store.rename_chat("missing", "x"),  # Rename.
+        store.delete_chat("missing"),  # Delete.
+        store.append_message("missing", "user", "x"),  # Append.
+        store.update_message(a, "missing", "x"),  # Update.
+        store.set_summary("missing", {"text": "", "upto": None, "tokens": 0}),  # Summary.
+    ):  # Each call.
+        with pytest.raises(KeyError):  # Route turns it into a 404.
+            await call  # Run.
+
+
+async def observe(store: Any) -> Dict[str, Any]:  # Everything a client can read, without ids and timestamps.
+    chats: List[Dict[str, Any]] = []  # Newest first.
+    for chat in await store.list_chats():  # Sidebar order.
+        msgs = await store.list_messages(chat["id"])  # History.
+        position = {m["id"]: i for i, m in enumerate(msgs)}  # Message id -> index.
+        summary = await store.get_summary(chat["id"])  # Summary.
+        chats.append({  # Normalized chat.
+            "title": chat["title"],  # Title.
+            "messages": [(m["role"], m["content"], m.get("tokens"), m.get("status")) for m in msgs],  # Content.
+            "summary": summary and dict(summary, upto=position.get(summary["upto"])),  # Upto as an index.
+        })
+    search = {q: sorted(r["title"] for r in await store.search_chats(q)) for q in ("deploy", "budget", "renamed", "lat")}  # Hits (rank may differ).
+    return {"chats": chats, "search": search}  # Snapshot.
+
+
+def test_backends_agree(tmp_path: Any) -> None:  # One scenario, three stores, one result.
+    async def run(backend: str) -> Dict[str, Any]:  # Scenario on one backend.
+        store = open_store(backend, str(tmp_path / backend))  # Fresh store.
+        try:  # Always close.
+            await scenario(store)  # Mutate.
+            return await observe(store)  # Read back.
+        finally:  # Cleanup.
+            await store.close()  # Flush.
+    results = {backend: asyncio.run(run(backend)) for backend in BACKENDS}  # Per backend.
+    assert results["json"]["chats"][0]["title"] == "gamma renamed"  # Sanity: newest first.
+    assert results["json"]["search"]["budget"] == []  # Deleted chats leave the search index.
+    assert results["journal"] == results["json"]  # Journal == plain JSON.
+    assert results["sqlite"] == results["json"]  # SQLite == plain JSON.
+
+
+def test_state_survives_restart(make_store: Callable[..., Any]) -> None:  # Close + reopen reads the same data.
+    async def main() -> None:  # Test body.
+        store = make_store()  # First process.
+        await scenario(store)  # Mutate.
+        before = await observe(store)  # Read back.
+        await store.close()  # Shutdown.
+        store = make_store()  # Next process.
+        try:  # Always close.
+            assert await observe(store) == before  # Same chats, messages, summaries and search hits.
+        finally:  # Cleanup.
+            await store.close()  # Flush.
+    asyncio.run(main())  # Run.
+
+
+def test_migrated_journal_matches(tmp_path: Any) -> None:  # migrate_sqlite reads a journal store like the store does.
+    async def main() -> None:  # Test body.
+        src = str(tmp_path / "chats.json")  # Journal store path.
+        store = open_store("journal", str(tmp_path))  # Never compacted: no snapshot file yet.
+        await scenario(store)  # Mutate.
+        chat_id = (await store.list_chats())[0]["id"]  # Target of the torn line.
+        await store.close()  # Shutdown.
+        with open(src + ".journal", "ab") as f:  # Crash mid-append: valid JSON, no newline.
+            f.write(json.dumps({"op": "append", "seq": 999, "chatId": chat_id, "updatedAt": "2030-01-01T00:00:00+00:00",
+                                "message": {"id": "torn", "role": "user", "content": "torn write"}}).encode("utf-8"))  # Torn line.
+        migrate(src, str(tmp_path / "chats.db"))  # Import (before the journal store truncates the line).
+        journal = open_store("journal", str(tmp_path))  # Replays + drops the torn line.
+        imported = SqliteChatStore(str(tmp_path / "chats.db"))  # Imported copy.
+        try:  # Always close.
+            expected = await observe(journal)  # Journal view.
+            assert all("torn write" not in m[1] for c in expected["chats"] for m in c["messages"])  # Torn line ignored.
+            assert await observe(imported) == expected  # Same data after import.
+        finally:  # Cleanup.
+            await journal.close()  # Close.
+            await imported.close()  # Close.
+    asyncio.run(main())  # Run.
+
+
+23) backend/tests/test_multiprocess.py (several worker processes on one store, user-013)
+Real processes (like uvicorn --workers N) write to the same store at once: no write is lost, and a
+worker that loaded the data earlier sees the other workers' chats, messages, renames and deletes in its
+reads and search results. Plain JSON runs with STORE_MULTIPROCESS=1; SQLite is multi-process by design.
+
+import os  # Import os for process ids.
+import asyncio  # Import asyncio to run store calls.
+import multiprocessing  # Import multiprocessing to start worker processes.
+from typing import Any, Dict, List  # Import types for clarity.
+import pytest  # Import pytest for parametrization.
+from conftest import open_store  # Import the DATA_FILE-style opener.
+
+MULTIPROCESS_BACKENDS = {"json": {"multiprocess": True}, "sqlite": {}}  # Backends that allow --workers N.
+spawn = multiprocessing.get_context("spawn")  # Fresh interpreters (no inherited event loop or locks).
+
+
+def append_worker(backend: str, directory: str, chat_id: str, count: int, done: Any) -> None:  # One "worker process".
+    async def main() -> int:  # Store calls.
+        store = open_store(backend, directory, **MULTIPROCESS_BACKENDS[backend])  # Own store object.
+        try:  # Always close.
+            await store.create_chat(f"worker {os.getpid()}")  # One chat per worker.
+            for i in range(count):  # Interleaves with the other workers.
+                await store.append_message(chat_id, "user", f"worker {os.getpid()} message {i}")  # Shared chat.
+            return len(await store.list_messages(chat_id))  # This worker's view.
+        finally:  # Cleanup.
+            await store.close()  # Flush + unlock.
+    done.put(asyncio.run(main()))  # Report.
+
+
+def edit_worker(backend: str, directory: str, ids: Dict[str, str]) -> None:  # Another worker changes existing chats.
+    async def main() -> None:  # Store calls.
+        store = open_store(backend, directory, **MULTIPROCESS_BACKENDS[backend])  # Own store object.
+        try:  # Always close.
+            await store.rename_chat(ids["rename"], "zebra title")  # Rename.
+            await store.append_message(ids["append"], "user", "xylophone practice")  # New searchable word.
+            await store.delete_chat(ids["delete"])  # Delete.
+        finally:  # Cleanup.
+            await store.close()  # Flush + unlock.
+    asyncio.run(main())  # Run.
+
+
+def run_workers(target: Any, args_list: List[tuple]) -> None:  # Start processes, wait, fail on crashes.
+    procs = [spawn.Process(target=target, args=args) for args in args_list]  # One per worker.
+    for p in procs:  # Start all (they run concurrently).
+        p.start()  # Spawn.
+    for p in procs:  # Wait for all.
+        p.join(60)  # Bounded.
+        assert p.exitcode == 0  # Worker finished cleanly.
+
+
+@pytest.mark.parametrize("backend", sorted(MULTIPROCESS_BACKENDS))  # json + sqlite.
+def test_concurrent_workers_lose_no_writes(backend: str, tmp_path: Any) -> None:  # 4 processes x 25 appends.
+    directory = str(tmp_path)  # Shared data directory.
+
+    async def setup() -> str:  # Parent creates the shared chat.
+        store = open_store(backend, directory, **MULTIPROCESS_BACKENDS[backend])  # Parent store.
+        try:  # Always close.
+            return (await store.create_chat("shared"))["id"]  # Chat every worker appends to.
+        finally:  # Cleanup.
+            await store.close()  # Flush.
+
+    chat_id = asyncio.run(setup())  # Shared chat.
+    done = spawn.Queue()  # Worker results.
+    run_workers(append_worker, [(backend, directory, chat_id, 25, done) for _ in range(4)])  # Concurrent writers.
+    views = [done.get(timeout=10) for _ in range(4)]  # Each worker's final read.
+    assert max(views) == 100  # The last worker saw everything.
+
+    async def check() -> None:  # Fresh reader.
+        store = open_store(backend, directory, **MULTIPROCESS_BACKENDS[backend])  # New process view.
+        try:  # Always close.
+            msgs = await store.list_messages(chat_id)  # Shared history.
+            assert len(msgs) == 100 and len({m["id"] for m in msgs}) == 100  # Nothing lost or duplicated.
+            assert len(await store.list_chats()) == 5  # Shared chat + one per worker.
+        finally:  # Cleanup.
+            await store.close()  # Close.
+    asyncio.run(check())  # Run.
+
+
+@pytest.mark.parametrize("backend", sorted(MULTIPROCESS_BACKENDS))  # json + sqlite.
+def test_loaded_worker_sees_other_workers_changes(backend: str, tmp_path: Any) -> None:  # Cache invalidation + search.
+    directory = str(tmp_path)  # Shared data directory.
+
+    async def main() -> None:  # This process is the long-running worker.
+        store = open_store(backend, directory, **MULTIPROCESS_BACKENDS[backend])  # Loaded before the other worker writes.
+        try:  # Always close.
+            ids = {name: (await store.create_chat(f"{name} chat"))["id"] for name in ("rename", "append", "delete")}  # Three chats.
+            assert await store.search_chats("xylophone") == []  # Not there yet.
+            tag = await store.version(ids["append"])  # History version before.
+            await asyncio.to_thread(run_workers, edit_worker, [(backend, directory, ids)])  # Other worker edits.
+            titles = {c["title"] for c in await store.list_chats()}  # Reloaded list.
+            assert titles == {"zebra title", "append chat"}  # Rename + delete visible.
+            assert [m["content"] for m in await store.list_messages(ids["append"])] == ["xylophone practice"]  # New message visible.
+            assert await store.version(ids["append"]) != tag  # ETag changes too.
+            assert [r["id"] for r in await store.search_chats("xylophone")] == [ids["append"]]  # Search re-indexed the message.
+            assert [r["id"] for r in await store.search_chats("zebra")] == [ids["rename"]]  # ... and the new title.
+            assert await store.search_chats("delete") == []  # ... and dropped the deleted chat.
+        finally:  # Cleanup.
+            await store.close()  # Flush.
+    asyncio.run(main())  # Run.
+
+
+24) backend/tests/test_deltas.py (ETags, 304s and since/after deltas, user-016)
+Revalidating an unchanged list or history is a bodyless 304, a delta request returns only the messages
+added or changed after the client's tag (or message id), and a tag the store cannot compare (another
+epoch, garbage) falls back to the full history instead of an empty delta.
+
+import asyncio  # Import asyncio to run store calls.
+from typing import Any, Callable  # Import types for clarity.
+import pytest  # Import pytest for error checks.
+
+
+def test_store_messages_since(make_store: Callable[..., Any]) -> None:  # Store-level delta sync.
+    async def main() -> None:  # Test body.
+        store = make_store()  # Fresh store.
+        try:  # Always close.
+            chat_id = (await store.create_chat("t"))["id"]  # One chat.
+            first = await store.append_message(chat_id, "user", "q1")  # Already synced.
+            reply = await store.append_message(chat_id, "assistant", "", status="streaming")  # Already synced.
+            tag = await store.version(chat_id)  # Client's copy.
+            assert await store.messages_since(chat_id, since=tag) == []  # Nothing new.
+            await store.update_message(chat_id, reply["id"], "a1")  # Changed.
+            added = await store.append_message(chat_id, "user", "q2")  # New.
+            assert await store.version(chat_id) != tag  # History moved on.
+            delta = await store.messages_since(chat_id, since=tag)  # Changes since the tag.
+            assert [(m["id"], m["content"]) for m in delta] == [(reply["id"], "a1"), (added["id"], "q2")]  # Oldest first.
+            assert [m["id"] for m in await store.messages_since(chat_id, after=first["id"])] == [reply["id"], added["id"]]  # By id.
+            assert await store.messages_since(chat_id, since="other-epoch.1") is None  # Not comparable.
+            assert await store.messages_since(chat_id, since="garbage") is None  # Not comparable.
+            with pytest.raises(ValueError):  # Unknown message id.
+                await store.messages_since(chat_id, after="missing")  # Bad cursor.
+            with pytest.raises(KeyError):  # Unknown chat.
+                await store.messages_since("missing", since=tag)  # Missing chat.
+        finally:  # Cleanup.
+            await store.close()  # Flush.
+    asyncio.run(main())  # Run.
+
+
+def test_version_tags_track_the_right_changes(make_store: Callable[..., Any]) -> None:  # List tag vs history tag.
+    async def main() -> None:  # Test body.
+        store = make_store()  # Fresh store.
+        try:  # Always close.
+            chat_id = (await store.create_chat("t"))["id"]  # One chat.
+            await store.append_message(chat_id, "user", "hi")  # Some history.
+            listed, history = await store.version(), await store.version(chat_id)  # Both tags.
+            await store.rename_chat(chat_id, "renamed")  # Title only.
+            assert await store.version() != listed  # List changed.
+            assert await store.version(chat_id) == history  # History did not.
+            await store.create_chat("other")  # Another chat.
+            assert await store.version(chat_id) == history  # Still unchanged.
+        finally:  # Cleanup.
+            await store.close()  # Flush.
+        reopened = make_store()  # Restart (plain JSON / journal start a new epoch, SQLite keeps its own).
+        try:  # Always close.
+            added = await reopened.append_message(chat_id, "user", "after restart")  # Written after the restart.
+            delta = await reopened.messages_since(chat_id, since=history)  # Tag from before the restart.
+            assert delta is None or [m["id"] for m in delta] == [added["id"]]  # Full history or the right delta, never a wrong one.
+        finally:  # Cleanup.
+            await reopened.close()  # Flush.
+    asyncio.run(main())  # Run.
+
+
+def test_routes_revalidate_with_etags(client: Any) -> None:  # If-None-Match over HTTP.
+    chat_id = client.post("/api/chats", json={"title": "t"}).json()["id"]  # One chat.
+    assert client.post(f"/api/chats/{chat_id}/stream", json={"message": "hello there"}).status_code == 200  # Some history.
+    for url in ("/api/chats", f"/api/chats/{chat_id}/messages"):  # List and history.
+        r = client.get(url)  # Full copy.
+        etag = r.headers["etag"]  # Validator.
+        assert r.status_code == 200 and r.headers["cache-control"] == "no-cache"  # Must revalidate.
+        for header in (etag, "W/" + etag, f'"stale", {etag}', "*"):  # Strong, weak, list, wildcard.
+            cached = client.get(url, headers={"If-None-Match": header})  # Revalidate.
+            assert cached.status_code == 304 and cached.content == b""  # No body.
+            assert cached.headers["etag"] == etag  # Validator repeated.
+        assert client.get(url, headers={"If-None-Match": '"stale"'}).status_code == 200  # Old copy gets the data.
+    listed = client.get("/api/chats").headers["etag"]  # List tag.
+    history = client.get(f"/api/chats/{chat_id}/messages").headers["etag"]  # History tag.
+    assert client.patch(f"/api/chats/{chat_id}", json={"title": "renamed"}).status_code == 200  # Rename.
+    assert client.get("/api/chats", headers={"If-None-Match": listed}).status_code == 200  # New title.
+    assert client.get(f"/api/chats/{chat_id}/messages", headers={"If-None-Match": history}).status_code == 304  # Same history.
+    assert client.get("/api/chats/missing/messages").status_code == 404  # Unknown chat.
+
+
+def test_routes_return_deltas(client: Any) -> None:  # since / after over HTTP.
+    chat_id = client.post("/api/chats", json={"title": "t"}).json()["id"]  # One chat.
+    assert client.post(f"/api/chats/{chat_id}/stream", json={"message": "one"}).status_code == 200  # User + reply.
+    full = client.get(f"/api/chats/{chat_id}/messages")  # Client's copy.
+    tag = full.headers["etag"].strip('"')  # ETag value doubles as `since`.
+    assert "x-delta" not in full.headers  # Full history.
+    assert client.post(f"/api/chats/{chat_id}/stream", json={"message": "two"}).status_code == 200  # Two more.
+    delta = client.get(f"/api/chats/{chat_id}/messages", params={"since": tag})  # Changes only.
+    assert delta.status_code == 200 and delta.headers["x-delta"] == "1"  # Merge, don't replace.
+    assert [(m["role"], m["content"].strip()) for m in delta.json()] == [("user", "two"), ("assistant", "two")]  # New turn.
+    last = full.json()[-1]["id"]  # Newest message the client has.
+    after = client.get(f"/api/chats/{chat_id}/messages", params={"after": last})  # By id.
+    assert after.headers["x-delta"] == "1" and after.json() == delta.json()  # Same two messages.
+    quoted = client.get(f"/api/chats/{chat_id}/messages", params={"since": full.headers["etag"]})  # Raw ETag works too.
+    assert quoted.json() == delta.json()  # Same delta.
+    for since in ("other-epoch.1", "garbage"):  # Tags the store cannot compare.
+        fallback = client.get(f"/api/chats/{chat_id}/messages", params={"since": since})  # Delta not possible.
+        assert "x-delta" not in fallback.headers and len(fallback.json()) == 4  # Whole history instead.
+    current = delta.headers["etag"].strip('"')  # Up to date.
+    empty = client.get(f"/api/chats/{chat_id}/messages", params={"since": current})  # Nothing new.
+    assert empty.headers["x-delta"] == "1" and empty.json() == []  # Empty delta.
+    assert client.get(f"/api/chats/{chat_id}/messages", params={"after": "missing"}).status_code == 400  # Unknown id.
+
+
+25) backend/tests/test_group_commit.py (group-commit writer, user-002)
+close() writes every change requested before it, including one requested while a flush is still
+writing, and every caller waiting for a commit gets a result or an error instead of hanging.
+
+import time  # Import time for a slow blocking write.
+import asyncio  # Import asyncio to drive the writer.
+from typing import Any, List  # Import types for clarity.
+import pytest  # Import pytest for error checks.
+from app.storage_json import GroupCommitWriter  # Import the writer.
+
+
+def test_close_flushes_changes_requested_during_a_flush() -> None:  # Second batch must not be dropped.
+    async def main() -> None:  # Test body.
+        state = {"version": 1}  # What the store holds in memory.
+        written: List[Any] = []  # What reached "disk".
+
+        def write(payload: Any) -> None:  # Slow write (worker thread).
+            time.sleep(0.2)  # Long enough to request + close mid-flush.
+            written.append(payload)  # Persisted.
+
+        writer = GroupCommitWriter(lambda: state["version"], write, window_ms=0.0)  # No batching window.
+        first = writer.request()  # Starts a flush of version 1.
+        await asyncio.sleep(0.05)  # Flush is writing.
+        state["version"] = 2  # Change during the flush.
+        second = writer.request()  # Next batch.
+        await writer.close()  # Must flush version 2 as well.
+        assert written == [1, 2]  # Both states persisted, newest last.
+        await asyncio.wait_for(asyncio.gather(first, second), timeout=1.0)  # Both callers resolved.
+    asyncio.run(main())  # Run.
+
+
+def test_close_fails_waiters_when_the_final_flush_fails() -> None:  # Error instead of a hang.
+    async def main() -> None:  # Test body.
+        calls: List[int] = []  # Writes attempted.
+
+        def write(payload: Any) -> None:  # First write works, the rest hit a full disk.
+            calls.append(payload)  # Count.
+            time.sleep(0.1)  # Slow enough to request mid-flush.
+            if len(calls) > 1:  # Second write.
+                raise OSError(28, "No space left on device")  # ENOSPC.
+
+        writer = GroupCommitWriter(lambda: len(calls), write, window_ms=0.0)  # No batching window.
+        first = writer.request()  # Written.
+        await asyncio.sleep(0.03)  # Flush is writing.
+        second = writer.request()  # Fails.
+        await writer.close()  # Gives up after the failed final flush (no retry loop).
+        await asyncio.wait_for(first, timeout=1.0)  # Committed.
+        with pytest.raises(OSError):  # Caller sees the disk error.
+            await asyncio.wait_for(second, timeout=1.0)  # Not left pending.
+        assert len(calls) == 2  # One attempt each.
+    asyncio.run(main())  # Run.
+
+
+26) backend/tests/test_journal_compaction.py (failed compactions, user-001)
+A compaction that fails (full disk while writing the snapshot, or while moving the journal aside) is
+logged, later appends keep working, and close() still writes every buffered journal line.
+
+import os  # Import os to point the old-journal path at a missing directory.
+import asyncio  # Import asyncio to run store calls.
+import logging  # Import logging to check the failure is reported.
+from typing import Any  # Import types for clarity.
+from app.storage_journal import JournalChatStore  # Import the journal store.
+
+
+def disk_full(*args: Any) -> None:  # Stand-in for a write that hits ENOSPC.
+    raise OSError(28, "No space left on device")  # ENOSPC.
+
+
+def test_failed_snapshot_write_does_not_lose_buffered_lines(tmp_path: Any, caplog: Any) -> None:  # close() after a failed compaction.
+    path = str(tmp_path / "chats.json")  # Snapshot path.
+
+    async def write() -> str:  # Fill the journal past the threshold with a failing snapshot write.
+        store = JournalChatStore(path, compact_bytes=2048, durability="memory")  # Lines wait in memory for the next commit.
+        store._write_snapshot = disk_full  # Every compaction fails.
+        chat_id = (await store.create_chat("t"))["id"]  # One chat.
+        for i in range(40):  # Several compactions' worth.
+            await store.append_message(chat_id, "user", f"message {i} " + "x" * 64)  # Buffered append.
+        await store.close()  # Must not raise, and must flush the last lines.
+        return chat_id  # For the reload.
+
+    async def read(chat_id: str) -> int:  # Reload from disk.
+        store = JournalChatStore(path)  # Fresh process view.
+        try:  # Always close.
+            return len(await store.list_messages(chat_id))  # Everything replayed.
+        finally:  # Cleanup.
+            await store.close()  # Close.
+
+    with caplog.at_level(logging.WARNING):  # Capture the failure log.
+        chat_id = asyncio.run(write())  # Write phase.
+    assert "journal compaction failed" in caplog.text  # Reported, not "Task exception was never retrieved".
+    assert asyncio.run(read(chat_id)) == 40  # No line lost.
+
+
+def test_failed_rotate_keeps_the_journal_writable(tmp_path: Any) -> None:  # Journal handle is reopened.
+    async def main() -> None:  # Test body.
+        path = str(tmp_path / "chats.json")  # Snapshot path.
+        store = JournalChatStore(path, compact_bytes=1024)  # Small threshold.
+        store.old_journal_path = os.path.join(str(tmp_path), "missing", "chats.json.journal.old")  # Rename target cannot be created.
+        chat_id = (await store.create_chat("t"))["id"]  # One chat.
+        for i in range(30):  # Crosses the threshold; every rotate fails.
+            await store.append_message(chat_id, "user", f"message {i} " + "x" * 64)  # Durable append (needs an open journal).
+        await store.close()  # Final commit.
+        reopened = JournalChatStore(path)  # Reload.
+        try:  # Always close.
+            assert len(await reopened.list_messages(chat_id)) == 30  # Every append persisted.
+        finally:  # Cleanup.
+            await reopened.close()  # Close.
+    asyncio.run(main())  # Run.
+
+
+27) backend/tests/test_llm_cache.py (shared in-flight LLM calls, user-009)
+Identical prompts share one upstream call; when the last reader of a call goes away the call is
+cancelled, and a prompt arriving right after starts a fresh call instead of joining the dying one.
+
+import asyncio  # Import asyncio to run the cache.
+from typing import AsyncGenerator, List  # Import types for clarity.
+from app.llm_cache import ResponseCache  # Import the cache.
+
+
+def test_prompt_after_last_reader_left_starts_a_fresh_call() -> None:  # No "LLM call cancelled" for the next caller.
+    async def main() -> None:  # Test body.
+        cache = ResponseCache()  # Memory only.
+        calls: List[int] = []  # Upstream calls started.
+
+        async def upstream() -> AsyncGenerator[str, None]:  # Paced fake LLM.
+            calls.append(1)  # Count.
+            for word in ("a ", "b ", "c "):  # Three deltas.
+                yield word  # Delta.
+                await asyncio.sleep(0.01)  # Pace.
+
+        first = cache.stream("k", upstream())  # Only reader of the flight.
+        assert await first.__anext__() == "a "  # Upstream running.
+        await first.aclose()  # Reader leaves: flight is cancelled.
+        second = [chunk async for chunk in cache.stream("k", upstream())]  # Same prompt, no loop turn in between.
+        assert second == ["a ", "b ", "c "]  # Full reply from a new call.
+        assert len(calls) == 2  # Cancelled call was not joined.
+        assert await cache.get("k") == second  # Finished reply cached.
+    asyncio.run(main())  # Run.
+
+
+def test_concurrent_identical_prompts_share_one_call() -> None:  # Single flight.
+    async def main() -> None:  # Test body.
+        cache = ResponseCache()  # Memory only.
+        calls: List[int] = []  # Upstream calls started.
+
+        async def upstream() -> AsyncGenerator[str, None]:  # Paced fake LLM.
+            calls.append(1)  # Count.
+            for word in ("x ", "y "):  # Two deltas.
+                await asyncio.sleep(0.01)  # Pace.
+                yield word  # Delta.
+
+        async def read() -> List[str]:  # One reader.
+            return [chunk async for chunk in cache.stream("k", upstream())]  # Whole reply.
+
+        replies = await asyncio.gather(*[read() for _ in range(5)])  # Same prompt at once.
+        assert replies == [["x ", "y "]] * 5  # Same reply for everyone.
+        assert len(calls) == 1 and cache.stats["shared"] == 4  # One upstream call.
+    asyncio.run(main())  # Run.
+
+
+28) backend/tests/test_scheduler.py (admission control, user-011)
+Waiting streams are admitted round-robin across users, a full queue is a QueueFull / 429 with
+Retry-After, and a ticket whose waiter is cancelled leaves the queue (or gives its slot back).
+
+import asyncio  # Import asyncio to run the scheduler.
+from typing import Any, List  # Import types for clarity.
+import pytest  # Import pytest for error checks.
+from app.routes_chat import router  # Import the chat routes (to swap the scheduler).
+from app.scheduler import QueueFull, StreamScheduler  # Import admission control.
+
+
+def test_waiters_are_admitted_round_robin_across_users() -> None:  # One busy user cannot starve the others.
+    async def main() -> None:  # Test body.
+        scheduler = StreamScheduler(max_active=1, max_per_user=1)  # One slot.
+        running = scheduler.reserve("x")  # Takes the slot.
+        assert running.ready  # Admitted at once.
+        tickets = [scheduler.reserve(user) for user in ("a", "a", "a", "b", "c")]  # Queued in this order.
+        assert not any(t.ready for t in tickets)  # All waiting.
+        assert [t.position() for t in tickets] == [1, 4, 5, 2, 3]  # a, b, c, a, a.
+        order: List[str] = []  # Admission order.
+        current = running  # Slot holder.
+        for _ in tickets:  # Hand the slot on one at a time.
+            current.release()  # Finish the running stream.
+            current = next(t for t in tickets if t.ready and t.state == "running")  # Newly admitted.
+            order.append(f"{current.user}{tickets.index(current)}")  # Record user + queue index.
+        assert order == ["a0", "b3", "c4", "a1", "a2"]  # Each user gets one turn per round.
+        current.release()  # Last one done.
+        stats = scheduler.stats()  # Final counters.
+        assert (stats["active"], stats["queued"], stats["admitted"], stats["queuedTotal"]) == (0, 0, 6, 5)  # Balanced.
+    asyncio.run(main())  # Run.
+
+
+def test_per_user_limit_lets_other_users_run() -> None:  # Slots are shared, not taken by one user.
+    async def main() -> None:  # Test body.
+        scheduler = StreamScheduler(max_active=3, max_per_user=2)  # Two streams per user.
+        a = [scheduler.reserve("a") for _ in range(3)]  # Third one waits for user a's own slot.
+        b = scheduler.reserve("b")  # Global slot still free.
+        assert [t.ready for t in a] == [True, True, False] and b.ready  # b was not queued behind a.
+        a[0].release()  # One of a's streams ends.
+        assert a[2].ready  # a's waiter takes it.
+    asyncio.run(main())  # Run.
+
+
+def test_full_queue_raises_queue_full_with_retry_after() -> None:  # Global and per-user queue bounds.
+    async def main() -> None:  # Test body.
+        scheduler = StreamScheduler(max_active=1, max_per_user=1, max_queue=3, max_queue_per_user=2)  # Tiny queue.
+        scheduler.reserve("a")  # Running.
+        scheduler.reserve("a")  # Queued.
+        scheduler.reserve("a")  # Queued (user a's limit).
+        with pytest.raises(QueueFull) as per_user:  # User a's queue is full.
+            scheduler.reserve("a")  # Third waiter of a.
+        scheduler.reserve("b")  # Other users still fit (queue: 3 of 3).
+        with pytest.raises(QueueFull) as full:  # Global queue is full.
+            scheduler.reserve("c")  # Fourth waiter.
+        assert per_user.value.retry_after >= 1  # Positive hint.
+        assert full.value.retry_after == 20  # 5 s average run x 4 slot turnovers.
+        assert scheduler.stats()["rejected"] == 2  # Counted.
+    asyncio.run(main())  # Run.
+
+
+def test_cancelled_waiter_leaves_the_queue() -> None:  # Client went away while queued.
+    async def main() -> None:  # Test body.
+        scheduler = StreamScheduler(max_active=1)  # One slot.
+        running = scheduler.reserve("a")  # Takes the slot.
+        gone = scheduler.reserve("b")  # Will be cancelled.
+        waiting = scheduler.reserve("c")  # Next in line after it.
+        task = asyncio.create_task(gone.acquire())  # Waiter for the ticket.
+        await asyncio.sleep(0)  # Waiter is parked.
+        task.cancel()  # Client disconnects.
+        with pytest.raises(asyncio.CancelledError):  # Propagated.
+            await task  # Settle.
+        assert gone.state == "released" and scheduler.stats()["queued"] == 1  # Left the queue.
+        running.release()  # Slot frees up.
+        assert waiting.ready and not gone.ready  # Skipped the cancelled ticket.
+    asyncio.run(main())  # Run.
+
+
+def test_waiter_cancelled_after_admission_gives_the_slot_back() -> None:  # Granted and cancelled in the same turn.
+    async def main() -> None:  # Test body.
+        scheduler = StreamScheduler(max_active=1)  # One slot.
+        running = scheduler.reserve("a")  # Takes the slot.
+        ticket = scheduler.reserve("b")  # Queued.
+        task = asyncio.create_task(ticket.acquire())  # Waiter.
+        await asyncio.sleep(0)  # Waiter is parked.
+        running.release()  # Slot granted to the waiter ...
+        task.cancel()  # ... which is cancelled before it resumes.
+        with pytest.raises(asyncio.CancelledError):  # Propagated.
+            await task  # Settle.
+        assert scheduler.stats()["active"] == 0  # Slot not leaked.
+        assert scheduler.reserve("c").ready  # Next stream runs at once.
+    asyncio.run(main())  # Run.
+
+
+def test_route_answers_429_with_retry_after(client: Any) -> None:  # Over HTTP.
+    chat_id = client.post("/api/chats", json={"title": "t"}).json()["id"]  # One chat.
+    router.state.scheduler = StreamScheduler(max_active=0, max_queue=0)  # Nothing runs, nothing waits.
+    r = client.post(f"/api/chats/{chat_id}/stream", json={"message": "hi"}, headers={"X-User-Id": "u1"})  # Rejected.
+    assert r.status_code == 429 and r.headers["retry-after"] == "5"  # Default 5 s run estimate.
+    assert client.get(f"/api/chats/{chat_id}/messages").json() == []  # Rejected before touching the store.
+    router.state.scheduler = StreamScheduler()  # Room again.
+    assert client.post("/api/chats/missing/stream", json={"message": "hi"}).status_code == 404  # Unknown chat.
+    assert client.get("/api/scheduler").json()["active"] == 0  # 404 gave the slot back.
+
+
+29) backend/tests/test_coalescer.py (SSE delta framing, user-007)
+The first delta goes out at once, later deltas are merged until the buffer reaches max_bytes or the
+oldest buffered delta has waited window_ms, and no text is lost or reordered.
+
+import time  # Import time to timestamp frames.
+import asyncio  # Import asyncio to pace the fake LLM.
+from typing import AsyncGenerator, List, Sequence, Tuple  # Import types for clarity.
+from app.routes_chat import DeltaCoalescer  # Import the framer.
+
+
+async def paced(deltas: Sequence[Tuple[float, str]]) -> AsyncGenerator[str, None]:  # Fake LLM: (pause before, delta) pairs.
+    for pause, delta in deltas:  # In order.
+        if pause:  # Paced.
+            await asyncio.sleep(pause)  # Wait.
+        yield delta  # Delta.
+
+
+def test_flushes_by_size() -> None:  # Fast stream: frames close at max_bytes.
+    async def main() -> List[str]:  # Collect frames.
+        coalescer = DeltaCoalescer(window_ms=10_000.0, max_bytes=10)  # Timer never fires in this test.
+        return [frame async for frame in coalescer.frames_from(paced([(0.0, "abcd")] * 7))]  # 28 characters.
+
+    frames = asyncio.run(main())  # Run.
+    assert frames == ["abcd", "abcd" * 3, "abcd" * 3]  # First delta alone, then 12 >= 10 characters per frame.
+
+
+def test_flushes_by_interval() -> None:  # Slow stream: a buffered delta never waits longer than the window.
+    async def main() -> Tuple[DeltaCoalescer, List[Tuple[float, str]]]:  # Coalescer + timestamped frames.
+        coalescer = DeltaCoalescer(window_ms=50.0, max_bytes=10_000)  # Size never triggers.
+        source = paced([(0.0, "a"), (0.0, "b"), (0.3, "c"), (0.0, "d")])  # "b" is followed by a long pause.
+        started = time.monotonic()  # Clock.
+        frames = [(time.monotonic() - started, frame) async for frame in coalescer.frames_from(source)]  # Timestamped.
+        return coalescer, frames  # Results.
+
+    coalescer, frames = asyncio.run(main())  # Run.
+    assert [frame for _, frame in frames] == ["a", "b", "cd"]  # "b" flushed by the timer, "c"+"d" by the end of stream.
+    assert frames[1][0] < 0.2  # Sent after ~50 ms, not held until "c" arrived at 300 ms.
+    stats = coalescer.stats()  # Framing stats.
+    assert (stats["frames"], stats["deltas"]) == (3, 4)  # Four deltas in three frames.
+    assert stats["coalesceDelayMsMax"] < 200  # Bounded by the window (plus scheduling slack).
+
+
+def test_closing_early_closes_the_source() -> None:  # Client left: upstream stream is released.
+    async def main() -> bool:  # Whether the source was closed.
+        closed = False  # Set by the source.
+
+        async def source() -> AsyncGenerator[str, None]:  # Endless fake LLM.
+            nonlocal closed  # Report close.
+            try:  # Until closed.
+                while True:  # Forever.
+                    await asyncio.sleep(0.01)  # Pace.
+                    yield "x"  # Delta.
+            finally:  # aclose() from the coalescer.
+                closed = True  # Released.
+
+        frames = DeltaCoalescer(window_ms=20.0).frames_from(source())  # Framed stream.
+        assert await frames.__anext__() == "x"  # First frame.
+        await frames.aclose()  # Consumer goes away.
+        return closed  # Result.
 
-    async def event_gen() -> AsyncGenerator[str, None]:  # Define SSE generator producing streamed tokens.
-        assistant_text = ""  # Keep a buffer to store final assistant message.
-        try:  # Wrap streaming in try to send error event.
-            async for delta in llm.generate_stream(body.message):  # Stream delta tokens from LLM.
-                assistant_text += delta  # Append delta to final assistant output.
-                yield sse_event("delta", {"text": delta})  # Send SSE delta event to frontend.
-            await store.append_message(chat_id=chat_id, role="assistant", content=assistant_text)  # Persist assistant message.
-            yield sse_event("done", {})  # Send SSE done event.
-        except Exception as e:  # Catch any error during streaming.
-            yield sse_event("error", {"message": str(e)})  # Send SSE error event to frontend.
-
-    return StreamingResponse(event_gen(), media_type="text/event-stream")  # Return SSE streaming respo
+    assert asyncio.run(main())  # Source closed.
@@ -1,22 +1,42 @@
 Updated app/main.py (merged, safe, copy-paste)
-from fastapi import FastAPI, Request  # Import FastAPI for app + Request for any existing request middleware usage.
+from fastapi import FastAPI, HTTPException, Request  # Import FastAPI for app + Request for any existing request middleware usage.
+from fastapi.responses import PlainTextResponse  # Import PlainTextResponse for the Prometheus text format.
 import json  # Import json for any existing JSON operations in your codebase.
 from fastapi.middleware.cors import CORSMiddleware  # Import CORS middleware for cross-origin frontend access.
 from fastapi.middleware.gzip import GZipMiddleware  # Import GZip middleware to compress responses.
+from starlette.datastructures import Headers  # Import Headers to inspect the request in the GZip bypass.
 import v1.api as api  # Import your pre-existing v1 router module (do not remove).
 import logging  # Import logging to keep existing logging behavior.
 import os  # Import os to read environment variables for optional config.
+from contextlib import asynccontextmanager  # Import asynccontextmanager to build the app lifespan.
 
 # NOTE: We are importing these NEW modules for chat, without touching existing APIs.
 from v1.chat_routes import router as chat_router  # Import chat router (new) under v1.
 from v1.storage_json import JsonChatStore  # Import JSON file store (new).
-from v1.llm_client import LLMClient  # Import LLM client wrapper (new).
+from v1.storage_journal import JournalChatStore  # Import append-only journal store (optional mode).
+from v1.storage_sqlite import SqliteChatStore  # Import SQLite (WAL) store (optional mode).
+from v1.llm_client import LLMClient, LLMHttpPool  # Import LLM client wrapper + shared connection pool (new).
+from v1.streams import StreamRegistry  # Import resumable stream registry (new).
+from v1.llm_cache import CachedLLMClient, ResponseCache  # Import optional LLM response cache (new).
+from v1.context import ContextBuilder  # Import token-budgeted prompt builder (new).
+from v1.scheduler import StreamScheduler  # Import admission control for LLM streams (new).
+from v1 import metrics  # Import Prometheus metrics + per-request profiler (new).
 
 log = logging.getLogger(__name__)  # Keep your existing logger instance.
 
 # prefix = "/app"  # Keep your existing commented prefix line (if you use it later).
 
-app = FastAPI()  # Create FastAPI app (kept exactly as your pre-existing code).
+
+@asynccontextmanager  # Turn the generator into a lifespan context manager.
+async def lifespan(app: FastAPI):  # Runs once at startup/shutdown.
+    yield  # Serve requests.
+    await streams.aclose()  # Stop running generations (each saves its partial reply).
+    await context.aclose()  # Stop background summary refreshes.
+    await store.close()  # Flush the store's pending group commit before exit.
+    await llm_pool.aclose()  # Close pooled LLM connections.
+
+
+app = FastAPI(lifespan=lifespan)  # Create FastAPI app (lifespan added so shutdown flushes pending writes).
 
 # -----------------------------
 # CORS (kept, but made env-driven safely)
@@ -33,12 +53,37 @@ app.add_middleware(  # Add CORS middleware exactly like your pre-existing code.
     allow_credentials=True,  # Keep your existing credentials setting.
     allow_methods=["*"],  # Keep your existing allow-all methods.
     allow_headers=["*"],  # Keep your existing allow-all headers.
+    expose_headers=["X-Next-Cursor", "X-Stream-Id", "Retry-After", "X-Profile-File", "ETag", "X-Delta"],  # Let the browser read cursors, stream ids, 429 hints, profile names + versions.
 )
 
 # -----------------------------
-# GZip (kept)
+# GZip (kept, but never for SSE)
 # -----------------------------
-app.add_middleware(GZipMiddleware, minimum_size=500)  # Keep your existing GZip middleware setting.
+class SSEBypassGZipMiddleware(GZipMiddleware):  # GZip for normal responses; SSE streams pass through untouched.
+    async def __call__(self, scope, receive, send):  # ASGI entry point.
+        if scope["type"] == "http":  # Only HTTP requests carry headers.
+            accept = Headers(scope=scope).get("accept", "")  # Streaming clients ask for text/event-stream.
+            if "text/event-stream" in accept or scope["path"].endswith("/stream") or "/streams/" in scope["path"]:  # Streaming routes.
+                await self.app(scope, receive, send)  # Skip compression (gzip would buffer frames and delay first token).
+                return  # Done.
+        await super().__call__(scope, receive, send)  # Everything else is compressed as before.
+
+
+app.add_middleware(SSEBypassGZipMiddleware, minimum_size=500)  # Keep your existing GZip middleware setting.
+
+# -----------------------------
+# Metrics + opt-in profiling (outermost, so timings include compression)
+# -----------------------------
+metrics_enabled = os.getenv("METRICS", "1").strip() in ("1", "true", "yes")  # GET /metrics + per-route timings.
+if os.getenv("PROFILE_DIR", "").strip() and not os.getenv("PROFILE_TOKEN", "").strip():  # Profiling needs a secret.
+    log.warning("PROFILE_DIR is set but PROFILE_TOKEN is empty; X-Profile profiling stays disabled")  # Explain why it does nothing.
+if metrics_enabled:  # Enabled by default (a few microseconds per request).
+    app.add_middleware(  # Added last = runs first.
+        metrics.MetricsMiddleware,  # Per-route latency histograms + in-flight gauges.
+        profile_dir=os.getenv("PROFILE_DIR", "").strip(),  # "" = X-Profile is ignored.
+        profile_token=os.getenv("PROFILE_TOKEN", "").strip(),  # Required X-Profile value ("" = profiling off).
+        profile_interval_ms=float(os.getenv("PROFILE_INTERVAL_MS", "5")),  # Sampling period.
+    )
 
 # -----------------------------
 # Existing routers (kept)
@@ -50,13 +95,75 @@ app.include_router(api.router)  # Keep your existing router include (DO NOT remo
 # -----------------------------
 # Read JSON DB file path from env; default to a file in your backend folder.
 data_file = os.getenv("DATA_FILE", "./data/chats.json").strip()  # Use env if present, else default.
+durability = os.getenv("STORE_DURABILITY", "commit").strip()  # "commit" = wait for fsync, "memory" = return after in-memory apply.
+commit_window_ms = float(os.getenv("STORE_COMMIT_WINDOW_MS", "5"))  # Window in which writes are merged into one fsync.
+multiprocess = os.getenv("STORE_MULTIPROCESS", "0").strip() in ("1", "true", "yes")  # Several uvicorn workers share DATA_FILE.
 
-store = JsonChatStore(file_path=data_file)  # Create JSON store instance used by chat APIs.
-llm = LLMClient()  # Create LLM client instance used by chat streaming.
+# DATA_FILE=journal://./data/chats.json selects journal mode (append one line per change instead of rewriting the file).
+if data_file.startswith("journal://"):  # Journal mode requested.
+    if multiprocess:  # Each worker would append to (and compact) the journal on its own.
+        raise RuntimeError("journal:// is single-process; use sqlite:// or plain JSON with STORE_MULTIPROCESS=1")  # Fail fast.
+    compact_bytes = int(os.getenv("JOURNAL_COMPACT_BYTES", str(4 * 1024 * 1024)))  # Journal size that triggers compaction.
+    store = JournalChatStore(  # Journal-backed store.
+        file_path=data_file[len("journal://"):],  # Strip the scheme.
+        compact_bytes=compact_bytes,  # Compaction threshold.
+        durability=durability,  # Default durability.
+        commit_window_ms=commit_window_ms,  # Group-commit window.
+    )
+elif data_file.startswith("sqlite://"):  # DATA_FILE=sqlite://./data/chats.db selects the SQLite backend.
+    store = SqliteChatStore(  # SQLite-backed store (same methods).
+        file_path=data_file[len("sqlite://"):],  # Strip the scheme.
+        durability=durability,  # commit = synchronous=FULL, memory = synchronous=NORMAL.
+        readers=int(os.getenv("SQLITE_READERS", "4")),  # Reader threads.
+    )
+else:  # Default mode.
+    store = JsonChatStore(  # Create JSON store instance used by chat APIs.
+        file_path=data_file,  # JSON file.
+        durability=durability,  # Default durability.
+        commit_window_ms=commit_window_ms,  # Group-commit window.
+        multiprocess=multiprocess,  # File lock + reload-on-change when several workers share the file.
+        search_checkpoint_every=int(os.getenv("SEARCH_CHECKPOINT_EVERY", "1000")),  # Changes between search index checkpoints.
+    )
+llm_pool = LLMHttpPool()  # One keep-alive pool for every LLM client (limits/timeouts/HTTP2 from env).
+llm = LLMClient(pool=llm_pool)  # Create LLM client instance used by chat streaming (VOX: mcall.LLMClient(pool=llm_pool)).
+if os.getenv("LLM_CACHE", "0").strip() in ("1", "true", "yes"):  # Optional response cache.
+    llm_cache = ResponseCache(  # LRU + TTL, optional disk tier next to the data file.
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000")),  # Entries in memory.
+        max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),  # Characters in memory.
+        ttl_s=float(os.getenv("LLM_CACHE_TTL_S", "86400")),  # Reply lifetime.
+        disk_dir=store.file_path + ".llmcache" if os.getenv("LLM_CACHE_DISK", "0").strip() in ("1", "true", "yes") else None,  # Disk tier.
+        max_disk_entries=int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", "10000")),  # Files on disk.
+    )
+    llm = CachedLLMClient(llm, llm_cache)  # Same generate_stream() interface; routes do not change.
+context = ContextBuilder(  # Prompt = rolling summary + newest turns within a token budget.
+    store,  # Reads messages (token counts are cached on each message).
+    llm,  # Writes the rolling summary.
+    budget_tokens=int(os.getenv("CONTEXT_BUDGET_TOKENS", "3000")),  # Prompt budget.
+    summary_tokens=int(os.getenv("CONTEXT_SUMMARY_TOKENS", "400")),  # Summary cap.
+    summarize_after_tokens=int(os.getenv("CONTEXT_SUMMARIZE_AFTER_TOKENS", "1000")),  # Summary batch size.
+    mode=os.getenv("CONTEXT_SUMMARY", "llm").strip(),  # "llm" or "extract".
+)
+streams = StreamRegistry(  # Running generations, resumable with Last-Event-ID.
+    buffer_events=int(os.getenv("STREAM_BUFFER_EVENTS", "2048")),  # Replay buffer size per stream.
+    retain_s=float(os.getenv("STREAM_RETAIN_S", "60")),  # Keep finished streams resumable this long.
+    disconnect_grace_s=float(os.getenv("STREAM_DISCONNECT_GRACE_S", "20")),  # Cancel the LLM call once no client came back in time.
+)
+scheduler = StreamScheduler(  # Concurrency limits + fair wait queue for upstream LLM streams.
+    max_active=int(os.getenv("STREAM_MAX_ACTIVE", "32")),  # Global limit.
+    max_per_user=int(os.getenv("STREAM_MAX_PER_USER", "4")),  # Per-user limit.
+    max_queue=int(os.getenv("STREAM_MAX_QUEUE", "64")),  # Queue bound (429 beyond it).
+    max_queue_per_user=int(os.getenv("STREAM_MAX_QUEUE_PER_USER", "8")),  # Per-user queue bound.
+)
 
 # Inject shared dependencies into the chat router state so endpoints can access them.
 chat_router.state.store = store  # Attach store to router state.
 chat_router.state.llm = llm  # Attach llm client to router state.
+chat_router.state.coalesce_ms = float(os.getenv("SSE_COALESCE_MS", "30"))  # Max wait before a buffered delta is flushed.
+chat_router.state.coalesce_bytes = int(os.getenv("SSE_COALESCE_BYTES", "512"))  # Flush once this many characters are buffered.
+chat_router.state.streams = streams  # Attach stream registry.
+chat_router.state.context = context  # Attach prompt builder.
+chat_router.state.scheduler = scheduler  # Attach stream scheduler.
+chat_router.state.checkpoint_ms = float(os.getenv("STREAM_CHECKPOINT_MS", "1000"))  # Save partial replies this often.
 
 # Include chat router AFTER existing routers (order does not break anything; just adds endpoints).
 app.include_router(chat_router)  # Register the new chat endpoints.
@@ -67,3 +174,20 @@ app.include_router(chat_router)  # Register the new chat endpoints.
 @app.get("/health")  # Add a small health route (does not conflict with existing).
 async def health():  # Health handler.
     return {"ok": True}  # Return simple healthy status.
+
+
+def _collect_scheduler() -> None:  # Copy admission-control state into gauges at scrape time.
+    stats = scheduler.stats()  # Snapshot.
+    metrics.STREAMS_ACTIVE.set(value=stats["active"])  # Running streams.
+    metrics.STREAMS_QUEUED.set(value=stats["queued"])  # Waiting streams.
+    metrics.STREAMS_REJECTED.set(value=stats["rejected"])  # 429s so far.
+
+
+metrics.REGISTRY.on_collect(_collect_scheduler)  # Refreshed on every scrape.
+
+
+@app.get("/metrics")  # Prometheus scrape endpoint (per worker process).
+async def get_metrics():  # Text exposition format.
+    if not metrics_enabled:  # METRICS=0.
+        raise HTTPException(status_code=404, detail="Not Found")  # Same as an unknown route.
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")  # Scrape body.
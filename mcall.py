@@ -1,53 +1,156 @@
 import json  # For JSON handling.
-import requests  # For HTTP requests.
-from typing import Generator  # For streaming generator typing.
+import os  # For token cache settings.
+import time  # For token expiry and refresh latency.
+import asyncio  # For running the blocking token call off the event loop.
+from typing import Any, AsyncGenerator, Callable, Optional  # For streaming generator typing.
 
 from ..utils import token_generation, optimization_secrets  # Import YOUR existing functions.
+from ..llm_client import LLMHttpPool, iter_sse_data  # Shared async connection pool + SSE parsing.
+from ..metrics import LLMCall, TOKEN_CACHE, TOKEN_REFRESH  # Upstream timing + token cache counters for /metrics.
+
+
+class TokenCache:
+    """
+    Caches the VOX OAuth access token until shortly before it expires.
+    Only one refresh runs at a time; concurrent callers wait for its result.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[], Any] = token_generation,
+        ttl_seconds: Optional[float] = None,
+        refresh_margin_seconds: Optional[float] = None,
+    ):
+        self.fetch = fetch  # Blocking token call (returns a token string or an OAuth response dict).
+        if ttl_seconds is None:  # An explicit 0 is honoured (never cache tokens without expires_in).
+            ttl_seconds = float(os.getenv("VOX_TOKEN_TTL_S", "3300"))
+        if refresh_margin_seconds is None:  # An explicit 0 disables the proactive refresh.
+            refresh_margin_seconds = float(os.getenv("VOX_TOKEN_REFRESH_MARGIN_S", "120"))
+        self.ttl_seconds = ttl_seconds  # Used when the IdP gives no expires_in.
+        self.refresh_margin_seconds = refresh_margin_seconds  # Refresh this early.
+        self._token: Optional[str] = None
+        self._expires_at = 0.0  # time.monotonic() deadline.
+        self._inflight: Optional[asyncio.Future] = None  # The single running refresh.
+
+    async def get(self) -> str:
+        """
+        Return a valid token, refreshing it (once, for all waiters) when needed.
+        """
+        now = time.monotonic()
+        if self._token is not None and now < self._expires_at:
+            TOKEN_CACHE.inc("hit")  # Served from cache.
+            if now >= self._expires_at - self.refresh_margin_seconds:
+                self._start_refresh()  # Proactive: refresh in the background, keep serving the current token.
+            return self._token
+        TOKEN_CACHE.inc("miss")  # Had to wait for a refresh.
+        return await asyncio.shield(self._start_refresh())  # Shield: a cancelled caller must not cancel the shared refresh.
+
+    def invalidate(self, token: str) -> None:
+        """
+        Drop a token the LLM rejected (ignored if the cache already holds a newer one).
+        """
+        if token == self._token:
+            self._token = None
+            self._expires_at = 0.0
+            TOKEN_CACHE.inc("invalidated")  # Dropped after a 401.
+
+    def _start_refresh(self) -> asyncio.Future:
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+            self._inflight.add_done_callback(lambda f: f.cancelled() or f.exception())  # Background refresh errors are counted (vox_token_refresh_seconds{outcome="error"}), not raised.
+        return self._inflight
+
+    async def _refresh(self) -> str:
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            result = await asyncio.to_thread(self.fetch)
+            outcome = "ok"
+        finally:
+            TOKEN_REFRESH.observe(time.monotonic() - started, outcome)  # Count, latency and errors of IdP calls.
+            self._inflight = None
+        if isinstance(result, dict):  # Raw OAuth response.
+            token = result["access_token"]
+            ttl = float(result.get("expires_in") or self.ttl_seconds)
+        else:  # Plain token string.
+            token, ttl = result, self.ttl_seconds
+        self._token = token
+        self._expires_at = started + ttl  # Measured from request start, so we never overestimate.
+        return token
+
+
+token_cache = TokenCache()  # Shared by every VOX client in the process.
 
 
 class LLMClient:
     """
     Enterprise VOX LLM client.
     Uses OAuth token instead of API key.
+    Streams over the app-wide async connection pool (pass the same LLMHttpPool the app uses).
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        pool: Optional[LLMHttpPool] = None,
+        engine: str = "gpt-4o-mini",
+        temperature: float = 0.3,
+        tokens: Optional[TokenCache] = None,
+    ):
         self.url = optimization_secrets["VESSSEL_OPENAI_API"]  # Internal VOX LLM endpoint.
+        self.pool = pool or LLMHttpPool()  # Keep-alive pool shared with the other LLM clients.
+        self.tokens = tokens or token_cache  # Cached OAuth token (no IdP round-trip per request).
+        self.engine = engine  # You already use this.
+        self.temperature = temperature
 
-    def stream_chat(self, messages: list) -> Generator[str, None, None]:
+    async def aclose(self) -> None:
         """
-        Stream chat response from VOX LLM.
+        Close the underlying pool (only needed when this client owns it).
         """
+        await self.pool.aclose()
 
-        access_token = token_generation()  # Generate access token using your existing logic.
-
-        headers = {
-            "Authorization": f"Bearer {access_token}",  # Use Bearer token auth.
-            "Content-Type": "application/json"
-        }
+    async def stream_chat(self, messages: list) -> AsyncGenerator[str, None]:
+        """
+        Stream chat response from VOX LLM.
+        """
 
         payload = {
-            "engine": "gpt-4o-mini",  # You already use this.
+            "engine": self.engine,
             "messages": messages,
-            "temperature": 0.3,
+            "temperature": self.temperature,
             "stream": True  # IMPORTANT: enable streaming.
         }
 
-        with requests.post(self.url, headers=headers, json=payload, stream=True) as response:
-            for line in response.iter_lines():
-                if line:
-                    decoded = line.decode("utf-8")
-
-                    if decoded.startswith("data:"):
-                        data = decoded.replace("data:", "").strip()
+        for attempt in range(2):  # One retry if the cached token was rejected.
+            access_token = await self.tokens.get()  # Cached; refreshed once for all concurrent callers.
 
-                        if data == "[DONE]":
-                            break
+            headers = {
+                "Authorization": f"Bearer {access_token}",  # Use Bearer token auth.
+                "Content-Type": "application/json"
+            }
 
+            with LLMCall("vox") as call:  # Connect time, time to first token, tokens/sec, errors.
+                async with self.pool.stream("POST", self.url, headers=headers, json=payload) as response:
+                    if response.status_code == 401 and attempt == 0:
+                        call.error("http")  # Rejected attempt: an upstream error, not a connect sample.
+                        await response.aread()  # Drain so the connection can be reused.
+                        self.tokens.invalidate(access_token)  # Revoked/expired early: force a refresh.
+                        continue
+                    call.connected()
+                    response.raise_for_status()
+                    async for data in iter_sse_data(response):  # `data:` payloads, stops at [DONE].
                         try:
                             json_data = json.loads(data)
                             delta = json_data.get("choices", [{}])[0].get("delta", {}).get("content", "")
-                            if delta:
-                                yield delta
                         except Exception:
                             continue
+                        if delta:
+                            call.delta()
+                            yield delta
+                    return
+
+    async def generate_stream(self, user_text: str) -> AsyncGenerator[str, None]:
+        """
+        Same interface as llm_client.LLMClient, so the SSE route can use either client.
+        """
+        async for delta in self.stream_chat([{"role": "user", "content": user_text}]):
+            yield delta
@@ -94,6 +94,14 @@ export type ChatSummary = { // Type for chat list items.
   id: string; // Unique chat id.
   title: string; // Chat title shown in sidebar.
   updatedAt: string; // ISO timestamp for sorting/display.
+  snippets?: SearchSnippet[]; // Matching message excerpts (only in search results).
+};
+
+// Define a matching message excerpt returned by search.
+export type SearchSnippet = { // Type for search hits inside a chat.
+  messageId: string; // Message that matched.
+  role: ChatRole; // Who wrote it.
+  text: string; // Short excerpt around the match.
 };
 
 // Define the message type shown in the thread.
@@ -102,6 +110,14 @@ export type ChatMessage = { // Type for messages inside a chat.
   role: ChatRole; // Who wrote the message.
   content: string; // Message text.
   createdAt: string; // ISO timestamp for ordering.
+  status?: "streaming" | "error"; // Set while a reply is still being generated (or if it failed).
+  version?: number; // Store version of the last write to this message.
+};
+
+// One page of a paginated list endpoint.
+export type Page<T> = { // Type for paged responses.
+  items: T[]; // Items in this page.
+  nextCursor: string | null; // Cursor for the next page (null when there is none).
 };
 
 src/api/client.ts
@@ -120,9 +136,25 @@ export async function apiFetch<T>( // Generic function returning a typed respons
   return (await res.json()) as T; // Parse JSON response.
 }
 
+// Same as apiFetch, but also returns the X-Next-Cursor header used by paginated endpoints.
+export async function apiFetchPage<T>( // Generic function returning a typed page.
+  input: RequestInfo | URL, // URL or Request object.
+  init?: RequestInit // Optional fetch config.
+): Promise<{ items: T[]; nextCursor: string | null }> { // Promise of typed page.
+  const res = await fetch(input, init); // Make the HTTP request.
+
+  if (!res.ok) { // If response is not 2xx.
+    const text = await res.text().catch(() => ""); // Try reading error body safely.
+    throw new Error(text || `Request failed: ${res.status}`); // Throw an error for UI to show.
+  }
+
+  const items = (await res.json()) as T[]; // Body is still a plain array.
+  return { items, nextCursor: res.headers.get("X-Next-Cursor") }; // Cursor travels in a header.
+}
+
 src/api/chatsApi.ts
-import { apiFetch } from "./client"; // Import shared fetch wrapper.
-import type { ChatMessage, ChatSummary } from "../types/chat"; // Import types for compile-time safety.
+import { apiFetch, apiFetchPage } from "./client"; // Import shared fetch wrappers.
+import type { ChatMessage, ChatSummary, Page } from "../types/chat"; // Import types for compile-time safety.
 
 // Read backend base URL from Vite env; fallback to localhost for dev.
 const API_BASE = import.meta.env.VITE_API_BASE_URL || "http://localhost:8000"; // Safe default.
@@ -132,10 +164,15 @@ function url(path: string) { // Helper to avoid repeating base URL joins.
   return `${API_BASE}${path}`; // Return concatenated URL.
 }
 
-// GET /api/chats?search=
-export function listChats(search: string): Promise<ChatSummary[]> { // Fetch chat sidebar list.
-  const q = search ? `?search=${encodeURIComponent(search)}` : ""; // Build query string safely.
-  return apiFetch<ChatSummary[]>(url(`/api/chats${q}`)); // Call API and return parsed JSON.
+// Page size for sidebar chats and thread messages.
+export const PAGE_SIZE = 50; // Keep payloads small for long histories.
+
+// GET /api/chats?search=&limit=&cursor=
+export function listChats(search: string, cursor?: string | null): Promise<Page<ChatSummary>> { // Fetch one sidebar page.
+  const q = new URLSearchParams({ limit: String(PAGE_SIZE) }); // Always page.
+  if (search) q.set("search", search); // Optional search.
+  if (cursor) q.set("cursor", cursor); // Continue after the previous page.
+  return apiFetchPage<ChatSummary>(url(`/api/chats?${q}`), { cache: "no-cache" }); // Revalidate via ETag (304 reuses the cached body).
 }
 
 // POST /api/chats
@@ -163,48 +200,63 @@ export function deleteChat(chatId: string): Promise<void> { // Delete a chat.
   });
 }
 
-// GET /api/chats/:id/messages
-export function listMessages(chatId: string): Promise<ChatMessage[]> { // Get a chat thread.
-  return apiFetch<ChatMessage[]>(url(`/api/chats/${chatId}/messages`)); // Call messages endpoint.
+// GET /api/chats/:id/messages?limit=&before=
+export function listMessages(chatId: string, before?: string | null): Promise<Page<ChatMessage>> { // Get newest (or older) messages.
+  const q = new URLSearchParams({ limit: String(PAGE_SIZE) }); // Always page.
+  if (before) q.set("before", before); // Load messages older than this id.
+  return apiFetchPage<ChatMessage>(url(`/api/chats/${chatId}/messages?${q}`), { cache: "no-cache" }); // Revalidate via ETag.
 }
 
-// POST /api/chats/:id/stream (SSE over fetch)
-export async function streamChat( // Stream assistant output as deltas.
-  chatId: string, // Chat id to stream into.
-  message: string, // User message to send.
-  onDelta: (text: string) => void // Callback for each received chunk.
-): Promise<void> { // Resolves when stream ends.
-  const res = await fetch(url(`/api/chats/${chatId}/stream`), { // Call streaming endpoint.
-    method: "POST", // POST for sending user prompt.
-    headers: { "Content-Type": "application/json", Accept: "text/event-stream" }, // Request SSE.
-    body: JSON.stringify({ message }), // Send minimal payload.
-  });
+// GET /api/chats/:id/messages?after= (only messages newer than a known id; newest page if none is known)
+export function listMessagesAfter(chatId: string, after: string | null): Promise<Page<ChatMessage>> { // Delta fetch.
+  const q = new URLSearchParams(after ? { after } : { limit: String(PAGE_SIZE) }); // Delta or first page.
+  return apiFetchPage<ChatMessage>(url(`/api/chats/${chatId}/messages?${q}`), { cache: "no-cache" }); // Call messages endpoint.
+}
 
-  if (!res.ok || !res.body) { // Ensure stream is available.
-    const text = await res.text().catch(() => ""); // Read error if present.
-    throw new Error(text || `Stream failed: ${res.status}`); // Throw for UI.
-  }
+// How many times a dropped stream is resumed before giving up.
+const STREAM_RETRIES = 5; // Backoff: 0.5s, 1s, 2s, 4s, 8s.
+
+// Ids needed to resume a stream after the connection drops.
+type StreamState = { streamId: string | null; lastEventId: string | null }; // Updated while reading.
 
-  const reader = res.body.getReader(); // Read stream chunks.
+// Read SSE frames from one response; "done" when the reply finished, "dropped" if the connection broke.
+async function readStream( // Shared by the first request and every resume.
+  res: Response, // Streaming response.
+  state: StreamState, // Ids for the next resume.
+  onDelta: (text: string) => void, // Callback for each received chunk.
+  onReset: (text: string) => void // Callback when the server resends the full text.
+): Promise<"done" | "dropped"> { // Outcome.
+  const reader = res.body!.getReader(); // Read stream chunks.
   const decoder = new TextDecoder("utf-8"); // Decode bytes to text.
   let buffer = ""; // Buffer partial SSE frames.
 
   while (true) { // Keep reading until server closes.
-    const { value, done } = await reader.read(); // Read next chunk.
-    if (done) break; // Exit if finished.
+    let chunk: ReadableStreamReadResult<Uint8Array>; // Next chunk.
+    try { // Network errors mean "resume", not "fail".
+      chunk = await reader.read(); // Read next chunk.
+    } catch { // Connection dropped.
+      return "dropped"; // Caller reconnects.
+    }
+    if (chunk.done) return "dropped"; // Closed before "done": resume.
 
-    buffer += decoder.decode(value, { stream: true }); // Append decoded chunk.
+    buffer += decoder.decode(chunk.value, { stream: true }); // Append decoded chunk.
 
     const frames = buffer.split("\n\n"); // SSE frames separated by blank line.
     buffer = frames.pop() || ""; // Keep incomplete frame for next iteration.
 
     for (const frame of frames) { // Process each complete frame.
       const lines = frame.split("\n"); // Split into lines.
+      const idLine = lines.find((l) => l.startsWith("id:")); // Find event id.
       const eventLine = lines.find((l) => l.startsWith("event:")); // Find event type.
       const dataLine = lines.find((l) => l.startsWith("data:")); // Find data payload line.
 
       const event = eventLine ? eventLine.replace("event:", "").trim() : "message"; // Default event.
       const data = dataLine ? dataLine.replace("data:", "").trim() : ""; // Extract data.
+      if (idLine) state.lastEventId = idLine.replace("id:", "").trim(); // Remember position for Last-Event-ID.
+
+      if (event === "stream") { // Stream ids (first event).
+        state.streamId = (JSON.parse(data) as { streamId: string }).streamId; // Needed to resume.
+      }
 
       if (event === "delta") { // If server sent incremental content.
         try { // Try parsing JSON.
@@ -215,8 +267,12 @@ export async function streamChat( // Stream assistant output as deltas.
         }
       }
 
+      if (event === "reset") { // Missed events were no longer buffered.
+        onReset((JSON.parse(data) as { text: string }).text); // Replace partial text.
+      }
+
       if (event === "done") { // If server completed response.
-        return; // End stream.
+        return "done"; // End stream.
       }
 
       if (event === "error") { // If server signaled an error.
@@ -226,10 +282,46 @@ export async function streamChat( // Stream assistant output as deltas.
   }
 }
 
+// POST /api/chats/:id/stream (SSE over fetch), resumed via GET /api/streams/:id if the connection drops
+export async function streamChat( // Stream assistant output as deltas.
+  chatId: string, // Chat id to stream into.
+  message: string, // User message to send.
+  onDelta: (text: string) => void, // Callback for each received chunk.
+  onReset: (text: string) => void = () => {} // Callback when the full text is resent after a long gap.
+): Promise<void> { // Resolves when stream ends.
+  const res = await fetch(url(`/api/chats/${chatId}/stream`), { // Call streaming endpoint.
+    method: "POST", // POST for sending user prompt.
+    headers: { "Content-Type": "application/json", Accept: "text/event-stream" }, // Request SSE.
+    body: JSON.stringify({ message }), // Send minimal payload.
+  });
+
+  if (res.status === 429) { // Server is at its concurrent-stream limit.
+    throw new Error(`Server busy, try again in ${res.headers.get("Retry-After") || "a few"} seconds`); // Friendly message.
+  }
+
+  if (!res.ok || !res.body) { // Ensure stream is available.
+    const text = await res.text().catch(() => ""); // Read error if present.
+    throw new Error(text || `Stream failed: ${res.status}`); // Throw for UI.
+  }
+
+  const state: StreamState = { streamId: res.headers.get("X-Stream-Id"), lastEventId: null }; // Resume info.
+  let outcome = await readStream(res, state, onDelta, onReset); // Read until done or dropped.
+
+  for (let attempt = 0; outcome === "dropped"; attempt++) { // Reconnect; the server kept generating meanwhile.
+    if (!state.streamId || attempt >= STREAM_RETRIES) throw new Error("Stream interrupted"); // Give up.
+    await new Promise((r) => setTimeout(r, 500 * 2 ** attempt)); // Back off.
+    const headers: Record<string, string> = { Accept: "text/event-stream" }; // Request SSE.
+    if (state.lastEventId) headers["Last-Event-ID"] = state.lastEventId; // Replay only what we missed.
+    const resumed = await fetch(url(`/api/streams/${state.streamId}`), { headers }).catch(() => null); // Reconnect.
+    if (resumed?.status === 404) throw new Error("Stream expired; reload the chat"); // Saved message has the text.
+    outcome = resumed?.ok && resumed.body ? await readStream(resumed, state, onDelta, onReset) : "dropped"; // Continue.
+  }
+}
+
 src/pages/ChatPage.tsx (ChatGPT-like UI)
 import React, { useEffect, useMemo, useRef, useState } from "react"; // Import React + hooks.
 import type { ChatMessage, ChatSummary } from "../types/chat"; // Import types.
-import { createChat, deleteChat, listChats, listMessages, renameChat, streamChat } from "../api/chatsApi"; // Import APIs.
+import { createChat, deleteChat, listChats, listMessages, listMessagesAfter, renameChat, streamChat } from "../api/chatsApi"; // Import APIs.
 
 // Typing indicator component (3 bouncing dots).
 function TypingDots() { // Local component for streaming placeholder.
@@ -255,6 +347,8 @@ export default function ChatPage() { // Export default for router.
   const [isLoadingThread, setIsLoadingThread] = useState<boolean>(false); // Thread loading.
   const [threadError, setThreadError] = useState<string | null>(null); // Thread error.
   const [isStreaming, setIsStreaming] = useState<boolean>(false); // Streaming state.
+  const [chatsCursor, setChatsCursor] = useState<string | null>(null); // Cursor for the next sidebar page.
+  const [messagesCursor, setMessagesCursor] = useState<string | null>(null); // Cursor for older messages.
 
   const bottomRef = useRef<HTMLDivElement | null>(null); // Ref for auto-scroll.
   const hasAnyMessage = messages.length > 0; // Used for composer positioning.
@@ -264,8 +358,8 @@ export default function ChatPage() { // Export default for router.
     const t = setTimeout(() => { // Debounce to reduce API calls.
       setIsLoadingChats(true); // Start loading indicator.
       setChatsError(null); // Clear any previous error.
-      listChats(chatSearch) // Call backend list endpoint.
-        .then((data) => setChats(data)) // Store result.
+      listChats(chatSearch) // Call backend list endpoint (first page).
+        .then((page) => { setChats(page.items); setChatsCursor(page.nextCursor); }) // Store result + cursor.
         .catch((e: Error) => setChatsError(e.message)) // Store error.
         .finally(() => setIsLoadingChats(false)); // Stop loading indicator.
     }, 250); // 250ms debounce.
@@ -277,13 +371,14 @@ export default function ChatPage() { // Export default for router.
   useEffect(() => { // Side effect for loading thread messages.
     if (!activeChatId) { // If no chat selected.
       setMessages([]); // Clear thread.
+      setMessagesCursor(null); // Nothing older to load.
       return; // Exit effect.
     }
 
     setIsLoadingThread(true); // Start loading.
     setThreadError(null); // Clear error.
-    listMessages(activeChatId) // Fetch messages.
-      .then((data) => setMessages(data)) // Store messages.
+    listMessages(activeChatId) // Fetch newest page of messages.
+      .then((page) => { setMessages(page.items); setMessagesCursor(page.nextCursor); }) // Store messages + cursor.
       .catch((e: Error) => setThreadError(e.message)) // Store error message.
       .finally(() => setIsLoadingThread(false)); // Stop loading.
   }, [activeChatId]); // Trigger on chat change.
@@ -298,6 +393,30 @@ export default function ChatPage() { // Export default for router.
     return chats.find((c) => c.id === activeChatId) || null; // Return matching chat or null.
   }, [chats, activeChatId]); // Dependencies.
 
+  // Append the next sidebar page.
+  async function handleLoadMoreChats() { // Sidebar pagination handler.
+    if (!chatsCursor) return; // Nothing more.
+    try { // Catch errors.
+      const page = await listChats(chatSearch, chatsCursor); // Fetch next page.
+      setChats((prev) => [...prev, ...page.items]); // Append to list.
+      setChatsCursor(page.nextCursor); // Advance cursor.
+    } catch (e) { // Handle error.
+      setChatsError((e as Error).message); // Show error.
+    }
+  }
+
+  // Prepend older messages to the thread.
+  async function handleLoadOlderMessages() { // Thread pagination handler.
+    if (!activeChatId || !messagesCursor) return; // Nothing more.
+    try { // Catch errors.
+      const page = await listMessages(activeChatId, messagesCursor); // Fetch older page.
+      setMessages((prev) => [...page.items, ...prev]); // Prepend.
+      setMessagesCursor(page.nextCursor); // Advance cursor.
+    } catch (e) { // Handle error.
+      setThreadError((e as Error).message); // Show error.
+    }
+  }
+
   // Create new chat.
   async function handleNewChat() { // New chat handler.
     try { // Catch errors.
@@ -348,6 +467,7 @@ export default function ChatPage() { // Export default for router.
       setThreadError(null); // Clear thread error.
 
       let chatId = activeChatId; // Use existing chat if selected.
+      const lastSaved = chatId ? [...messages].reverse().find((m) => !m.id.startsWith("local-"))?.id ?? null : null; // Newest server message.
       if (!chatId) { // If no chat selected yet.
         const created = await createChat(trimmed.slice(0, 40) || "New chat"); // Create chat with short title.
         setChats((prev) => [created, ...prev]); // Add to sidebar.
@@ -374,16 +494,24 @@ export default function ChatPage() { // Export default for router.
       setInput(""); // Clear textarea.
       setIsStreaming(true); // Enable streaming UI.
 
-      await streamChat(chatId, trimmed, (delta) => { // Start SSE streaming.
+      const updateAssistant = (edit: (content: string) => string) => // Update the placeholder's text.
         setMessages((prev) => { // Functional update for correctness.
           const next = [...prev]; // Copy array.
           const idx = next.findIndex((m) => m.id === assistantMsg.id); // Find assistant placeholder.
           if (idx === -1) return prev; // If missing, keep previous.
-          next[idx] = { ...next[idx], content: next[idx].content + delta }; // Append delta.
+          next[idx] = { ...next[idx], content: edit(next[idx].content) }; // Apply edit.
           return next; // Return updated state.
         });
-      });
 
+      await streamChat( // Start SSE streaming (reconnects on its own if the connection drops).
+        chatId, // Target chat.
+        trimmed, // User message.
+        (delta) => updateAssistant((content) => content + delta), // Append delta.
+        (text) => updateAssistant(() => text) // Server resent the full text after a long gap.
+      );
+
+      const saved = await listMessagesAfter(chatId, lastSaved); // Server copies of this turn (real ids), not the whole thread.
+      setMessages((prev) => [...prev.filter((m) => m.id !== userMsg.id && m.id !== assistantMsg.id), ...saved.items]); // Swap out the placeholders.
       setIsStreaming(false); // Streaming done.
     } catch (e) { // Handle error.
       setIsStreaming(false); // Ensure streaming state resets.
@@ -442,6 +570,9 @@ export default function ChatPage() { // Export default for router.
                 <button onClick={() => setActiveChatId(c.id)} className="flex-1 text-left"> {/* Select chat */}
                   <div className="truncate text-sm font-medium">{c.title}</div> {/* Title */}
                   <div className="text-xs text-gray-500">{new Date(c.updatedAt).toLocaleString()}</div> {/* Date */}
+                  {c.snippets?.map((sn) => ( // Matching message excerpts (search only).
+                    <div key={sn.messageId} className="mt-1 line-clamp-2 text-xs text-gray-600">{sn.text}</div> // Snippet.
+                  ))}
                 </button>
 
                 <div className="ml-2 hidden items-center gap-2 group-hover:flex"> {/* Hover actions */}
@@ -450,6 +581,9 @@ export default function ChatPage() { // Export default for router.
                 </div>
               </div>
             ))}
+            {chatsCursor && ( // More chats on the server.
+              <button onClick={() => void handleLoadMoreChats()} className="w-full px-4 py-3 text-sm text-gray-600 underline">Load more</button> // Next page.
+            )}
           </div>
         </aside>
 
@@ -479,6 +613,9 @@ export default function ChatPage() { // Export default for router.
             )}
 
             <div className="mx-auto flex max-w-3xl flex-col gap-4"> {/* Thread width */}
+              {messagesCursor && ( // Older messages on the server.
+                <button onClick={() => void handleLoadOlderMessages()} className="self-center text-xs text-gray-600 underline">Load earlier messages</button> // Previous page.
+              )}
               {messages.map((m) => ( // Render each message.
                 <div key={m.id} className={`flex ${m.role === "user" ? "justify-end" : "justify-start"}`}> {/* Align */}
                   <div